@@ -1,47 +1,62 @@
-from flask import Flask, send_from_directory, jsonify, request
+"""
+应用入口 - create_app(config) 应用工厂
+
+导入本模块不会创建应用；create_app 依次完成：加载 .env、选择配置类 (config.py)、日志、CORS、JWT、
+数据库、响应缓存、密码哈希、图片处理、预扣清扫、静态文件发送、命令行命令与蓝图注册。
+
+- 开发：flask --app app run（Flask 命令行会自动调用 create_app），或 python app.py
+- 生产：gunicorn -c gunicorn.conf.py wsgi:app（见 wsgi.py、gunicorn.conf.py），
+  多 worker 共用 JWT_SECRET_KEY，由 ProductionConfig 强制要求
+- LAZY_BLUEPRINTS=True 时蓝图推迟到第一个请求前导入注册，见 register_blueprints
+
+兼容旧脚本：from app import app 会在首次访问时按 APP_CONFIG 创建一个全局应用。
+"""
+
+import importlib
 import os
-from werkzeug.utils import secure_filename
-import json
-from urllib.parse import urljoin
-from unicodedata import normalize
-import re
-# 加载.env文件中的环境变量
+import secrets
+import threading
+
 from dotenv import load_dotenv
-load_dotenv()  # 从.env文件加载环境变量
-# 从 models 导入 db 和 migrate 实例
-from models import db, migrate, User # <-- 导入 User 模型
-# 导入 JWT 扩展
+from flask import Flask, jsonify, current_app
+from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-import secrets # 用于生成安全的密钥
-from flask_cors import CORS # 导入 CORS
-import sys # 导入 sys 用于打印到 stderr
-from datetime import timedelta
-
-# 创建 Flask 应用实例
-app = Flask(__name__, static_folder='../', static_url_path='')
-
-# --- 配置 CORS ---
-# 最简单的配置：允许所有来源访问所有路由
-# 在生产中应指定具体的 origins
-CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": "*"}}) # 应用 CORS 配置，允许 /api/* 下的所有路由跨域，并允许携带凭证
-# --- CORS 配置结束 ---
-
-# --- JWT 配置 ---
-# 从环境变量或默认生成密钥
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", secrets.token_hex(32))
-# 可以设置令牌过期时间（例如：15分钟）
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=24)
-jwt = JWTManager(app)
-
-# --- 开始: 添加 JWT 错误处理回调 ---
-@jwt.expired_token_loader
+
+import config as app_config
+from app_logging import configure_logging, get_logger, restart_logging_after_fork
+from db_engine import init_sqlite_tuning, database_url, engine_options
+from image_pipeline import init_image_pipeline, process_product_images_command
+from models import db, migrate
+from password_hashing import init_password_hashing
+from response_cache import init_response_cache, cache_stats
+from static_files import init_static_files, send_from
+from stock_ledger import snapshot_stock_command
+from stock_reservations import start_reservation_sweeper, sweep_reservations_command, sweep_stats
+from stock_shards import rebalance_stock_shards_command
+from utils.auth import admin_required, is_token_revoked
+
+log = get_logger('auth')
+
+# (模块, 蓝图变量名)，按注册顺序
+BLUEPRINTS = (
+    ('auth_routes', 'auth_bp'),                    # 认证
+    ('news_routes', 'news_bp'),                    # 资讯
+    ('user_routes', 'user_bp'),                    # 用户管理
+    ('product_routes', 'product_bp'),              # 产品管理
+    ('stock_routes', 'stock_bp'),                  # 库存日志与批量库存
+    ('settings_routes', 'settings_bp'),            # 网站设置
+    ('collaboration_routes', 'collaboration_bp'),  # 品牌联名合作
+)
+
+
+# --- JWT 错误处理回调 ---
+
 def expired_token_callback(jwt_header, jwt_payload):
-    print("[JWT ERROR] Expired token received.", file=sys.stderr)
+    log.info("jwt expired")
     return jsonify(error="令牌已过期"), 401 # 返回 401 更符合标准
 
-@jwt.invalid_token_loader
 def invalid_token_callback(error_string):
-    print(f"[JWT ERROR] Invalid token received: {error_string}", file=sys.stderr)
+    log.warning("jwt invalid", extra={'reason': error_string})
     # 根据错误类型细化处理
     if "Signature verification failed" in error_string:
         return jsonify(error="令牌签名无效"), 422 # 保持 422 如果你想明确区分
@@ -50,105 +65,182 @@ def invalid_token_callback(error_string):
     else:
         return jsonify(error=f"无效令牌: {error_string}"), 422 # 默认返回 422
 
-@jwt.unauthorized_loader
 def missing_token_callback(error_string):
-    print(f"[JWT ERROR] Missing token: {error_string}", file=sys.stderr)
+    log.info("jwt missing", extra={'reason': error_string})
     return jsonify(error="请求缺少认证令牌"), 401
 
-@jwt.needs_fresh_token_loader
 def token_not_fresh_callback(jwt_header, jwt_payload):
-    print("[JWT ERROR] Fresh token required.", file=sys.stderr)
+    log.info("jwt not fresh")
     return jsonify(error="需要刷新令牌"), 401
 
-@jwt.revoked_token_loader
 def revoked_token_callback(jwt_header, jwt_payload):
-    print("[JWT ERROR] Token has been revoked.", file=sys.stderr)
+    log.warning("jwt revoked")
     return jsonify(error="令牌已被撤销"), 401
 
-@jwt.user_lookup_loader
-def user_lookup_callback(_jwt_header, jwt_data):
-    # 这个回调在 get_current_user() 时被调用，不是 @jwt_required 强制的
-    # 但如果配置了 JWT_USER_LOOKUP_CALLBACK，它需要能正确找到用户
-    identity = jwt_data["sub"]
-    user = User.query.get(identity)
-    print(f"[JWT USER LOOKUP] Looking up user for identity {identity}, found: {user}", file=sys.stderr)
-    return user # 如果找不到用户，返回 None
-
-@jwt.user_lookup_error_loader
-def user_lookup_error_callback(_jwt_header, jwt_data):
-    # 当 user_lookup_callback 返回 None 时触发
-    identity = jwt_data.get("sub")
-    print(f"[JWT USER LOOKUP ERROR] User identity {identity} not found.", file=sys.stderr)
-    return jsonify(error=f"未找到与令牌关联的用户 {identity}"), 404
-
-# --- 结束: 添加 JWT 错误处理回调 ---
-
-# --- 数据库配置 ---
-basedir = os.path.abspath(os.path.dirname(__file__))
-# 设置数据库 URI，这里使用 SQLite
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'app.db')
-# 关闭 SQLAlchemy 的事件通知系统，如果不使用可以节省资源
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# 初始化 SQLAlchemy 和 Migrate，关联 app
-db.init_app(app)
-migrate.init_app(app, db)
-# --- 数据库配置结束 ---
-
-# --- 文件上传配置 ---
-BASE_DIR = os.path.abspath(app.static_folder)  # 项目根目录
-UPLOADS_DIR = os.path.join(BASE_DIR, 'uploads') # 通用上传目录
-PRODUCT_IMG_DIR = os.path.join(UPLOADS_DIR, 'products') # 产品图片目录
-SETTINGS_UPLOAD_DIR = os.path.join(UPLOADS_DIR, 'settings') # 设置相关上传目录
-app.config['PRODUCT_IMG_DIR'] = PRODUCT_IMG_DIR
-app.config['SETTINGS_UPLOAD_DIR'] = SETTINGS_UPLOAD_DIR
-
-# 确保上传目录存在
-os.makedirs(UPLOADS_DIR, exist_ok=True)
-os.makedirs(PRODUCT_IMG_DIR, exist_ok=True)
-os.makedirs(SETTINGS_UPLOAD_DIR, exist_ok=True)
-# --- 文件上传配置结束 ---
-
-# --- 注册蓝图 ---
-# 导入认证蓝图
-from auth_routes import auth_bp
-app.register_blueprint(auth_bp)
-# 导入资讯蓝图
-from news_routes import news_bp
-app.register_blueprint(news_bp)
-# 导入用户管理蓝图
-from user_routes import user_bp
-app.register_blueprint(user_bp)
-# 导入产品管理蓝图 (使用新的数据库驱动逻辑)
-from product_routes import product_bp
-app.register_blueprint(product_bp)
-# 导入网站设置蓝图
-from settings_routes import settings_bp
-app.register_blueprint(settings_bp)
-# 注册品牌联名合作蓝图
-from collaboration_routes import collaboration_bp
-app.register_blueprint(collaboration_bp)
-# --- 蓝图注册结束 ---
-
-@app.route('/')
+
+def _init_jwt(app):
+    if not app.config.get('JWT_SECRET_KEY'):
+        if app.config['REQUIRE_JWT_SECRET']:
+            raise RuntimeError("未设置 JWT_SECRET_KEY：所有进程必须使用同一个签名密钥，请通过环境变量或 .env 提供")
+        # 仅限单进程开发服务器：重启后已签发的令牌全部失效
+        app.config['JWT_SECRET_KEY'] = secrets.token_hex(32)
+        log.warning("JWT_SECRET_KEY not set, using a random per-process key")
+
+    jwt = JWTManager(app)
+    jwt.expired_token_loader(expired_token_callback)
+    jwt.invalid_token_loader(invalid_token_callback)
+    jwt.unauthorized_loader(missing_token_callback)
+    jwt.needs_fresh_token_loader(token_not_fresh_callback)
+    jwt.revoked_token_loader(revoked_token_callback)
+    # 令牌中的 tv (令牌版本) 与用户当前版本不一致时视为已撤销（管理员状态变更后旧令牌失效）
+    jwt.token_in_blocklist_loader(is_token_revoked)
+    # 不注册 user_lookup_loader：注册后 flask_jwt_extended 在每个需要认证的请求上都会查询 user 表，
+    # 而代码中没有使用 current_user；身份与权限由令牌声明和 utils.auth 的缓存校验
+    return jwt
+
+
+# --- 应用级路由 ---
+
+# 响应缓存命中统计 (管理员)
+@admin_required
+def response_cache_stats():
+    return jsonify(cache_stats())
+
+# 预扣超时清扫指标 (管理员)
+@admin_required
+def reservation_sweep_stats():
+    return jsonify(sweep_stats())
+
 def index():
-    """
-    定义根路由，用于提供 index.html 文件。
-    它会从项目根目录（即 backend 目录的上一级）查找 index.html。
-    """
-    # 使用 send_from_directory 从项目根目录提供 index.html
-    # os.path.abspath(os.path.join(app.static_folder)) 获取项目根目录的绝对路径
-    return send_from_directory(os.path.abspath(app.static_folder), 'index.html')
+    """提供项目根目录（backend 的上一级）下的 index.html"""
+    return send_from(current_app.static_folder, 'index.html', 'static', precompressed=True)
 
-# 提供上传文件访问的路由 (通用)
-@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """提供上传文件的访问"""
+    """提供上传文件的访问；内容哈希文件名按 immutable 长期缓存（见 static_files.py）"""
     # 为安全起见，可以限制只访问特定子目录，但目前 UPLOADS_DIR 下都是允许公开访问的
-    return send_from_directory(UPLOADS_DIR, filename)
+    return send_from(current_app.config['UPLOADS_DIR'], filename, 'uploads')
+
+
+def register_blueprints(app):
+    """导入并注册全部蓝图；重复调用时直接返回"""
+    if app.extensions.get('blueprints_registered'):
+        return
+    for module_name, attr in BLUEPRINTS:
+        app.register_blueprint(getattr(importlib.import_module(module_name), attr))
+    app.extensions['blueprints_registered'] = True
+
+
+class _LazyBlueprints:
+    """包装 app.wsgi_app：第一个请求进入 Flask 之前导入并注册蓝图（Flask 不允许处理请求后再注册）"""
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if not self.app.extensions.get('blueprints_registered'):
+            with self._lock:
+                register_blueprints(self.app)
+        return self.wsgi_app(environ, start_response)
+
+
+def create_app(config=None):
+    """创建应用；config 为配置类、配置名称 (production / development / testing) 或 None（取 APP_CONFIG）"""
+    # 加载 .env 中的环境变量（不覆盖已设置的变量）
+    load_dotenv()
+    config_class = config if isinstance(config, type) else app_config.get_config(config)
+
+    # 静态文件目录为项目根目录，提供 index.html 与前端资源
+    app = Flask(__name__, static_folder='../', static_url_path='')
+    app.config.from_object(config_class)
+    app_config.apply_env_overrides(app.config)
+
+    # 非阻塞队列日志，默认 INFO 级别；通过 LOG_LEVEL / LOG_DEBUG_SAMPLE_RATE / LOG_FORMAT 调整
+    configure_logging(app)
+
+    # 允许 /api/* 下的所有路由跨域，并允许携带凭证；在生产中应指定具体的 origins
+    CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": "*"}})
+
+    _init_jwt(app)
+
+    # --- 数据库配置 ---
+    if not app.config.get('SQLALCHEMY_DATABASE_URI'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_url(
+            'sqlite:///' + os.path.join(app_config.BACKEND_DIR, 'app.db'))
+    # 连接池大小、pre_ping、回收时间等（见 db_engine.py）
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    db.init_app(app)
+    migrate.init_app(app, db)
+    # SQLite 连接建立时设置 WAL、busy_timeout 等 PRAGMA（见 db_engine.py）
+    init_sqlite_tuning(app, db)
+
+    init_response_cache(app)
+    # 登录/注册的密码哈希在有界进程池中计算，PASSWORD_HASH_WORKERS=0 时同步计算
+    init_password_hashing(app)
+
+    # 上传图片的缩略图在后台线程池中生成，IMAGE_WORKERS=0 时同步生成；
+    # 补处理已有图片：flask --app app process-product-images
+    init_image_pipeline(app)
+    app.cli.add_command(process_product_images_command)
+
+    # 预扣超时清扫：RESERVATION_SWEEP_INTERVAL (秒) 大于 0 时在进程内启动清扫线程（gunicorn 下始终为 0）；
+    # 生产环境单独运行 flask --app app sweep-reservations --loop
+    app.cli.add_command(sweep_reservations_command)
+    start_reservation_sweeper(app)
+    # 分片库存再平衡：flask --app app rebalance-stock-shards --loop（见 stock_shards.py）
+    app.cli.add_command(rebalance_stock_shards_command)
+    # 库存快照：flask --app app snapshot-stock --loop --interval 3600（见 stock_ledger.py）
+    app.cli.add_command(snapshot_stock_command)
+
+    # 静态文件与上传文件：缓存头、预压缩副本、X-Accel-Redirect / X-Sendfile（见 static_files.py）
+    init_static_files(app)
+
+    app.add_url_rule('/api/cache/stats', view_func=response_cache_stats)
+    app.add_url_rule('/api/reservations/sweep-stats', view_func=reservation_sweep_stats)
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/uploads/<path:filename>', view_func=uploaded_file)
+
+    if app.config['LAZY_BLUEPRINTS']:
+        app.wsgi_app = _LazyBlueprints(app)
+    else:
+        register_blueprints(app)
+    return app
+
+
+def reinit_after_fork(app):
+    """在 fork 出的 worker 进程中重建不能跨进程共享的资源（gunicorn post_fork 调用，见 gunicorn.conf.py）
+
+    - 数据库连接池：父进程（preload 时的 master）打开的连接不能在多个进程间共用，
+      dispose(close=False) 只丢弃子进程中的引用，不关闭父进程仍在使用的连接
+    - 日志：重建写日志线程（见 app_logging.restart_logging_after_fork）
+    密码哈希进程池按 pid 在首次使用时创建，无需处理；gunicorn 下不启动预扣清扫线程（见 gunicorn.conf.py），
+    由独立的 sweep-reservations 进程清扫
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    restart_logging_after_fork()
+
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """兼容 from app import app：首次访问时按 APP_CONFIG（默认 production）创建全局应用
+
+    维护脚本在导入前把 APP_CONFIG 默认设为 development（见 config.py）
+    """
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
 
 if __name__ == '__main__':
-    # 启动 Flask 开发服务器
-    # host='0.0.0.0' 使服务器可以从本地网络访问
-    # debug=True 开启调试模式，方便开发
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    # 启动 Flask 开发服务器：host='0.0.0.0' 使服务器可以从本地网络访问，debug 模式方便开发
+    create_app(os.getenv('APP_CONFIG') or 'development').run(host='0.0.0.0', port=5000, debug=True)
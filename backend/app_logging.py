@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志模块 - 分级、采样、结构化的非阻塞日志
+
+- 业务代码只把日志记录放进内存队列 (QueueHandler)，由后台线程 (QueueListener) 写 stderr，
+  请求线程不再因同步写 stderr 争用锁
+- 默认级别 INFO，DEBUG 日志关闭；级别为 INFO 时 logger.debug(...) 几乎没有开销
+- 高频 DEBUG 事件按 LOG_DEBUG_SAMPLE_RATE 采样（例如 0.1 表示同一事件每 10 条保留 1 条）
+- 输出为单行 JSON，通过 extra={...} 传入的字段会作为独立键输出
+
+环境变量 / app.config：LOG_LEVEL、LOG_DEBUG_SAMPLE_RATE、LOG_FORMAT (json | text)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOGGER_NAMESPACE = 'ysj'
+
+# LogRecord 自带的属性，其余属性视为 extra 结构化字段
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_queue_handler = None
+_listener_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 格式"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """对 DEBUG 记录按事件 (logger + 消息模板) 计数采样，INFO 及以上全部保留"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.every == 0:
+            return False
+        if self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every == 0:
+            record.sampled_every = self.every
+            return True
+        return False
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录，而不是阻塞请求线程"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _setting(app, key, default):
+    if app is not None and key in app.config:
+        return app.config[key]
+    return os.getenv(key, default)
+
+
+def configure_logging(app=None):
+    """安装队列日志处理器；可重复调用，只有第一次生效"""
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        level = logging.getLevelName(str(_setting(app, 'LOG_LEVEL', 'INFO')).upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+        sample_rate = float(_setting(app, 'LOG_DEBUG_SAMPLE_RATE', 1.0))
+        fmt = str(_setting(app, 'LOG_FORMAT', 'json')).lower()
+
+        stream_handler = logging.StreamHandler(sys.stderr)
+        if fmt == 'text':
+            stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+        else:
+            stream_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(maxsize=10000)
+        queue_handler = _NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+        root = logging.getLogger()
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+        _queue_handler = queue_handler
+
+        if app is not None:
+            # Flask 默认会给 app.logger 挂一个同步的 stderr 处理器，改为走根日志器的队列
+            from flask.logging import default_handler
+            app.logger.removeHandler(default_handler)
+            app.logger.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """停止后台写日志线程，并写完队列中剩余的记录"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def restart_logging_after_fork():
+    """在 fork 出的子进程中重建日志队列与写日志线程
+
+    线程不会随 fork 复制到子进程，父进程的写日志线程在子进程中不存在，不重建时子进程的日志只会堆满队列后被丢弃；
+    fork 时父进程可能正持有队列的锁，因此子进程换用新的队列，而不是复用原队列
+    """
+    global _listener, _listener_lock
+    _listener_lock = threading.Lock()
+    if _listener is None:
+        return
+    log_queue = queue.Queue(maxsize=_queue_handler.queue.maxsize)
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def get_logger(name):
+    """获取业务日志器，名称统一挂在 ysj 命名空间下"""
+    return logging.getLogger(f'{LOGGER_NAMESPACE}.{name}')
@@ -1,12 +1,18 @@
 from flask import Blueprint, request, jsonify
 from models import db, User
-from flask_jwt_extended import create_access_token
+from utils.auth import create_user_token
+from password_hashing import PasswordHasherBusy, needs_rehash
 import re # 用于邮箱格式校验
-import sys
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api')
 
+@auth_bp.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    # 密码哈希并发已满（登录/注册高峰），让客户端稍后重试而不是无限排队
+    return jsonify({"error": "服务器繁忙，请稍后重试"}), 503, {"Retry-After": "1"}
+
 def is_valid_email(email):
     """简单的邮箱格式校验"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -17,6 +23,33 @@ def is_valid_phone(phone):
     pattern = r'^1[3-9]\d{9}$'
     return re.match(pattern, phone) is not None
 
+def login_identifier_column(identifier):
+    """根据登录标识的格式判断查询哪一列：手机号、邮箱，否则视为用户名"""
+    if is_valid_phone(identifier):
+        return User.phone
+    if is_valid_email(identifier):
+        return User.email
+    return User.username
+
+# 唯一约束冲突对应的错误提示
+UNIQUE_CONFLICT_MESSAGES = {
+    'username': "用户名已存在",
+    'phone': "手机号已被注册",
+    'email': "邮箱已被注册",
+}
+
+def unique_violation_field(error):
+    """从 IntegrityError 中识别冲突的用户字段
+
+    SQLite: "UNIQUE constraint failed: user.phone"
+    PostgreSQL: 'duplicate key value violates unique constraint "ix_user_phone"'
+    """
+    message = str(error.orig).lower()
+    for field in UNIQUE_CONFLICT_MESSAGES:
+        if f'user.{field}' in message or f'ix_user_{field}' in message or f'user_{field}_key' in message:
+            return field
+    return None
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -40,18 +73,6 @@ def register():
     if email and not is_valid_email(email):
         return jsonify({"error": "无效的邮箱格式"}), 400
 
-    # 验证用户名唯一性
-    if User.query.filter_by(username=username).first():
-        return jsonify({"error": "用户名已存在"}), 409 # 409 Conflict
-
-    # 验证手机号唯一性
-    if User.query.filter_by(phone=phone).first():
-        return jsonify({"error": "手机号已被注册"}), 409 # 409 Conflict
-
-    # 如果提供了邮箱，验证邮箱唯一性
-    if email and User.query.filter_by(email=email).first():
-        return jsonify({"error": "邮箱已被注册"}), 409 # 409 Conflict
-
     # 创建新用户
     new_user = User(username=username, phone=phone, email=email)
     new_user.set_password(password)
@@ -71,16 +92,23 @@ def register():
     # 设置最后登录时间
     new_user.last_login = datetime.utcnow()
     
+    # 不再预先逐个查询用户名/手机号/邮箱是否已存在，直接插入，由唯一索引判定冲突
     db.session.add(new_user)
     try:
         db.session.commit()
         # 生成访问令牌
-        access_token = create_access_token(identity=str(new_user.id))
+        access_token = create_user_token(new_user)
         return jsonify({
             "message": "用户注册成功", 
             "user_id": new_user.id,
             "access_token": access_token
         }), 201 # 201 Created
+    except IntegrityError as e:
+        db.session.rollback()
+        field = unique_violation_field(e)
+        if field is not None:
+            return jsonify({"error": UNIQUE_CONFLICT_MESSAGES[field]}), 409 # 409 Conflict
+        return jsonify({"error": "注册失败: 数据冲突"}), 409
     except Exception as e:
         db.session.rollback()
         # Log the exception e
@@ -99,20 +127,23 @@ def login():
     if not login_identifier or not password:
         return jsonify({"error": "登录标识（用户名/邮箱/手机号）和密码不能为空"}), 400
 
-    # 查找用户（使用用户名、邮箱或手机号）
-    user = User.query.filter(
-        (User.username == login_identifier) | 
-        (User.email == login_identifier) | 
-        (User.phone == login_identifier)
-    ).first()
+    # 按标识类型只查询对应的唯一索引（手机号 / 邮箱 / 用户名）
+    column = login_identifier_column(login_identifier)
+    user = User.query.filter(column == login_identifier).first()
+    if user is None and column is not User.username:
+        # 注册时不限制用户名格式，像手机号/邮箱的用户名（含已有账号）没有匹配时再按用户名查一次
+        user = User.query.filter(User.username == login_identifier).first()
 
     if user and user.check_password(password):
         # 密码正确，更新最后登录时间
         user.last_login = datetime.utcnow()
+        # 已存储的哈希使用旧算法或旧参数时，用本次提交的明文重新计算
+        if needs_rehash(user.password_hash):
+            user.set_password(password)
         db.session.commit()
         
         # 生成 JWT
-        access_token = create_access_token(identity=str(user.id))
+        access_token = create_user_token(user)
         return jsonify(access_token=access_token)
     else:
         # 用户不存在或密码错误
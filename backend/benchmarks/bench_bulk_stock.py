@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量库存接口基准 - POST /api/products/batch-adjust-stock 的耗时与语句数随条目数的变化
+
+对每个 --sizes 中的条目数各建一批带库存的产品，管理员一次提交全部条目（每个商品总库存 +1），
+输出请求耗时、每秒处理的条目数和执行的 SQL 语句数。集合化实现下语句数不随条目数增长，
+耗时大致线性；逐条查询的退化会同时体现为语句数与耗时的暴涨（测试只检查语句数，见 test_stock_routes.py）。
+数据库为临时 SQLite 文件，不触碰 app.db。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_bulk_stock.py --sizes 1000 10000 50000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('JWT_SECRET_KEY', 'bench-secret')
+    from app import create_app
+    from config import ProductionConfig
+
+    app = create_app(ProductionConfig)
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    return app
+
+
+def seed(size):
+    from sqlalchemy import insert
+
+    from models import db, Product, ProductStock
+
+    db.drop_all()
+    db.create_all()
+    now = datetime.utcnow()
+    db.session.execute(insert(Product.__table__), [
+        dict(name=f'基准产品{n}', slug=f'bench-{n}', price=10, created_at=now) for n in range(size)])
+    ids = db.session.execute(db.select(Product.id)).scalars().all()
+    db.session.execute(insert(ProductStock.__table__), [
+        dict(product_id=pid, total_stock=10, available_stock=10, prelock_stock=0) for pid in ids])
+    db.session.commit()
+    return ids
+
+
+def admin_headers():
+    from models import db, User
+    from utils.auth import create_user_token
+
+    user = User(username='bench-admin', phone='13800000000', email='bench@example.com', is_admin=True)
+    user.set_password('bench-password')
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_user_token(user)}'}
+
+
+def run(app, size):
+    from sqlalchemy import event
+
+    from models import db
+
+    with app.app_context():
+        ids = seed(size)
+        headers = admin_headers()
+        payload = [{'product_id': pid, 'adjust_total': 1} for pid in ids]
+        db.session.remove()
+
+        statements = []
+        # 只统计库存相关语句（校验令牌时可能查询 user 表）
+        listener = lambda conn, cursor, statement, *args: (
+            'FROM user' not in statement.replace('"', '') and statements.append(statement))
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            started = time.perf_counter()
+            resp = app.test_client().post('/api/products/batch-adjust-stock', json=payload, headers=headers)
+            elapsed = time.perf_counter() - started
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        assert resp.status_code == 200, resp.get_json()
+    return elapsed, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'))
+        for size in args.sizes:
+            elapsed, statements = run(app, size)
+            print(f'items={size:>7}  elapsed={elapsed * 1000:9.1f}ms  '
+                  f'items/sec={size / elapsed:10.0f}  statements={statements}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登录吞吐基准 - 单个 worker 进程每秒可完成的登录数
+
+对比同步哈希 (PASSWORD_HASH_WORKERS=0) 与进程池哈希，并发线程模拟 gthread worker 的请求线程。
+数据库为临时 SQLite 文件，不触碰 app.db。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_login.py --threads 8 --seconds 5 --pool-workers 4
+    python benchmarks/bench_login.py --method pbkdf2   # 对比不同算法
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from flask_jwt_extended import JWTManager  # noqa: E402
+
+from models import db, User  # noqa: E402
+from password_hashing import init_password_hashing  # noqa: E402
+
+USER_COUNT = 20
+PASSWORD = 'bench-password'
+
+
+def build_app(db_path, workers, method):
+    from auth_routes import auth_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{db_path}',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        JWT_SECRET_KEY='bench-secret',
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_METHOD=method,
+        PASSWORD_HASH_MAX_CONCURRENCY=64,
+        PASSWORD_HASH_TIMEOUT=60,
+    )
+    JWTManager(app)
+    db.init_app(app)
+    init_password_hashing(app)
+    app.register_blueprint(auth_bp)
+    return app
+
+
+def seed_users(app):
+    with app.app_context():
+        db.create_all()
+        for i in range(USER_COUNT):
+            user = User(username=f'bench{i}', phone=f'139{i:08d}')
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+
+
+def run(app, threads, seconds):
+    stop_at = time.perf_counter() + seconds
+    counts = [0] * threads
+    errors = [0] * threads
+
+    def worker(idx):
+        client = app.test_client()
+        i = idx
+        while time.perf_counter() < stop_at:
+            resp = client.post('/api/login', json={'login': f'bench{i % USER_COUNT}', 'password': PASSWORD})
+            if resp.status_code == 200:
+                counts[idx] += 1
+            else:
+                errors[idx] += 1
+            i += threads
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return sum(counts) / elapsed, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--pool-workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--method', default='scrypt')
+    args = parser.parse_args()
+
+    for label, workers in (('inline', 0), (f'pool({args.pool_workers})', args.pool_workers)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(os.path.join(tmp, 'bench.db'), workers, args.method)
+            seed_users(app)
+            # 预热进程池，避免把子进程启动时间算进吞吐
+            run(app, 1, 0.5)
+            rate, errors = run(app, args.threads, args.seconds)
+            app.extensions['password_hasher'].shutdown()
+            with app.app_context():
+                db.engine.dispose()
+        print(f'{label:>10}  method={args.method}  threads={args.threads}  '
+              f'logins/sec={rate:8.1f}  errors={errors}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 读写并发负载测试 - 对比默认回滚日志与 db_engine.py 中的 WAL 调优配置
+
+场景：若干读线程持续请求 GET /api/products/<id>，同时写线程持续调用
+POST /api/products/<id>/adjust-stock（每次写库存和库存日志并提交）。
+分别在 SQLITE_TUNING_ENABLED=False（rollback journal）与 True（WAL 等 PRAGMA）下运行，
+输出读请求吞吐、p50/p95 延迟、失败数以及写入吞吐。
+
+回滚日志模式下，写事务提交期间持有排他锁，读请求只能等待 busy 超时或直接报
+"database is locked"；WAL 模式下读请求读取快照，不受进行中的写入影响。
+
+数据库为临时文件（内存库无法体现锁行为），不触碰 app.db；响应缓存关闭，每个读请求都真实查库。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_sqlite_concurrency.py --readers 8 --writers 2 --seconds 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from db_engine import init_sqlite_tuning  # noqa: E402
+from models import db, Product, ProductStock  # noqa: E402
+
+PRODUCT_COUNT = 200
+
+
+def build_app(db_path, tuned):
+    from product_routes import product_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{db_path}',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLITE_TUNING_ENABLED=tuned,
+        RESPONSE_CACHE_ENABLED=False,
+    )
+    db.init_app(app)
+    init_sqlite_tuning(app, db)
+    app.register_blueprint(product_bp)
+    with app.app_context():
+        db.create_all()
+        for i in range(PRODUCT_COUNT):
+            product = Product(name=f'压测产品{i}', price=10)
+            product.stock = ProductStock(total_stock=1000, available_stock=1000, prelock_stock=0)
+            db.session.add(product)
+        db.session.commit()
+    return app
+
+
+def run(app, readers, writers, seconds):
+    stop_at = time.perf_counter() + seconds
+    read_latencies = [[] for _ in range(readers)]
+    read_errors = [0] * readers
+    write_counts = [0] * writers
+    write_errors = [0] * writers
+
+    def reader(idx):
+        client = app.test_client()
+        i = idx
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            resp = client.get(f'/api/products/{i % PRODUCT_COUNT + 1}')
+            if resp.status_code == 200:
+                read_latencies[idx].append(time.perf_counter() - started)
+            else:
+                read_errors[idx] += 1
+            i += readers
+
+    def writer(idx):
+        client = app.test_client()
+        i = idx
+        while time.perf_counter() < stop_at:
+            delta = 1 if i % 2 else -1
+            resp = client.post(f'/api/products/{i % PRODUCT_COUNT + 1}/adjust-stock',
+                               json={'adjust_total': delta, 'remark': 'bench'})
+            if resp.status_code == 200:
+                write_counts[idx] += 1
+            else:
+                write_errors[idx] += 1
+            i += writers
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(lat for per_thread in read_latencies for lat in per_thread)
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    return {
+        'reads_per_sec': len(latencies) / elapsed,
+        'read_p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'read_p95_ms': p95 * 1000,
+        'read_errors': sum(read_errors),
+        'writes_per_sec': sum(write_counts) / elapsed,
+        'write_errors': sum(write_errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for label, tuned in (('rollback', False), ('wal', True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(os.path.join(tmp, 'bench.db'), tuned)
+            result = run(app, args.readers, args.writers, args.seconds)
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+        print(f'{label:>8}  reads/sec={result["reads_per_sec"]:8.1f}  '
+              f'p50={result["read_p50_ms"]:6.1f}ms  p95={result["read_p95_ms"]:7.1f}ms  '
+              f'read_errors={result["read_errors"]}  '
+              f'writes/sec={result["writes_per_sec"]:7.1f}  write_errors={result["write_errors"]}')
+
+
+if __name__ == '__main__':
+    main()
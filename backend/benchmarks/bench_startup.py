@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准 - 新进程从导入到完成第一个请求的时间
+
+每轮启动一个全新的 Python 子进程（等同于一个新 worker），分别计时：
+- import：import app（只导入模块，不创建应用）
+- create_app：create_app() 完成配置、扩展与蓝图注册
+- first_request：第一个请求 GET /api/products（LAZY_BLUEPRINTS 时包括导入并注册蓝图）
+
+对比蓝图立即注册与 LAZY_BLUEPRINTS=True，输出各阶段中位数。
+gunicorn --preload 时 import 与 create_app 只在 master 中执行一次，fork 出的 worker 只需承担 first_request；
+不 preload 时每个 worker（包括 max_requests 回收后重启的 worker）都要付出全部三段时间。
+数据库为临时 SQLite 文件，不触碰 app.db。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+app = app_module.create_app()
+t2 = time.perf_counter()
+resp = app.test_client().get('/api/products')
+t3 = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_request': t3 - t2}))
+"""
+
+SETUP = r"""
+from app import create_app
+from models import db
+app = create_app()
+with app.app_context():
+    db.create_all()
+"""
+
+
+def run_child(code, env):
+    out = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1] if out.stdout.strip() else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   APP_CONFIG='production',
+                   JWT_SECRET_KEY='bench-secret',
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                   UPLOADS_DIR=os.path.join(tmp, 'uploads'),
+                   LOG_LEVEL='WARNING')
+        run_child(SETUP, env)
+
+        for label, lazy in (('eager', 'false'), ('lazy', 'true')):
+            samples = [json.loads(run_child(CHILD, dict(env, LAZY_BLUEPRINTS=lazy))) for _ in range(args.runs)]
+            medians = {key: statistics.median(s[key] for s in samples) * 1000 for key in samples[0]}
+            total = sum(medians.values())
+            print(f"{label:>6}  import={medians['import']:7.1f}ms  create_app={medians['create_app']:6.1f}ms  "
+                  f"first_request={medians['first_request']:6.1f}ms  total={total:7.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
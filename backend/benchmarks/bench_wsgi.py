@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WSGI 服务器吞吐基准 - Flask 开发服务器与 gunicorn (gunicorn.conf.py) 的对比
+
+分别启动两种服务器（同一个临时 SQLite 数据库），用 --concurrency 个客户端线程持续请求 --path，
+每个请求新建连接，输出每秒请求数与延迟分位数。客户端与服务器在同一台机器上运行，
+结果适合对比两种服务器，不代表绝对容量。数据库为临时 SQLite 文件，不触碰 app.db。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_wsgi.py --concurrency 16 --seconds 10
+    python benchmarks/bench_wsgi.py --path /api/products/1 --workers 4
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = r"""
+import sys
+from app import create_app
+from models import db, Product, ProductStock
+app = create_app()
+with app.app_context():
+    db.create_all()
+    for i in range(int(sys.argv[1])):
+        product = Product(name=f'基准产品{i}', price=10 + i)
+        product.stock = ProductStock(total_stock=100, available_stock=100, prelock_stock=0)
+        db.session.add(product)
+    db.session.commit()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', path)
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'服务器未在 {timeout} 秒内就绪 (port={port})')
+
+
+def load(port, path, concurrency, seconds):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                conn.request('GET', path)
+                resp = conn.getresponse()
+                resp.read()
+                conn.close()
+                if resp.status != 200:
+                    failed += 1
+                    continue
+            except OSError:
+                failed += 1
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    if not latencies:
+        return len(latencies) / elapsed, 0.0, 0.0, errors[0]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(latencies) / elapsed, statistics.median(latencies) * 1000, p99 * 1000, errors[0]
+
+
+def run_server(label, command, env, port, args):
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, args.path)
+        load(port, args.path, args.concurrency, 1)  # 预热
+        rps, p50, p99, errors = load(port, args.path, args.concurrency, args.seconds)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    print(f"{label:>10}  {rps:8.1f} req/s  p50={p50:7.1f}ms  p99={p99:7.1f}ms  errors={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default='/api/products')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None, help='gunicorn worker 数，默认由 gunicorn.conf.py 按 CPU 推算')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   APP_CONFIG='production',
+                   JWT_SECRET_KEY='bench-secret',
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                   UPLOADS_DIR=os.path.join(tmp, 'uploads'),
+                   LOG_LEVEL='WARNING')
+        if args.workers:
+            env['WEB_CONCURRENCY'] = str(args.workers)
+        subprocess.run([sys.executable, '-c', SETUP, str(args.products)], cwd=BACKEND_DIR, env=env, check=True)
+
+        port = free_port()
+        run_server('flask run', [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port),
+                                 '--no-reload', '--no-debugger'], env, port, args)
+        port = free_port()
+        run_server('gunicorn', [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                                '--bind', f'127.0.0.1:{port}', 'wsgi:app'], env, port, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,13 @@
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, decode_token
-from models import db, BrandCollaboration, CollaborationProject, CollaborationProduct, CollaborationActivity, User
+from models import db, BrandCollaboration, CollaborationProject, CollaborationProduct, CollaborationActivity
 from sqlalchemy import desc
-from functools import wraps
+from utils.auth import admin_required
 import json
 import datetime
 
 # 创建品牌联名合作蓝图
 collaboration_bp = Blueprint('collaboration', __name__, url_prefix='/api/collaboration')
 
-# 定义管理员权限检查的装饰器
-def admin_required(fn):
-    """装饰器：检查 JWT 身份是否为管理员"""
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        # 手动验证JWT
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "未提供有效的认证令牌"}), 401
-            
-        try:
-            # 手动获取用户身份
-            token = auth_header.split(' ')[1]
-            decoded_token = decode_token(token)
-            current_user_id = decoded_token['sub']
-            
-            # 检查管理员权限
-            user = User.query.get(current_user_id)
-            if not user or not user.is_admin:
-                return jsonify({"error": "此操作需要管理员权限"}), 403
-                
-            return fn(*args, **kwargs)
-        except Exception as e:
-            return jsonify({"error": str(e)}), 401
-    
-    return wrapper
-
 # 允许的状态值列表
 ALLOWED_STATUS = ['pending', 'processing', 'approved', 'rejected', 'completed']
 
@@ -86,7 +58,6 @@ def submit_collaboration():
 
 # 获取所有合作申请（管理员）
 @collaboration_bp.route('/all', methods=['GET'])
-@jwt_required()
 @admin_required
 def get_all_collaborations():
     """获取所有联名合作申请（管理员用）"""
@@ -145,7 +116,6 @@ def get_all_collaborations():
 
 # 获取单个合作申请详情（管理员）
 @collaboration_bp.route('/<int:collab_id>', methods=['GET'])
-@jwt_required()
 @admin_required
 def get_collaboration(collab_id):
     """获取指定合作申请详情"""
@@ -201,7 +171,6 @@ def get_collaboration(collab_id):
 
 # 更新合作申请状态（管理员）
 @collaboration_bp.route('/<int:collab_id>/status', methods=['PUT'])
-@jwt_required()
 @admin_required
 def update_collaboration_status(collab_id):
     """更新合作申请状态"""
@@ -238,7 +207,6 @@ def update_collaboration_status(collab_id):
 
 # 创建合作项目（管理员）
 @collaboration_bp.route('/<int:collab_id>/projects', methods=['POST'])
-@jwt_required()
 @admin_required
 def create_project(collab_id):
     """为合作申请创建项目"""
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+条件 GET 支持 - 为只读接口生成弱 ETag / Last-Modified，并处理 If-None-Match / If-Modified-Since
+
+两种生成 ETag 的方式：
+- 传入 validator：在执行视图前用一次廉价查询（如 max(updated_at) + count）得到版本信息，
+  客户端缓存仍然有效时直接返回 304，不再查询和序列化完整数据
+- 不传 validator：视图执行后对响应体做哈希（与响应缓存配合时无需访问数据库）
+"""
+
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, request
+
+
+def _weak_etag(seed):
+    return hashlib.sha1(str(seed).encode('utf-8')).hexdigest()[:32]
+
+
+def _to_http_datetime(value):
+    """数据库里的时间均为 UTC naive，转换为 aware 并截断到秒 (HTTP 日期精度)"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        # 有 If-None-Match 时忽略 If-Modified-Since (RFC 9110 13.1.3)
+        return etag is not None and request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _apply_validators(response, etag, last_modified, cache_control):
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def conditional_get(validator=None, cache_control='no-cache'):
+    """条件 GET 装饰器
+
+    validator(*args, **kwargs) 返回 (etag_seed, last_modified) 或 None；
+    返回 None 表示无法廉价判断（例如资源不存在），此时照常执行视图。
+    默认 Cache-Control: no-cache，客户端可保存响应但每次使用前需重新验证。
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return fn(*args, **kwargs)
+
+            etag = last_modified = None
+            if validator is not None:
+                version = validator(*args, **kwargs)
+                if version is not None:
+                    seed, last_modified = version
+                    # 查询参数影响响应内容，参与 ETag 计算
+                    etag = _weak_etag(f'{request.full_path}|{seed}')
+                    last_modified = _to_http_datetime(last_modified)
+                    if _not_modified(etag, last_modified):
+                        response = current_app.response_class(status=304)
+                        return _apply_validators(response, etag, last_modified, cache_control)
+
+            response = current_app.make_response(fn(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            if etag is None:
+                if response.direct_passthrough:
+                    return response
+                etag = _weak_etag(response.get_data())
+            _apply_validators(response, etag, last_modified, cache_control)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
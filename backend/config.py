@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+应用配置 - create_app(config) 使用的配置类
+
+- ProductionConfig：必须通过环境变量 JWT_SECRET_KEY 提供签名密钥，未设置时启动失败。
+  多进程部署（gunicorn 多 worker、多台机器）的所有进程必须使用同一个密钥，
+  否则一个 worker 签发的令牌在其他 worker 上校验失败
+- DevelopmentConfig：未设置 JWT_SECRET_KEY 时使用进程内随机密钥并输出警告，仅适用于单进程开发服务器
+- TestingConfig：内存 SQLite、固定密钥、关闭响应缓存、同步计算低成本密码哈希
+
+APP_CONFIG 环境变量选择配置（production / development / testing），默认 production。
+from app import app 的兼容入口同样按 APP_CONFIG 创建应用（flask --app app 也经由它），默认仍是 production；
+check_admin.py、create_user.py、update_db.py 等维护脚本在导入前 setdefault APP_CONFIG=development，
+未设置 JWT_SECRET_KEY 也能运行，需要对生产库使用生产配置时显式设置 APP_CONFIG=production。
+ENV_OVERRIDES 中的配置项可以用同名环境变量覆盖，按类中默认值的类型转换；
+日志 (LOG_*)、密码哈希 (PASSWORD_HASH_*)、连接池 (DB_*) 由各自模块读取环境变量。
+"""
+
+import os
+from datetime import timedelta
+
+BACKEND_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+UPLOADS_DIR = os.path.join(PROJECT_ROOT, 'uploads')
+
+
+class Config:
+    """所有环境共用的配置"""
+    # None 时取环境变量 DATABASE_URL，再默认 backend/app.db（见 db_engine.database_url）
+    SQLALCHEMY_DATABASE_URI = None
+    # 关闭 SQLAlchemy 的事件通知系统，如果不使用可以节省资源
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    JWT_SECRET_KEY = None
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    # 未设置 JWT_SECRET_KEY 时是否拒绝启动
+    REQUIRE_JWT_SECRET = True
+
+    # 公共只读接口的进程内 TTL+LRU 缓存（见 response_cache.py）
+    RESPONSE_CACHE_MAX_ENTRIES = 512
+    RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+    # 预扣超时清扫（见 stock_reservations.py）；间隔为 0 时不在进程内启动清扫线程
+    RESERVATION_TTL_SECONDS = 600
+    RESERVATION_SWEEP_INTERVAL = 0.0
+    RESERVATION_SWEEP_BATCH_SIZE = 500
+
+    # 上传文件目录（保存时按需创建）
+    UPLOADS_DIR = UPLOADS_DIR
+    PRODUCT_IMG_DIR = os.path.join(UPLOADS_DIR, 'products')
+    SETTINGS_UPLOAD_DIR = os.path.join(UPLOADS_DIR, 'settings')
+
+    # 上传图片的缩略图（见 image_pipeline.py）；IMAGE_WORKERS 为后台处理线程数，0 时在请求中同步处理
+    IMAGE_WORKERS = 2
+    IMAGE_VARIANT_WIDTHS = (200, 400, 800, 1600)
+    IMAGE_WEBP_QUALITY = 80
+    IMAGE_JPEG_QUALITY = 82
+
+    # 文件发送（见 static_files.py）：None 时由 worker 发送；'x-accel' 返回 X-Accel-Redirect
+    # （X_ACCEL_PREFIX/uploads/... 或 X_ACCEL_PREFIX/static/...，对应 nginx 的 internal location），
+    # 'x-sendfile' 返回 X-Sendfile 绝对路径 (Apache / lighttpd)
+    FILE_OFFLOAD = None
+    X_ACCEL_PREFIX = '/_protected'
+    # 文件名自带内容哈希的静态资源目录（vite 构建输出），按 immutable 长期缓存
+    STATIC_IMMUTABLE_PREFIXES = ('assets/',)
+
+    # 为 True 时蓝图在处理第一个请求前才导入并注册，命令行工具与脚本启动更快；
+    # gunicorn --preload 时应保持 False，让 master 进程导入全部路由，worker 直接共享
+    LAZY_BLUEPRINTS = False
+
+
+class ProductionConfig(Config):
+    pass
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    REQUIRE_JWT_SECRET = False
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    JWT_SECRET_KEY = 'test-secret'
+    # 默认关闭响应缓存，避免测试直接写库后读到旧数据；缓存相关测试自行开启
+    RESPONSE_CACHE_ENABLED = False
+    # 测试中同步计算密码哈希，并使用低成本参数
+    PASSWORD_HASH_WORKERS = 0
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    # 测试中同步生成缩略图
+    IMAGE_WORKERS = 0
+
+
+CONFIGS = {
+    'production': ProductionConfig,
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+}
+
+# 可以用同名环境变量覆盖的配置项
+ENV_OVERRIDES = (
+    'JWT_SECRET_KEY',
+    'RESPONSE_CACHE_MAX_ENTRIES',
+    'RESPONSE_CACHE_MAX_BYTES',
+    'RESERVATION_TTL_SECONDS',
+    'RESERVATION_SWEEP_INTERVAL',
+    'RESERVATION_SWEEP_BATCH_SIZE',
+    'UPLOADS_DIR',
+    'IMAGE_WORKERS',
+    'FILE_OFFLOAD',
+    'X_ACCEL_PREFIX',
+    'LAZY_BLUEPRINTS',
+)
+
+
+def get_config(name=None):
+    """按名称（默认取 APP_CONFIG 环境变量）返回配置类"""
+    name = (name or os.getenv('APP_CONFIG') or 'production').strip().lower()
+    try:
+        return CONFIGS[name]
+    except KeyError:
+        raise ValueError(f"未知的配置 {name!r}，可选: {', '.join(CONFIGS)}") from None
+
+
+def _convert(value, default):
+    if isinstance(default, bool):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    return value
+
+
+def apply_env_overrides(config):
+    """用环境变量覆盖 ENV_OVERRIDES 中的配置项（config 为 app.config）"""
+    for key in ENV_OVERRIDES:
+        value = os.getenv(key)
+        if value is not None and value != '':
+            config[key] = _convert(value, config.get(key))
+    # 上传根目录被覆盖时，子目录跟随
+    if os.getenv('UPLOADS_DIR'):
+        config['PRODUCT_IMG_DIR'] = os.path.join(config['UPLOADS_DIR'], 'products')
+        config['SETTINGS_UPLOAD_DIR'] = os.path.join(config['UPLOADS_DIR'], 'settings')
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置 - gunicorn -c gunicorn.conf.py wsgi:app
+
+按 CPU 核数选择 worker 类型与数量（见 worker_settings）：
+- 2 核及以下：gthread，核数 + 1 个进程，每个进程 GUNICORN_THREADS (默认 4) 个线程。
+  只有 2~3 个 sync worker 时，一个慢请求（上传、等待 SQLite 写锁）就占掉大部分并发，线程以很少的内存补足并发
+- 3 核以上：sync，2 × 核数 + 1 个进程，避免同一进程内的线程争用 GIL
+- sync worker 一次只处理一个请求，密码哈希直接在 worker 中计算（PASSWORD_HASH_WORKERS 默认 0），
+  不再为每个 worker 各开一个哈希进程池
+
+其他：
+- preload_app：master 导入应用后再 fork，worker 以写时复制共享代码与路由；
+  post_fork 中丢弃继承的数据库连接并重建日志线程（见 app.reinit_after_fork）
+- 预扣清扫不在 gunicorn 进程中运行：preload 时线程只存在于 master，而 worker 重启、扩缩时也不应各自清扫；
+  RESERVATION_SWEEP_INTERVAL 在这里被置为 0，清扫由独立进程 flask --app app sweep-reservations --loop 执行
+- max_requests + max_requests_jitter：worker 处理一定数量的请求后平滑重启，回收内存碎片，抖动避免所有 worker 同时重启
+- 环境变量覆盖：GUNICORN_BIND、GUNICORN_WORKER_CLASS、WEB_CONCURRENCY (worker 数)、GUNICORN_THREADS、
+  GUNICORN_MAX_REQUESTS、GUNICORN_MAX_REQUESTS_JITTER、GUNICORN_TIMEOUT、GUNICORN_PRELOAD
+"""
+
+import os
+
+
+def worker_settings(cpu_count, worker_class=None, workers=None, threads=None):
+    """返回 (worker_class, workers, threads)；未指定的值按 CPU 核数推算"""
+    cpu_count = max(1, cpu_count or 1)
+    worker_class = worker_class or ('gthread' if cpu_count <= 2 else 'sync')
+    if worker_class == 'gthread':
+        return worker_class, workers or cpu_count + 1, threads or 4
+    return worker_class, workers or 2 * cpu_count + 1, 1
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+worker_class, workers, threads = worker_settings(
+    os.cpu_count(),
+    worker_class=os.getenv('GUNICORN_WORKER_CLASS'),
+    workers=_env_int('WEB_CONCURRENCY'),
+    threads=_env_int('GUNICORN_THREADS'),
+)
+if worker_class == 'sync':
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+# 应用在此之后才导入（preload 时由 master 导入），create_app 读到 0 就不启动进程内清扫线程
+_sweep_interval_requested = os.environ.get('RESERVATION_SWEEP_INTERVAL')
+os.environ['RESERVATION_SWEEP_INTERVAL'] = '0'
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+
+max_requests = _env_int('GUNICORN_MAX_REQUESTS') or 5000
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER') or max_requests // 10
+
+timeout = _env_int('GUNICORN_TIMEOUT') or 30
+graceful_timeout = 30
+keepalive = 5
+
+# worker 心跳文件放在内存文件系统，避免容器中磁盘 IO 抖动导致 worker 被误判超时
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def when_ready(server):
+    if _sweep_interval_requested and float(_sweep_interval_requested) > 0:
+        server.log.warning("RESERVATION_SWEEP_INTERVAL is ignored under gunicorn; "
+                           "run `flask --app app sweep-reservations --loop` as a separate process")
+
+
+def post_fork(server, worker):
+    # 未 preload 时 worker 在 fork 之后才导入应用，没有继承的资源需要处理
+    app = server.app.callable
+    if app is not None:
+        from app import reinit_after_fork
+        reinit_after_fork(app)
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+产品图片处理 - 上传后生成多尺寸缩略图 (WebP + 原格式)，并把尺寸信息写回 Product.images
+
+- 上传请求只保存原图（见 product_routes._save_uploaded_images），提交后把新图片交给后台线程池处理，请求立即返回
+- 原图同样公开访问，保存前无损去除元数据 (strip_upload_metadata)：JPEG 的 EXIF/XMP/IPTC 段、PNG 的 eXIf 与文本块、
+  WebP 的 EXIF/XMP 块，拍摄地点 (GPS)、设备等不会随原图泄露；只保留方向标签，像素数据不重新编码
+- 每张图按 IMAGE_VARIANT_WIDTHS（默认 200/400/800/1600 px，不放大）生成 WebP 与原格式两种缩略图；
+  先按 EXIF 方向旋正，输出时不带 EXIF（拍摄地点、设备等），保留 ICC 色彩配置
+- 处理完成后 Product.images 中该图的路径字符串替换为：
+  {"src": 最大的原格式缩略图, "original": 原图, "width", "height", "variants": [{"width", "height", "src", "webp"}]}
+  接口的 images 字段仍只输出图片地址，image_srcset 字段输出 srcset（见 product_serializer.py）
+- 缩略图文件名为 <原图文件名>_<宽度>w.<扩展名>，同样带内容哈希，按 immutable 长期缓存
+- IMAGE_WORKERS（默认 2）为后台线程数，0 表示在请求中同步处理；Pillow 的解码、缩放与编码会释放 GIL。
+  线程池按进程在首次提交时创建，gunicorn fork 出的 worker 各自创建
+- 动图 (GIF / 动态 WebP) 与无法识别的文件保持原样；未处理的图片（进程退出时仍在队列中等）可以补处理：
+  flask --app app process-product-images
+"""
+
+import io
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app_logging import get_logger
+from models import db, Product
+from response_cache import invalidate
+from static_files import atomic_output, upload_path
+
+log = get_logger('images')
+
+DEFAULT_WIDTHS = (200, 400, 800, 1600)
+
+# 原图格式 -> (输出格式, 扩展名)；其他格式的缩略图只生成 WebP
+_ORIGINAL_FORMATS = {
+    'JPEG': ('JPEG', '.jpg'),
+    'PNG': ('PNG', '.png'),
+    'GIF': ('PNG', '.png'),
+}
+
+
+# --- Product.images 条目：旧数据与未处理的图片为路径字符串，处理后为字典 ---
+
+def image_src(entry):
+    return entry if isinstance(entry, str) else entry['src']
+
+
+def image_original(entry):
+    return entry if isinstance(entry, str) else entry['original']
+
+
+def image_urls(entries):
+    """接口 images 字段：每张图一个地址"""
+    return [image_src(entry) for entry in entries or ()]
+
+
+def image_files(entry):
+    """条目对应的全部文件地址（原图与缩略图）"""
+    if isinstance(entry, str):
+        return [entry]
+    urls = [entry['original']]
+    for variant in entry['variants']:
+        urls.extend(url for url in (variant['src'], variant['webp']) if url not in urls)
+    return urls
+
+
+def _srcset(variants, key):
+    return ', '.join(f"{variant[key]} {variant['width']}w" for variant in variants)
+
+
+def image_srcset(entries):
+    """接口 image_srcset 字段：未处理的图片只有 src"""
+    result = []
+    for entry in entries or ():
+        if isinstance(entry, str):
+            result.append({'src': entry})
+            continue
+        result.append({
+            'src': entry['src'],
+            'width': entry['width'],
+            'height': entry['height'],
+            'srcset': _srcset(entry['variants'], 'src'),
+            'webp_srcset': _srcset(entry['variants'], 'webp'),
+        })
+    return result
+
+
+def merge_images(entries, new_urls):
+    """追加新上传的图片，已存在的原图（相同内容）不重复添加；返回 (新列表, 实际追加的地址)"""
+    entries = list(entries or ())
+    existing = {image_original(entry) for entry in entries}
+    added = [url for url in dict.fromkeys(new_urls) if url not in existing]
+    return entries + added, added
+
+
+# --- 原图元数据 ---
+
+_ORIENTATION_TAG = 0x0112
+_EXIF_HEADER = b'Exif\x00\x00'
+
+# JPEG：APP1 (EXIF / XMP)、APP13 (IPTC / Photoshop)、COM
+_JPEG_METADATA_MARKERS = frozenset((0xE1, 0xED, 0xFE))
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_METADATA_CHUNKS = frozenset((b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'))
+_WEBP_METADATA_CHUNKS = frozenset((b'EXIF', b'XMP '))
+_VP8X_EXIF_FLAG = 0x08
+_VP8X_XMP_FLAG = 0x04
+
+
+def _tiff_orientation(tiff):
+    """EXIF (TIFF 结构) 中 IFD0 的方向标签，没有或无法解析时为 None"""
+    tiff = tiff.removeprefix(_EXIF_HEADER)
+    if tiff[:2] not in (b'II', b'MM'):
+        return None
+    order = '<' if tiff[:2] == b'II' else '>'
+    try:
+        offset = struct.unpack_from(order + 'I', tiff, 4)[0]
+        for n in range(struct.unpack_from(order + 'H', tiff, offset)[0]):
+            tag, field_type, _, value = struct.unpack_from(order + 'HHI4s', tiff, offset + 2 + 12 * n)
+            if tag == _ORIENTATION_TAG and field_type == 3:
+                return struct.unpack_from(order + 'H', value)[0]
+    except struct.error:
+        return None
+    return None
+
+
+def _orientation_tiff(orientation):
+    """只含方向标签的最小 EXIF：一个 IFD、一个条目"""
+    return b'MM\x00\x2a' + struct.pack('>IHHHIHHI', 8, 1, _ORIENTATION_TAG, 3, 1, orientation, 0, 0)
+
+
+def _strip_jpeg(data):
+    segments = [data[:2]]
+    pos = 2
+    orientation = None
+    changed = False
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xFF:  # 填充字节
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):  # 图像数据开始 (SOS) / 结束
+            break
+        end = pos + 2 + struct.unpack_from('>H', data, pos + 2)[0]
+        if marker in _JPEG_METADATA_MARKERS:
+            if marker == 0xE1 and data[pos + 4:pos + 10] == _EXIF_HEADER:
+                orientation = _tiff_orientation(data[pos + 10:end])
+            changed = True
+        else:
+            segments.append(data[pos:end])
+        pos = end
+    if not changed:
+        return None
+    if orientation and orientation != 1:
+        exif = _EXIF_HEADER + _orientation_tiff(orientation)
+        segments.insert(1, b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif)
+    segments.append(data[pos:])
+    return b''.join(segments)
+
+
+def _png_chunk(chunk_type, payload):
+    return struct.pack('>I', len(payload)) + chunk_type + payload + struct.pack('>I', zlib.crc32(chunk_type + payload))
+
+
+def _strip_png(data):
+    chunks = [data[:8]]
+    pos = 8
+    orientation = None
+    changed = False
+    while pos + 12 <= len(data):
+        length, chunk_type = struct.unpack_from('>I4s', data, pos)
+        end = pos + 12 + length
+        if chunk_type in _PNG_METADATA_CHUNKS:
+            if chunk_type == b'eXIf':
+                orientation = _tiff_orientation(data[pos + 8:end - 4])
+            changed = True
+        else:
+            chunks.append(data[pos:end])
+        pos = end
+    if not changed:
+        return None
+    if orientation and orientation != 1:
+        # eXIf 须位于 IDAT 之前，放在 IHDR 之后
+        chunks.insert(2, _png_chunk(b'eXIf', _orientation_tiff(orientation)))
+    chunks.append(data[pos:])
+    return b''.join(chunks)
+
+
+def _webp_chunk(fourcc, payload):
+    return fourcc + struct.pack('<I', len(payload)) + payload + b'\x00' * (len(payload) & 1)
+
+
+def _strip_webp(data):
+    chunks = []
+    pos = 12
+    orientation = None
+    changed = False
+    while pos + 8 <= len(data):
+        fourcc, length = struct.unpack_from('<4sI', data, pos)
+        payload = data[pos + 8:pos + 8 + length]
+        if fourcc in _WEBP_METADATA_CHUNKS:
+            if fourcc == b'EXIF':
+                orientation = _tiff_orientation(payload)
+            changed = True
+        else:
+            chunks.append([fourcc, payload])
+        pos += 8 + length + (length & 1)
+    if not changed:
+        return None
+    keep_orientation = bool(orientation and orientation != 1)
+    for chunk in chunks:
+        if chunk[0] == b'VP8X':
+            flags = chunk[1][0] & ~(_VP8X_EXIF_FLAG | _VP8X_XMP_FLAG)
+            if keep_orientation:
+                flags |= _VP8X_EXIF_FLAG
+            chunk[1] = bytes((flags,)) + chunk[1][1:]
+    body = b''.join(_webp_chunk(fourcc, payload) for fourcc, payload in chunks)
+    if keep_orientation:
+        body += _webp_chunk(b'EXIF', _orientation_tiff(orientation))
+    return b'RIFF' + struct.pack('<I', len(body) + 4) + b'WEBP' + body
+
+
+def strip_metadata(data):
+    """去除图片中的 EXIF 等元数据（只保留方向），返回新的字节；格式不支持或没有元数据时返回 None"""
+    try:
+        if data[:2] == b'\xff\xd8':
+            return _strip_jpeg(data)
+        if data[:8] == _PNG_SIGNATURE:
+            return _strip_png(data)
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            return _strip_webp(data)
+    except (struct.error, IndexError):
+        log.warning("image metadata not stripped: malformed file")
+    return None
+
+
+def strip_upload_metadata(file):
+    """保存上传文件前去除元数据；文件名中的内容哈希按去除后的内容计算"""
+    stripped = strip_metadata(file.stream.read())
+    file.stream.seek(0)
+    if stripped is not None:
+        file.stream = io.BytesIO(stripped)
+    return file
+
+
+# --- 缩略图生成 ---
+
+def variant_widths(width, widths):
+    """不超过原图宽度的目标宽度；原图比所有目标都窄时只生成原宽度"""
+    return sorted({w for w in widths if w < width} | {min(width, max(widths))})
+
+
+def _variant_url(url, width, ext):
+    stem = os.path.splitext(url)[0]
+    return f"{stem}_{width}w{ext}"
+
+
+def _save(image, path, fmt, **params):
+    with atomic_output(path) as out:
+        image.save(out, fmt, **params)
+
+
+def build_variants(url, widths=DEFAULT_WIDTHS, webp_quality=80, jpeg_quality=82):
+    """为原图生成缩略图并返回条目字典；动图、无法识别或过大的图片返回 None"""
+    # Pillow 只在处理图片时需要，不拖慢应用启动与命令行工具
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    path = upload_path(url, current_app.config['UPLOADS_DIR'])
+    try:
+        with Image.open(path) as source:
+            if getattr(source, 'is_animated', False):
+                return None
+            original_format = _ORIGINAL_FORMATS.get(source.format)
+            # JPEG 按目标尺寸在解码时直接缩小 (DCT 缩放)，大图解码更快、占用内存更少
+            source.draft('RGB', (max(widths), max(widths)))
+            image = ImageOps.exif_transpose(source)
+            # CMYK 图片转为 RGB 后原 ICC 配置不再适用
+            icc_profile = source.info.get('icc_profile') if source.mode != 'CMYK' else None
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        log.warning("image skipped", extra={'url': url, 'reason': str(e)})
+        return None
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    if original_format and original_format[0] == 'JPEG' and has_alpha:
+        image = image.convert('RGB')
+
+    variants = []
+    current = image
+    for width in reversed(variant_widths(image.width, widths)):
+        height = max(1, round(image.height * width / image.width))
+        if (width, height) != current.size:
+            # 从上一个（更大的）缩略图缩小，每一步约为 2 倍，比每次从原图缩放更快
+            current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+        webp = _variant_url(url, width, '.webp')
+        _save(current, upload_path(webp, current_app.config['UPLOADS_DIR']), 'WEBP',
+              quality=webp_quality, method=4, icc_profile=icc_profile)
+        src = webp
+        if original_format:
+            fmt, ext = original_format
+            src = _variant_url(url, width, ext)
+            params = dict(optimize=True, icc_profile=icc_profile)
+            if fmt == 'JPEG':
+                params.update(quality=jpeg_quality, progressive=True)
+            _save(current, upload_path(src, current_app.config['UPLOADS_DIR']), fmt, **params)
+        variants.append({'width': width, 'height': height, 'src': src, 'webp': webp})
+
+    variants.reverse()
+    return {
+        'src': variants[-1]['src'],
+        'original': url,
+        'width': variants[-1]['width'],
+        'height': variants[-1]['height'],
+        'variants': variants,
+    }
+
+
+def process_product_images(product_id, urls):
+    """生成缩略图并写回产品的 images；返回处理成功的图片数"""
+    config = current_app.config
+    processed = {}
+    for url in urls:
+        entry = build_variants(url, tuple(config['IMAGE_VARIANT_WIDTHS']),
+                               config['IMAGE_WEBP_QUALITY'], config['IMAGE_JPEG_QUALITY'])
+        if entry is not None:
+            processed[url] = entry
+    if not processed:
+        return 0
+
+    # 生成缩略图期间产品可能被修改：重新读取后只替换仍是原路径字符串的条目
+    product = db.session.execute(
+        db.select(Product).where(Product.id == product_id).with_for_update()
+    ).scalar_one_or_none()
+    if product is None:
+        db.session.rollback()
+        return 0
+    product.images = [processed.get(entry, entry) if isinstance(entry, str) else entry
+                      for entry in product.images or ()]
+    db.session.commit()
+    invalidate('products')
+    log.info("product images processed", extra={'product_id': product_id, 'images': len(processed)})
+    return len(processed)
+
+
+class ImagePipeline:
+    """后台图片处理线程池，在首次提交时按进程创建"""
+
+    def __init__(self, app, workers=2):
+        self.app = app
+        self.workers = workers
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        # gunicorn preload 时应用在 master 中创建，线程不会随 fork 复制，按 pid 判断
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-pipeline')
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, product_id, urls):
+        with self.app.app_context():
+            try:
+                process_product_images(product_id, urls)
+            except Exception:
+                log.exception("product image processing failed", extra={'product_id': product_id})
+            finally:
+                db.session.remove()
+
+    def submit(self, product_id, urls):
+        if not urls:
+            return None
+        if self.workers <= 0:
+            return process_product_images(product_id, urls)
+        return self._get_pool().submit(self._run, product_id, list(urls))
+
+    def shutdown(self, wait=True):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+def init_image_pipeline(app):
+    """按 IMAGE_WORKERS 为应用创建图片处理线程池"""
+    pipeline = ImagePipeline(app, int(app.config.get('IMAGE_WORKERS', 2)))
+    app.extensions['image_pipeline'] = pipeline
+    return pipeline
+
+
+def schedule_product_images(product_id, urls):
+    """提交新上传的图片；需在产品提交到数据库之后调用"""
+    return current_app.extensions['image_pipeline'].submit(product_id, urls)
+
+
+@click.command('process-product-images')
+@with_appcontext
+def process_product_images_command():
+    """为尚未生成缩略图的产品图片补处理"""
+    ids = db.session.execute(db.select(Product.id).where(Product.images.is_not(None)).order_by(Product.id)).scalars()
+    products = images = 0
+    for product_id in list(ids):
+        product = db.session.get(Product, product_id)
+        pending = [entry for entry in product.images or () if isinstance(entry, str)]
+        db.session.rollback()
+        if pending:
+            count = process_product_images(product_id, pending)
+            products += bool(count)
+            images += count
+    click.echo(f"products={products} images={images}")
@@ -97,6 +97,12 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            # 应用在连接时开启了 foreign_keys；batch 迁移重建表时会 DROP 旧表，
+            # 外键开启的情况下会触发 ON DELETE CASCADE 删除子表数据，迁移期间必须关闭
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            # 上一条语句会自动开启事务，先结束它，否则下面的迁移事务只是嵌套在其中，连接关闭时被整体回滚
+            connection.commit()
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -0,0 +1,54 @@
+"""Add product_category_closure table and product.category_id index
+
+Revision ID: 5d7e2b8c4f31
+Revises: 3b1f6c2a9d10
+Create Date: 2026-10-18 10:03:17.482910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7e2b8c4f31'
+down_revision = '3b1f6c2a9d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_category_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['product_category.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['product_category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    with op.batch_alter_table('product_category_closure', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_product_category_closure_descendant_id'), ['descendant_id'], unique=False)
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_category_id', ['category_id'], unique=False)
+
+    # 用递归 CTE 为已有分类回填闭包表
+    op.execute("""
+        WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM product_category
+            UNION ALL
+            SELECT tree.ancestor_id, c.id, tree.depth + 1
+            FROM tree JOIN product_category c ON c.parent_id = tree.descendant_id
+        )
+        INSERT INTO product_category_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, descendant_id, depth FROM tree
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_category_id')
+
+    with op.batch_alter_table('product_category_closure', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_category_closure_descendant_id'))
+
+    op.drop_table('product_category_closure')
@@ -0,0 +1,26 @@
+"""Add user.token_version for JWT revocation
+
+Revision ID: 6c2f9e1a7b42
+Revises: 5d7e2b8c4f31
+Create Date: 2026-10-18 11:20:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2f9e1a7b42'
+down_revision = '5d7e2b8c4f31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('token_version')
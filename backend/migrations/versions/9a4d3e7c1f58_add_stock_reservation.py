@@ -0,0 +1,43 @@
+"""Add stock_reservation table for prelock expiry
+
+Revision ID: 9a4d3e7c1f58
+Revises: 6c2f9e1a7b42
+Create Date: 2026-10-18 14:05:12.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4d3e7c1f58'
+down_revision = '6c2f9e1a7b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.String(length=50), nullable=True),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('settled_at', sa.DateTime(), nullable=True),
+    sa.CheckConstraint('quantity > 0', name='check_reservation_quantity_positive'),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_reservation_order_id'), ['order_id'], unique=False)
+        batch_op.create_index('ix_stock_reservation_status_expires_at', ['status', 'expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_reservation_status_expires_at')
+        batch_op.drop_index(batch_op.f('ix_stock_reservation_order_id'))
+
+    op.drop_table('stock_reservation')
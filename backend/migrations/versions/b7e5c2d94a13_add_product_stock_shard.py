@@ -0,0 +1,43 @@
+"""Add product_stock_shard table and product_stock.shard_count
+
+Revision ID: b7e5c2d94a13
+Revises: 9a4d3e7c1f58
+Create Date: 2026-10-18 15:32:47.120356
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e5c2d94a13'
+down_revision = '9a4d3e7c1f58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_stock_shard',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('shard_no', sa.Integer(), nullable=False),
+    sa.Column('total_stock', sa.Integer(), nullable=False),
+    sa.Column('available_stock', sa.Integer(), nullable=False),
+    sa.Column('prelock_stock', sa.Integer(), nullable=False),
+    sa.CheckConstraint('available_stock + prelock_stock <= total_stock', name='check_shard_stock_logic'),
+    sa.CheckConstraint('available_stock >= 0', name='check_shard_available_stock_non_negative'),
+    sa.CheckConstraint('prelock_stock >= 0', name='check_shard_prelock_stock_non_negative'),
+    sa.CheckConstraint('total_stock >= 0', name='check_shard_total_stock_non_negative'),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id', 'shard_no', name='uq_product_stock_shard')
+    )
+    with op.batch_alter_table('product_stock', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shard_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('product_stock', schema=None) as batch_op:
+        batch_op.drop_column('shard_count')
+
+    op.drop_table('product_stock_shard')
@@ -0,0 +1,26 @@
+"""Add (product_id, created_time) index on stock_log
+
+Revision ID: c3a8f6e21d07
+Revises: b7e5c2d94a13
+Create Date: 2026-10-18 16:48:03.551720
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f6e21d07'
+down_revision = 'b7e5c2d94a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stock_log', schema=None) as batch_op:
+        batch_op.create_index('ix_stock_log_product_id_created_time', ['product_id', 'created_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_log_product_id_created_time')
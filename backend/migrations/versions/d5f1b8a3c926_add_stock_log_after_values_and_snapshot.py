@@ -0,0 +1,64 @@
+"""Add after_* columns to stock_log and stock_snapshot table
+
+Revision ID: d5f1b8a3c926
+Revises: c3a8f6e21d07
+Create Date: 2026-10-18 17:36:12.408815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f1b8a3c926'
+down_revision = 'c3a8f6e21d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stock_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('after_total', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('after_available', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('after_prelock', sa.Integer(), nullable=True))
+
+    # 已有变动前库存的旧日志按变动类型补齐变动后库存（与 stock_ledger._delta 的推算规则一致）
+    op.execute("""
+        UPDATE stock_log SET
+            after_total = before_total
+                + CASE WHEN change_type IN (2, 4, 5) THEN change_amount ELSE 0 END,
+            after_available = before_available
+                + CASE WHEN change_type IN (1, 3, 4, 5) THEN change_amount ELSE 0 END,
+            after_prelock = before_prelock
+                + CASE WHEN change_type IN (1, 3) THEN -change_amount
+                       WHEN change_type = 2 THEN change_amount ELSE 0 END
+        WHERE before_total IS NOT NULL AND before_available IS NOT NULL AND before_prelock IS NOT NULL
+          AND after_total IS NULL
+    """)
+
+    op.create_table('stock_snapshot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.DateTime(), nullable=False),
+    sa.Column('total_stock', sa.Integer(), nullable=False),
+    sa.Column('available_stock', sa.Integer(), nullable=False),
+    sa.Column('prelock_stock', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_snapshot', schema=None) as batch_op:
+        batch_op.create_index('ix_stock_snapshot_as_of', ['as_of'], unique=False)
+        batch_op.create_index('ix_stock_snapshot_product_id_as_of', ['product_id', 'as_of'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_snapshot', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_snapshot_product_id_as_of')
+        batch_op.drop_index('ix_stock_snapshot_as_of')
+
+    op.drop_table('stock_snapshot')
+    with op.batch_alter_table('stock_log', schema=None) as batch_op:
+        batch_op.drop_column('after_prelock')
+        batch_op.drop_column('after_available')
+        batch_op.drop_column('after_total')
@@ -0,0 +1,56 @@
+"""Add maintained effective_stock / stock_status columns to product_stock
+
+Revision ID: e8c4a7d2f315
+Revises: d5f1b8a3c926
+Create Date: 2026-10-18 18:21:40.733902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4a7d2f315'
+down_revision = 'd5f1b8a3c926'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product_stock', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('warning_stock', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('effective_stock', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('stock_status', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('status_changed_at', sa.DateTime(), nullable=True))
+
+    # 按当前库存（含分片）与产品预警值回填（与 models.refresh_stock_status 一致）
+    op.execute("""
+        UPDATE product_stock SET
+            warning_stock = COALESCE((SELECT warning_stock FROM product WHERE product.id = product_stock.product_id), 0),
+            effective_stock = available_stock - prelock_stock
+                + COALESCE((SELECT SUM(available_stock) - SUM(prelock_stock) FROM product_stock_shard
+                            WHERE product_stock_shard.product_id = product_stock.product_id), 0),
+            status_changed_at = CURRENT_TIMESTAMP
+    """)
+    op.execute("""
+        UPDATE product_stock SET stock_status = CASE
+            WHEN effective_stock <= 0 THEN 0
+            WHEN effective_stock <= warning_stock THEN 1
+            ELSE 2 END
+    """)
+
+    op.create_index('ix_product_stock_stock_margin', 'product_stock',
+                    [sa.text('(effective_stock - warning_stock)'), 'product_id'], unique=False)
+    op.create_index('ix_product_stock_status_changed_at', 'product_stock',
+                    ['status_changed_at', 'product_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_product_stock_status_changed_at', table_name='product_stock')
+    op.drop_index('ix_product_stock_stock_margin', table_name='product_stock')
+
+    with op.batch_alter_table('product_stock', schema=None) as batch_op:
+        batch_op.drop_column('status_changed_at')
+        batch_op.drop_column('stock_status')
+        batch_op.drop_column('effective_stock')
+        batch_op.drop_column('warning_stock')
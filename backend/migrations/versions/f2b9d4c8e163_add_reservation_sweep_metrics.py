@@ -0,0 +1,33 @@
+"""Add reservation_sweep_metrics table
+
+Revision ID: f2b9d4c8e163
+Revises: e8c4a7d2f315
+Create Date: 2026-10-18 21:06:12.483920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9d4c8e163'
+down_revision = 'e8c4a7d2f315'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reservation_sweep_metrics',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('runs', sa.Integer(), nullable=False),
+    sa.Column('swept_total', sa.Integer(), nullable=False),
+    sa.Column('last_swept', sa.Integer(), nullable=False),
+    sa.Column('last_duration_ms', sa.Float(), nullable=False),
+    sa.Column('max_duration_ms', sa.Float(), nullable=False),
+    sa.Column('last_run_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('reservation_sweep_metrics')
@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_hashing import hash_password, verify_password
 from sqlalchemy import Text # 导入 Text 类型用于较长内容
+from sqlalchemy import case, event, literal
+from sqlalchemy.orm import Session
 import re
 import json
 
@@ -29,6 +31,8 @@ class User(db.Model):
     password_hash = db.Column(db.String(256)) # 调整长度以适应更强的哈希
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False, nullable=False) # 添加管理员标志字段
+    # 令牌版本：权限变更时递增，签发时写入 JWT 的 tv 声明，版本不一致的旧令牌视为已撤销
+    token_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     # 新增基本信息字段
     gender = db.Column(db.String(10), nullable=True)  # 性别：男/女/保密
     birthday = db.Column(db.Date, nullable=True)  # 生日
@@ -47,12 +51,12 @@ class User(db.Model):
     member_level = db.relationship('MemberLevel', backref='users')
 
     def set_password(self, password):
-        # 使用 Werkzeug 生成密码哈希
-        self.password_hash = generate_password_hash(password)
+        # 使用 Werkzeug 生成密码哈希（在密码哈希进程池中计算）
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        # 使用 Werkzeug 校验密码哈希
-        return check_password_hash(self.password_hash, password)
+        # 使用 Werkzeug 校验密码哈希（在密码哈希进程池中计算）
+        return verify_password(self.password_hash, password)
 
     def get_custom_fields(self):
         """获取用户自定义字段"""
@@ -310,6 +314,59 @@ class ProductCategory(db.Model):
     def __repr__(self):
         return f'<ProductCategory {self.name}>'
 
+# 分类闭包表：每个分类与它自身及全部后代各占一行 (depth 为层级差)，
+# 按分类筛选产品时可一次查询覆盖整棵子树，无需沿 parent/children 递归懒加载
+class ProductCategoryClosure(db.Model):
+    __tablename__ = 'product_category_closure'
+
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('product_category.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('product_category.id', ondelete='CASCADE'), primary_key=True, index=True)
+    depth = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ProductCategoryClosure {self.ancestor_id}->{self.descendant_id} depth={self.depth}>'
+
+def rebuild_category_closure(session):
+    """根据 product_category.parent_id 整表重建闭包表（分类数量很少，整表重建最简单可靠）"""
+    rows = session.execute(db.select(ProductCategory.id, ProductCategory.parent_id)).all()
+    parent_of = {cid: pid for cid, pid in rows}
+
+    closure = []
+    for cid in parent_of:
+        depth = 0
+        current = cid
+        seen = set()
+        # 沿父链向上，遇到环或悬空的 parent_id 时停止
+        while current is not None and current in parent_of and current not in seen:
+            seen.add(current)
+            closure.append({'ancestor_id': current, 'descendant_id': cid, 'depth': depth})
+            current = parent_of[current]
+            depth += 1
+
+    session.execute(db.delete(ProductCategoryClosure))
+    if closure:
+        session.execute(db.insert(ProductCategoryClosure), closure)
+
+@event.listens_for(Session, 'before_flush')
+def _mark_category_tree_dirty(session, flush_context, instances):
+    """分类新增、删除或调整父级时标记闭包表待重建"""
+    for obj in session.new | session.deleted:
+        if isinstance(obj, ProductCategory):
+            session.info['category_tree_dirty'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, ProductCategory):
+            attrs = db.inspect(obj).attrs
+            if attrs.parent_id.history.has_changes() or attrs.parent.history.has_changes():
+                session.info['category_tree_dirty'] = True
+                return
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _refresh_category_closure(session, flush_context):
+    """在同一事务内重建闭包表，与分类变更一起提交或回滚"""
+    if session.info.pop('category_tree_dirty', False):
+        rebuild_category_closure(session)
+
 # 产品和标签的关联表（多对多）
 product_tag = db.Table('product_tag_relation',
     db.Column('product_id', db.Integer, db.ForeignKey('product.id'), primary_key=True),
@@ -360,12 +417,19 @@ class Product(db.Model, SlugMixin):
     # 库存日志关系
     stock_logs = db.relationship("StockLog", back_populates="product", cascade="all, delete-orphan")
     
+    # 列表按 (created_at, id) 降序做游标分页，需要复合索引支撑
+    __table_args__ = (
+        db.Index('ix_product_created_at_id', 'created_at', 'id'),
+        db.Index('ix_product_category_id', 'category_id'),
+    )
+    
     # 有效库存属性
     @property
     def effective_stock(self):
         """有效库存 = 可用库存 - 预扣库存"""
         if self.stock:
-            return self.stock.available_stock - self.stock.prelock_stock
+            _, available, prelock = self.stock.counts()
+            return available - prelock
         return 0
         
     @property
@@ -393,33 +457,12 @@ class Product(db.Model, SlugMixin):
             setattr(self, key, value)
             
     def to_dict(self, include_stock=True):
-        """转换为字典"""
-        result = {
-            'id': self.id,
-            'name': self.name,
-            'slug': self.slug,
-            'description': self.description,
-            'price': float(self.price),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'is_featured': self.is_featured,
-            'images': self.images,
-            'warning_stock': self.warning_stock,
-            'category_id': self.category_id,
-            'category': self.category.name if self.category else None,
-        }
-        
-        # 包含库存数据
+        """转换为字典（字段定义见 product_serializer）"""
+        from product_serializer import TO_DICT_FIELDS, TO_DICT_STOCK_FIELDS, serialize_product
+        fields = TO_DICT_FIELDS
         if include_stock and self.stock:
-            result.update({
-                'total_stock': self.stock.total_stock,
-                'available_stock': self.stock.available_stock,
-                'prelock_stock': self.stock.prelock_stock,
-                'effective_stock': self.effective_stock,
-                'stock_status': self.stock_status
-            })
-        
-        return result
+            fields = TO_DICT_FIELDS + TO_DICT_STOCK_FIELDS
+        return serialize_product(self, fields)
 
 class ProductStock(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -427,9 +470,20 @@ class ProductStock(db.Model):
     total_stock = db.Column(db.Integer, nullable=False, default=0) # 总库存
     available_stock = db.Column(db.Integer, nullable=False, default=0) # 可用库存
     prelock_stock = db.Column(db.Integer, nullable=False, default=0) # 预扣库存 (下单未支付)
+    # 分片数，0 表示单行库存；大于 0 时库存分散在 product_stock_shard 中 (见 stock_shards.py)
+    shard_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # 随库存变动同步维护的列，用于按索引查询低库存与库存状态变化（见 stock_status_values / refresh_stock_status）
+    # 分片商品的分片变动不回写本行，这几列由分片再平衡任务定期刷新
+    warning_stock = db.Column(db.Integer, nullable=False, default=0, server_default='0') # 冗余 product.warning_stock
+    effective_stock = db.Column(db.Integer, nullable=False, default=0, server_default='0') # 有效库存 = 可用 - 预扣
+    stock_status = db.Column(db.SmallInteger, nullable=True) # 同 Product.stock_status
+    status_changed_at = db.Column(db.DateTime, nullable=True) # stock_status 最近一次变化的时间
 
     # 与Product的关系 - 添加back_populates
     product = db.relationship("Product", back_populates="stock")
+    shards = db.relationship("ProductStockShard", primaryjoin="ProductStock.product_id == foreign(ProductStockShard.product_id)",
+                             viewonly=True, order_by="ProductStockShard.shard_no")
 
     # 检查库存非负约束
     __table_args__ = (
@@ -439,16 +493,131 @@ class ProductStock(db.Model):
         db.CheckConstraint('available_stock + prelock_stock <= total_stock', name='check_stock_logic')
     )
 
+    def counts(self):
+        """(总库存, 可用库存, 预扣库存)；分片模式下为本行与各分片之和"""
+        total, available, prelock = self.total_stock or 0, self.available_stock or 0, self.prelock_stock or 0
+        if self.shard_count:
+            for shard in self.shards:
+                total += shard.total_stock
+                available += shard.available_stock
+                prelock += shard.prelock_stock
+        return total, available, prelock
+
     def __repr__(self):
         return f'<ProductStock product_id={self.product_id}, available={self.available_stock}>'
 
 
+# 低库存查询：WHERE effective_stock - warning_stock <= 0 ORDER BY effective_stock - warning_stock
+db.Index('ix_product_stock_stock_margin', ProductStock.effective_stock - ProductStock.warning_stock, ProductStock.product_id)
+# 库存状态变化增量拉取：按 (status_changed_at, product_id) 游标
+db.Index('ix_product_stock_status_changed_at', ProductStock.status_changed_at, ProductStock.product_id)
+
+
+def stock_status_case(effective, warning):
+    """库存状态的 SQL 表达式，规则与 Product.stock_status 一致"""
+    return case((effective <= 0, 0), (effective <= warning, 1), else_=2)
+
+
+def _status_columns(effective, warning):
+    status = stock_status_case(effective, warning)
+    return {
+        ProductStock.effective_stock: effective,
+        ProductStock.stock_status: status,
+        ProductStock.status_changed_at: case(
+            (ProductStock.stock_status.is_distinct_from(status), literal(datetime.utcnow(), db.DateTime)),
+            else_=ProductStock.status_changed_at),
+    }
+
+
+def stock_status_values(values):
+    """UPDATE product_stock 的 SET 子句加上同步维护的有效库存与库存状态
+
+    有效库存按本次可用/预扣的变化量增减（分片商品的本行有效库存为含分片的合计，同样适用）；
+    SET 中的列引用的都是更新前的值，PostgreSQL 与 SQLite 行为一致。
+    """
+    available = values.get(ProductStock.available_stock, ProductStock.available_stock)
+    prelock = values.get(ProductStock.prelock_stock, ProductStock.prelock_stock)
+    effective = (ProductStock.effective_stock + (available - ProductStock.available_stock)
+                 - (prelock - ProductStock.prelock_stock))
+    return {**values, **_status_columns(effective, ProductStock.warning_stock)}
+
+
+def refresh_stock_status(session, product_ids):
+    """按当前库存（含分片）与产品预警值重新计算指定产品的维护列"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    def shard_sum(column):
+        return (db.select(db.func.coalesce(db.func.sum(column), 0))
+                .where(ProductStockShard.product_id == ProductStock.product_id)
+                .scalar_subquery())
+
+    effective = (ProductStock.available_stock + shard_sum(ProductStockShard.available_stock)
+                 - ProductStock.prelock_stock - shard_sum(ProductStockShard.prelock_stock))
+    warning = (db.select(db.func.coalesce(Product.warning_stock, 0))
+               .where(Product.id == ProductStock.product_id)
+               .scalar_subquery())
+    values = {ProductStock.warning_stock: warning, **_status_columns(effective, warning)}
+    for start in range(0, len(product_ids), 10000):
+        session.execute(
+            db.update(ProductStock)
+            .where(ProductStock.product_id.in_(product_ids[start:start + 10000]))
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+@event.listens_for(Session, 'before_flush')
+def _mark_stock_status_dirty(session, flush_context, instances):
+    """通过 ORM 新增/修改库存、分片或产品预警值时记下待刷新的对象（product_id 在 flush 后才有）"""
+    pending = session.info.setdefault('stock_status_dirty', [])
+    for obj in session.new | session.dirty:
+        if isinstance(obj, (ProductStock, ProductStockShard)):
+            pending.append(obj)
+        elif isinstance(obj, Product) and obj in session.dirty and db.inspect(obj).attrs.warning_stock.history.has_changes():
+            pending.append(obj)
+    if not pending:
+        session.info.pop('stock_status_dirty')
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _refresh_stock_status(session, flush_context):
+    """与库存变更在同一事务内刷新维护列"""
+    pending = session.info.pop('stock_status_dirty', None)
+    if pending:
+        product_ids = {obj.id if isinstance(obj, Product) else obj.product_id for obj in pending}
+        refresh_stock_status(session, product_ids - {None})
+
+
+class ProductStockShard(db.Model):
+    """热点商品的库存分片：预扣随机落在某个分片上，不再集中争用 product_stock 的同一行"""
+    __tablename__ = 'product_stock_shard'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+    shard_no = db.Column(db.Integer, nullable=False)
+    total_stock = db.Column(db.Integer, nullable=False, default=0)
+    available_stock = db.Column(db.Integer, nullable=False, default=0)
+    prelock_stock = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'shard_no', name='uq_product_stock_shard'),
+        db.CheckConstraint('total_stock >= 0', name='check_shard_total_stock_non_negative'),
+        db.CheckConstraint('available_stock >= 0', name='check_shard_available_stock_non_negative'),
+        db.CheckConstraint('prelock_stock >= 0', name='check_shard_prelock_stock_non_negative'),
+        db.CheckConstraint('available_stock + prelock_stock <= total_stock', name='check_shard_stock_logic'),
+    )
+
+    def __repr__(self):
+        return f'<ProductStockShard product_id={self.product_id} shard={self.shard_no} available={self.available_stock}>'
+
+
 class StockLog(db.Model):
     log_id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     change_type = db.Column(db.SmallInteger, nullable=False) # 1:下单预扣, 2:支付确认, 3:取消/超时释放, 4:后台修改
     change_amount = db.Column(db.Integer, nullable=False) # 正数增加，负数减少 (相对于 available_stock 或 total_stock)
-    # 可以增加 pre_available, post_available 等字段记录变动前后状态
     order_id = db.Column(db.String(50), nullable=True) # 关联的订单号 (可选)
     admin_id = db.Column(db.Integer, nullable=True) # 操作管理员ID (可选, 用于后台修改)
     remark = db.Column(db.String(200), nullable=True) # 备注
@@ -461,6 +630,11 @@ class StockLog(db.Model):
     before_total = db.Column(db.Integer, nullable=True)  # 变动前总库存
     before_available = db.Column(db.Integer, nullable=True)  # 变动前可用库存
     before_prelock = db.Column(db.Integer, nullable=True)  # 变动前预扣库存
+
+    # 库存变动后数据记录（与 before_* 一起可按日志重建任意时刻的库存，见 stock_ledger.py）
+    after_total = db.Column(db.Integer, nullable=True)  # 变动后总库存
+    after_available = db.Column(db.Integer, nullable=True)  # 变动后可用库存
+    after_prelock = db.Column(db.Integer, nullable=True)  # 变动后预扣库存
     
     # 兼容旧字段别名
     @property
@@ -473,9 +647,71 @@ class StockLog(db.Model):
 
     # 关联 Product (可选，方便查询)
     product = db.relationship('Product', back_populates="stock_logs")
+
+    # 按产品分页/按时间范围查询库存日志
+    __table_args__ = (
+        db.Index('ix_stock_log_product_id_created_time', 'product_id', 'created_time'),
+    )
             
     def __repr__(self):
-        return f'<StockLog {self.log_id} product_id={self.product_id} type={self.change_type} amount={self.change_amount}>' 
+        return f'<StockLog {self.log_id} product_id={self.product_id} type={self.change_type} amount={self.change_amount}>'
+
+
+class StockSnapshot(db.Model):
+    """库存快照：as_of 时刻各产品的库存，由 stock_ledger.take_snapshots 定期生成"""
+    __tablename__ = 'stock_snapshot'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False) # 快照包含 created_time <= as_of 的全部库存日志
+    total_stock = db.Column(db.Integer, nullable=False)
+    available_stock = db.Column(db.Integer, nullable=False)
+    prelock_stock = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stock_snapshot_product_id_as_of', 'product_id', 'as_of'),
+        db.Index('ix_stock_snapshot_as_of', 'as_of'),
+    )
+
+    def __repr__(self):
+        return f'<StockSnapshot product_id={self.product_id} as_of={self.as_of} total={self.total_stock}>'
+
+
+class StockReservation(db.Model):
+    """预扣记录：每笔预扣带过期时间，超时未支付由后台清扫释放 (见 stock_reservations.py)"""
+    __tablename__ = 'stock_reservation'
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.String(50), nullable=True, index=True) # 关联的订单号
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False) # 预扣数量
+    status = db.Column(db.String(20), nullable=False, default='held') # held, confirmed, released, expired
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False) # 超过该时间仍为 held 则自动释放
+    settled_at = db.Column(db.DateTime, nullable=True) # 确认/释放/过期的时间
+
+    # 清扫只查 status='held' AND expires_at <= now，按过期时间顺序分批处理
+    __table_args__ = (
+        db.Index('ix_stock_reservation_status_expires_at', 'status', 'expires_at'),
+        db.CheckConstraint('quantity > 0', name='check_reservation_quantity_positive'),
+    )
+
+    def __repr__(self):
+        return f'<StockReservation {self.id} order={self.order_id} product_id={self.product_id} status={self.status}>'
+
+
+class ReservationSweepMetrics(db.Model):
+    """预扣清扫累计指标（单行，id=1）：清扫可能在独立进程中运行，指标存库后任一 worker 都能读到"""
+    __tablename__ = 'reservation_sweep_metrics'
+
+    id = db.Column(db.Integer, primary_key=True)
+    runs = db.Column(db.Integer, nullable=False, default=0) # 清扫次数
+    swept_total = db.Column(db.Integer, nullable=False, default=0) # 累计释放的预扣记录数
+    last_swept = db.Column(db.Integer, nullable=False, default=0)
+    last_duration_ms = db.Column(db.Float, nullable=False, default=0.0)
+    max_duration_ms = db.Column(db.Float, nullable=False, default=0.0)
+    last_run_at = db.Column(db.DateTime, nullable=True)
 
 # 添加品牌联名合作相关的模型
 
@@ -1,20 +1,41 @@
 # backend/news_routes.py
-from flask import Blueprint, jsonify, request, abort
+from flask import Blueprint, jsonify, request, abort, g
 from models import db, NewsArticle
-# 导入 User 模型和 JWT 装饰器 (未来用于权限控制)
-from models import User
-from flask_jwt_extended import jwt_required, get_jwt_identity 
-import sys # 导入 sys 用于打印到 stderr
+# 管理员权限装饰器（自带 JWT 校验）
+from utils.auth import admin_required
+from app_logging import get_logger
+from response_cache import cached_response, invalidate
+from conditional import conditional_get
+from sqlalchemy import func
 
 news_bp = Blueprint('news', __name__, url_prefix='/api')
+log = get_logger('news')
+
+def _news_list_version():
+    """已发布文章列表版本：数量 + 最近更新/发布时间"""
+    count, last_updated, last_published = db.session.query(
+        func.count(NewsArticle.id), func.max(NewsArticle.updated_at), func.max(NewsArticle.publish_date)
+    ).filter(NewsArticle.is_published == True).one()
+    candidates = [d for d in (last_updated, last_published) if d is not None]
+    last_modified = max(candidates) if candidates else None
+    return f"{count}|{last_updated}|{last_published}", last_modified
+
+def _news_detail_version(slug):
+    """单篇文章版本：只查询 id 与 updated_at，文章不存在时交给视图返回 404"""
+    row = db.session.query(NewsArticle.id, NewsArticle.updated_at)\
+                    .filter_by(slug=slug, is_published=True).first()
+    if row is None:
+        return None
+    return f"{row.id}|{row.updated_at}", row.updated_at
 
 @news_bp.route('/news', methods=['GET'])
+@conditional_get(_news_list_version)
+@cached_response('news', ttl=120)
 def get_news_list():
     # 获取分页参数，默认为第 1 页，每页 10 条
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
 
-    print(f"[DEBUG] get_news_list called. Requesting page: {page}, per_page: {per_page}", file=sys.stderr)
 
     # 查询已发布的文章，按发布日期降序排列，并进行分页
     pagination = NewsArticle.query.filter_by(is_published=True)\
@@ -22,9 +43,7 @@ def get_news_list():
                                    .paginate(page=page, per_page=per_page, error_out=False)
 
     articles = pagination.items
-    # --- 添加调试打印 --- 
-    print(f"[DEBUG] Articles retrieved from DB: {articles}", file=sys.stderr)
-    # --- 调试打印结束 --- 
+    log.debug("news list", extra={'page': page, 'per_page': per_page, 'count': len(articles)})
 
     # 准备返回的数据结构
     news_data = [
@@ -38,10 +57,6 @@ def get_news_list():
         } for article in articles
     ]
 
-    # --- 添加调试打印 --- 
-    print(f"[DEBUG] Serialized news_data to be returned: {news_data}", file=sys.stderr)
-    # --- 调试打印结束 --- 
-
     return jsonify({
         'news': news_data,
         'total_pages': pagination.pages,
@@ -52,6 +67,8 @@ def get_news_list():
     })
 
 @news_bp.route('/news/<string:slug>', methods=['GET'])
+@conditional_get(_news_detail_version)
+@cached_response('news', ttl=300)
 def get_news_detail(slug):
     # 根据 slug 查询已发布的文章，如果找不到则返回 404
     article = NewsArticle.query.filter_by(slug=slug, is_published=True).first_or_404()
@@ -90,6 +107,7 @@ def create_news_article():
         new_article = NewsArticle(title=title, content=content, slug=slug_provided)
         db.session.add(new_article)
         db.session.commit()
+        invalidate('news')
         # 返回新创建的文章信息，特别是生成的 slug
         return jsonify({
             'message': '文章创建成功',
@@ -107,32 +125,13 @@ def create_news_article():
 
 # 管理员 API 路由 - 获取所有文章（包括草稿）
 @news_bp.route('/admin/news', methods=['GET'])
-@jwt_required() # <-- 恢复 JWT 验证
+@admin_required
 def admin_get_all_news():
-    print("--- ENTERING admin_get_all_news ---", file=sys.stderr) # 恢复日志
     try:
-        # 检查用户权限
-        current_user_id = get_jwt_identity() # <-- 恢复
-        print(f"[DEBUG] admin_get_all_news: JWT Identity (user_id): {current_user_id}", file=sys.stderr) # 恢复日志
-        
-        user = User.query.get(current_user_id)
-        print(f"[DEBUG] admin_get_all_news: User object from DB: {user}", file=sys.stderr) # 恢复日志
-        
-        if not user:
-            print(f"[ERROR] admin_get_all_news: User with ID {current_user_id} not found in database!", file=sys.stderr) # 恢复日志
-            return jsonify({"error": "用户不存在或令牌无效"}), 401 # 恢复错误码
-            
-        if not user.is_admin:
-            print(f"[WARN] admin_get_all_news: User {current_user_id} is not an admin.", file=sys.stderr)
-            return jsonify({"error": "权限不足"}), 403
-        
-        print(f"[DEBUG] admin_get_all_news: User {current_user_id} is an admin. Proceeding...", file=sys.stderr)
-        
         # 获取查询参数
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         search_query = request.args.get('search', '', type=str)
-        print(f"[DEBUG] admin_get_all_news: Params - page={page}, per_page={per_page}, search='{search_query}'", file=sys.stderr)
         
         # 构建基础查询
         query = NewsArticle.query
@@ -145,7 +144,8 @@ def admin_get_all_news():
         pagination = query.order_by(NewsArticle.publish_date.desc()) \
                           .paginate(page=page, per_page=per_page, error_out=False)
                           
-        print(f"[DEBUG] admin_get_all_news: Pagination total items: {pagination.total}", file=sys.stderr)
+        log.debug("admin news list", extra={'user_id': g.current_user_id, 'page': page, 'per_page': per_page,
+                                            'search': search_query, 'total': pagination.total})
         
         # 准备返回数据
         articles_data = [
@@ -159,7 +159,6 @@ def admin_get_all_news():
             } for article in pagination.items
         ]
         
-        print("--- EXITING admin_get_all_news (Success) ---", file=sys.stderr)
         return jsonify({
             'articles': articles_data,
             'total_pages': pagination.pages,
@@ -168,22 +167,14 @@ def admin_get_all_news():
         })
         
     except Exception as e:
-        # 捕获任何潜在的异常并打印详细信息
-        print(f"[FATAL] Exception in admin_get_all_news: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        # 捕获任何潜在的异常并记录堆栈
+        log.exception("admin news list failed")
         return jsonify({"error": "服务器内部错误"}), 500
 
 # 管理员 API 路由 - 获取单篇文章详情（草稿也可以）
 @news_bp.route('/admin/news/<int:article_id>', methods=['GET'])
-@jwt_required()
+@admin_required
 def admin_get_news_detail(article_id):
-    # 检查用户权限
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user or not user.is_admin:
-        return jsonify({"error": "权限不足"}), 403
-    
     # 查询文章
     article = NewsArticle.query.get_or_404(article_id)
     
@@ -202,14 +193,8 @@ def admin_get_news_detail(article_id):
 
 # 管理员 API 路由 - 更新文章
 @news_bp.route('/admin/news/<int:article_id>', methods=['PUT'])
-@jwt_required()
+@admin_required
 def admin_update_news(article_id):
-    # 检查用户权限
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user or not user.is_admin:
-        return jsonify({"error": "权限不足"}), 403
-    
     # 获取JSON数据
     data = request.get_json()
     if not data:
@@ -235,6 +220,7 @@ def admin_update_news(article_id):
     
     try:
         db.session.commit()
+        invalidate('news')
         # 返回更新后的文章数据
         return jsonify({
             'id': article.id,
@@ -249,20 +235,15 @@ def admin_update_news(article_id):
 
 # 管理员 API 路由 - 删除文章
 @news_bp.route('/admin/news/<int:article_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required
 def admin_delete_news(article_id):
-    # 检查用户权限
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user or not user.is_admin:
-        return jsonify({"error": "权限不足"}), 403
-    
     # 查询文章
     article = NewsArticle.query.get_or_404(article_id)
     
     try:
         db.session.delete(article)
         db.session.commit()
+        invalidate('news')
         return jsonify({"message": "文章已成功删除"})
     except Exception as e:
         db.session.rollback()
@@ -270,14 +251,8 @@ def admin_delete_news(article_id):
 
 # 管理员 API 路由 - 切换文章发布状态
 @news_bp.route('/admin/news/<int:article_id>/toggle-publish', methods=['PUT'])
-@jwt_required()
+@admin_required
 def admin_toggle_publish_status(article_id):
-    # 检查用户权限
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user or not user.is_admin:
-        return jsonify({"error": "权限不足"}), 403
-    
     # 查询文章
     article = NewsArticle.query.get_or_404(article_id)
     
@@ -286,6 +261,7 @@ def admin_toggle_publish_status(article_id):
     
     try:
         db.session.commit()
+        invalidate('news')
         status_msg = "已发布" if article.is_published else "已设为草稿"
         return jsonify({
             "message": f"文章{status_msg}",
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+密码哈希模块 - 把 scrypt / pbkdf2 计算放到有界进程池中执行
+
+- 哈希是纯 CPU 计算，在请求线程中同步执行会长期占用 GIL，登录高峰时拖慢同一 worker 的其他请求；
+  放到子进程后请求线程只是等待结果，其余线程可以继续处理请求
+- PASSWORD_HASH_MAX_CONCURRENCY 限制同时排队/计算的哈希数量，超过后在 PASSWORD_HASH_TIMEOUT
+  秒内（等名额与等结果合计）拿不到计算结果即抛出 PasswordHasherBusy，由路由返回 503，避免登录风暴无限堆积；
+  名额在子进程中的任务结束后才归还
+- PASSWORD_HASH_WORKERS=0 时在当前线程同步计算（测试、脚本或单核环境）
+- 登录成功后 needs_rehash() 判断已存储哈希的算法参数是否落后于 PASSWORD_HASH_METHOD，落后则透明重算
+
+环境变量 / app.config：PASSWORD_HASH_METHOD、PASSWORD_HASH_WORKERS、
+PASSWORD_HASH_MAX_CONCURRENCY、PASSWORD_HASH_TIMEOUT
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt'
+
+
+class PasswordHasherBusy(Exception):
+    """等待哈希名额超时"""
+
+
+def normalize_method(method):
+    """把 'scrypt' / 'pbkdf2' 等简写展开为 werkzeug 写入哈希前缀的完整参数串"""
+    parts = method.split(':')
+    if parts[0] == 'scrypt':
+        n, r, p = (parts[1:] + ['32768', '8', '1'][len(parts) - 1:])[:3]
+        return f'scrypt:{n}:{r}:{p}'
+    if parts[0] == 'pbkdf2':
+        hash_name = parts[1] if len(parts) > 1 else 'sha256'
+        iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+class PasswordHasher:
+    """带并发上限的密码哈希执行器，进程池在首次使用时按进程创建"""
+
+    def __init__(self, method=DEFAULT_METHOD, workers=0, max_concurrency=None, timeout=10.0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency or max(workers, 1) * 4)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        # gunicorn 在 fork 之后才会用到进程池，按 pid 判断避免复用父进程的池
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        # 等名额与等结果共用一个超时：单次调用最多等待 timeout 秒，而不是各等一遍
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # 名额在任务结束时才归还：等待超时后任务仍在子进程中计算，提前归还会让排队的哈希越积越多
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            raise PasswordHasherBusy() from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return bool(pwhash) and pwhash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _setting(app, key, default):
+    if key in app.config:
+        return app.config[key]
+    return os.getenv(key, default)
+
+
+def init_password_hashing(app):
+    """按配置为应用创建密码哈希执行器"""
+    workers = int(_setting(app, 'PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+    max_concurrency = _setting(app, 'PASSWORD_HASH_MAX_CONCURRENCY', None)
+    hasher = PasswordHasher(
+        method=_setting(app, 'PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=workers,
+        max_concurrency=int(max_concurrency) if max_concurrency else None,
+        timeout=float(_setting(app, 'PASSWORD_HASH_TIMEOUT', 10)),
+    )
+    app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+# 未初始化的应用（脚本、迁移）使用同步执行器
+_inline_hasher = PasswordHasher()
+
+
+def get_hasher():
+    if has_app_context():
+        return current_app.extensions.get('password_hasher', _inline_hasher)
+    return _inline_hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def verify_password(pwhash, password):
+    return get_hasher().verify(pwhash, password)
+
+
+def needs_rehash(pwhash):
+    return get_hasher().needs_rehash(pwhash)
@@ -5,19 +5,54 @@
 """
 
 import os
+import base64
+import threading
+import time
 from flask import Blueprint, jsonify, request, current_app
 from werkzeug.utils import secure_filename
-from sqlalchemy.orm import joinedload
+from sqlalchemy import and_, or_, cast, func, select
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import re
 from unicodedata import normalize
 from datetime import datetime
 
-from models import db, Product, ProductStock, StockLog, ProductCategory
+from models import db, Product, ProductStock, StockLog, ProductCategory, ProductCategoryClosure
+from product_serializer import DEFAULT_FIELDS, compile_fields, parse_fields
+from response_cache import cached_response, invalidate
+from conditional import conditional_get
+from static_files import save_upload, upload_path
+from image_pipeline import image_files, image_original, merge_images, schedule_product_images, strip_upload_metadata
+import stock_engine
+import stock_reservations
+import stock_shards
+from utils.auth import admin_required
 
 # 创建产品蓝图
 product_bp = Blueprint('product_api', __name__, url_prefix='/api/products')
 
+# 列表分页参数
+PRODUCT_PAGE_DEFAULT_LIMIT = 20
+PRODUCT_PAGE_MAX_LIMIT = 100
+# 产品总数缓存有效期（秒），写操作会主动失效
+PRODUCT_COUNT_TTL = 60
+
+# 写操作加载完整实体时共用的预加载策略：库存、分类走 JOIN，标签走 SELECT ... IN。
+# 只读接口改用序列化计划 (product_serializer) 生成的加载选项，仅加载所需的列与关系，
+# 两者都保证序列化时不会按行触发懒加载，语句数与返回的产品数量无关
+PRODUCT_LOAD_OPTIONS = (
+    joinedload(Product.stock),
+    joinedload(Product.category),
+    selectinload(Product.tags),
+)
+
+# 默认字段的序列化计划
+DEFAULT_PLAN = compile_fields(DEFAULT_FIELDS)
+
+# 按筛选条件缓存的产品总数: {filter_key: (total, expires_at)}
+_product_count_cache = {}
+_product_count_lock = threading.Lock()
+
 # --- Helper Functions --- 
 
 def _slugify(text: str) -> str:
@@ -29,51 +64,119 @@ def _slugify(text: str) -> str:
     return text or 'product'
 
 def _save_uploaded_images(files, product_name: str):
-    """保存上传的图片文件"""
+    """保存上传的图片文件，文件名为 <slug>_<内容哈希>，可长期缓存（见 static_files.py）"""
     saved_paths = []
     upload_dir = current_app.config['PRODUCT_IMG_DIR']
     slug = _slugify(product_name)
     allowed_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
 
-    for idx, file in enumerate(files, start=1):
+    for file in files:
         if file and file.filename:
             filename = secure_filename(file.filename)
             ext = os.path.splitext(filename)[1].lower()
             if ext not in allowed_extensions:
                 current_app.logger.warning(f"Skipping file with disallowed extension: {filename}")
                 continue
-            
-            # 生成安全且唯一的文件名
-            unique_filename = f"{slug}_{idx}{ext}"
-            save_path = os.path.join(upload_dir, unique_filename)
-            
-            # 处理潜在的文件名冲突
-            counter = 1
-            while os.path.exists(save_path):
-                unique_filename = f"{slug}_{idx}_{counter}{ext}"
-                save_path = os.path.join(upload_dir, unique_filename)
-                counter += 1
-                
+
             try:
-                file.save(save_path)
+                # 原图公开访问，先去除 EXIF 等元数据；相同内容得到相同文件名，已存在时不重复写入
+                unique_filename = save_upload(strip_upload_metadata(file), upload_dir, slug, ext)
                 # 返回相对于 UPLOADS_DIR 的路径，供前端访问
-                relative_path = os.path.join('uploads', 'products', unique_filename).replace('\\', '/') # 保证斜杠方向
-                saved_paths.append(f"/{relative_path}")
+                relative_path = f"uploads/products/{unique_filename}"
+                if f"/{relative_path}" not in saved_paths:
+                    saved_paths.append(f"/{relative_path}")
             except Exception as e:
-                current_app.logger.error(f"Error saving file {unique_filename}: {e}")
+                current_app.logger.error(f"Error saving file {filename}: {e}")
                 # 可以选择抛出异常或跳过此文件
     return saved_paths
 
-def _log_stock_change(product_id, change_type, change_amount, order_id=None, admin_id=None, remark=None):
-    """记录库存变动日志"""
+def _image_in_use(img_path: str) -> bool:
+    """是否还有产品引用该图片路径（JSON 列按文本匹配）"""
+    return db.session.query(
+        Product.query.filter(cast(Product.images, db.Text).contains(f'"{img_path}"')).exists()
+    ).scalar()
+
+def _encode_cursor(created_at, product_id) -> str:
+    """将 (created_at, id) 编码为不透明的分页游标"""
+    raw = f"{created_at.isoformat() if created_at else ''}|{product_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor: str):
+    """解析分页游标，返回 (created_at, id)；格式错误时抛出 ValueError"""
     try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_str, id_str = raw.rsplit('|', 1)
+        created_at = datetime.fromisoformat(created_str) if created_str else None
+        return created_at, int(id_str)
+    except (ValueError, UnicodeError, TypeError) as e:
+        raise ValueError("无效的分页游标") from e
+
+def _keyset_filter(created_at, product_id):
+    """构造 (created_at DESC NULLS LAST, id DESC) 排序下“位于游标之后”的条件"""
+    if created_at is None:
+        return and_(Product.created_at.is_(None), Product.id < product_id)
+    return or_(
+        Product.created_at < created_at,
+        and_(Product.created_at == created_at, Product.id < product_id),
+        Product.created_at.is_(None),
+    )
+
+def _category_subtree_filter(category):
+    """按分类 id 或 slug 筛选产品，包含全部后代分类（借助闭包表，单条子查询完成）"""
+    descendants = select(ProductCategoryClosure.descendant_id)
+    if category.isdigit():
+        descendants = descendants.where(ProductCategoryClosure.ancestor_id == int(category))
+    else:
+        descendants = descendants.join(
+            ProductCategory, ProductCategory.id == ProductCategoryClosure.ancestor_id
+        ).where(ProductCategory.slug == category)
+    return Product.category_id.in_(descendants)
+
+def _get_product_total(filter_key, filters):
+    """获取符合筛选条件的产品总数，优先读取进程内缓存，避免每次请求都执行 COUNT(*)"""
+    now = time.monotonic()
+    with _product_count_lock:
+        cached = _product_count_cache.get(filter_key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    total = db.session.query(func.count(Product.id)).filter(*filters).scalar() or 0
+
+    with _product_count_lock:
+        _product_count_cache[filter_key] = (total, now + PRODUCT_COUNT_TTL)
+    return total
+
+def _load_product(pid, options=PRODUCT_LOAD_OPTIONS):
+    """按主键加载产品，默认一次性预加载库存、分类与标签"""
+    return db.session.get(Product, pid, options=options, populate_existing=True)
+
+def _invalidate_product_count():
+    """产品增删改后清空总数缓存"""
+    with _product_count_lock:
+        _product_count_cache.clear()
+
+def _invalidate_product_caches():
+    """产品或库存变更后清空总数缓存与产品接口的响应缓存"""
+    _invalidate_product_count()
+    invalidate('products')
+
+def _log_stock_change(product_id, change_type, change_amount, order_id=None, admin_id=None, remark=None,
+                      before=None, after=None):
+    """记录库存变动日志；before / after 为变动前后的 (总库存, 可用库存, 预扣库存)"""
+    try:
+        before = before or (None, None, None)
+        after = after or (None, None, None)
         log_entry = StockLog(
             product_id=product_id,
             change_type=change_type,
             change_amount=change_amount,
             order_id=order_id,
             admin_id=admin_id,
-            remark=remark
+            remark=remark,
+            operation_type='admin_adjust',
+            before_total=before[0], before_available=before[1], before_prelock=before[2],
+            after_total=after[0], after_available=after[1], after_prelock=after[2],
         )
         db.session.add(log_entry)
         # 注意：这里不 commit，由调用者负责事务提交
@@ -84,93 +187,65 @@ def _log_stock_change(product_id, change_type, change_amount, order_id=None, adm
 # --- 库存操作核心逻辑 (内部函数, 后续集成到订单流程) ---
 
 def _prelock_stock(product_id, quantity, order_id=None):
-    """下单预扣库存 (悲观锁模拟)
-    注意：SQLite 的并发锁机制有限，这里的 for_update 效果不如 MySQL/PostgreSQL。
-    在高并发场景下，需要更健壮的机制或切换数据库。
-    """
-    if quantity <= 0:
-        return False, "数量必须为正数"
-
+    """下单预扣库存（单条条件 UPDATE，见 stock_engine.prelock）；带订单号时记录预扣过期时间，超时由清扫释放"""
     try:
-        stock = ProductStock.query.with_for_update().filter_by(product_id=product_id).first()
-        
-        if not stock:
-            return False, "库存记录不存在"
-            
-        if stock.available_stock < quantity:
-            return False, "可用库存不足"
-            
-        stock.available_stock -= quantity
-        stock.prelock_stock += quantity
-        
-        _log_stock_change(product_id, 1, -quantity, order_id=order_id, remark=f"订单 {order_id} 预扣")
-        
+        if order_id is None:
+            result = stock_engine.prelock(product_id, quantity)
+        else:
+            result = stock_reservations.hold([(product_id, quantity)], order_id=order_id)
         # 由调用者 commit
-        return True, "预扣成功"
-        
-    except Exception as e:
+        return result.ok, result.message
+    except SQLAlchemyError as e:
         db.session.rollback()
         current_app.logger.error(f"Prelock stock failed for product {product_id}: {e}")
         return False, "库存操作失败，请重试"
 
-def _confirm_stock_deduction(product_id, quantity, order_id=None):
-    """支付成功，确认扣减库存"""
-    if quantity <= 0:
-        return False, "数量必须为正数"
+def _settle_reservation(settle, product_id, order_id):
+    """按订单号处理预扣记录；返回 None 表示该订单没有预扣记录（记录过期时间之前的预扣），由调用者直接操作库存"""
+    result = settle(order_id, [product_id])
+    if result.ok:
+        return result
+    statuses = stock_reservations.reservation_statuses(order_id, product_id)
+    if not statuses:
+        return None
+    if stock_reservations.STATUS_HELD in statuses:
+        return result
+    if stock_reservations.STATUS_CONFIRMED in statuses:
+        return result._replace(message="预扣已确认")
+    if stock_reservations.STATUS_EXPIRED in statuses:
+        return result._replace(message="预扣已超时释放")
+    return result._replace(message="预扣已释放")
 
+def _confirm_stock_deduction(product_id, quantity, order_id=None):
+    """支付成功，确认扣减库存（见 stock_engine.confirm）；带订单号时以预扣记录中的数量为准"""
     try:
-        stock = ProductStock.query.with_for_update().filter_by(product_id=product_id).first()
-        
-        if not stock:
-            return False, "库存记录不存在"
-            
-        if stock.prelock_stock < quantity:
-            # 预扣库存不足，可能流程有问题或数据不一致
-            current_app.logger.warning(f"Confirm stock deduction issue: prelock stock {stock.prelock_stock} < requested {quantity} for product {product_id}")
-            # 尝试直接扣减总库存和可用库存作为补偿？或者报错？ - 暂时报错
-            return False, "预扣库存异常"
-            
-        stock.prelock_stock -= quantity
-        stock.total_stock -= quantity
-        
-        _log_stock_change(product_id, 2, -quantity, order_id=order_id, remark=f"订单 {order_id} 支付确认")
-        
+        result = None
+        if order_id is not None:
+            result = _settle_reservation(stock_reservations.confirm, product_id, order_id)
+        if result is None:
+            result = stock_engine.confirm(product_id, quantity, order_id=order_id)
         # 由调用者 commit
-        return True, "确认扣减成功"
-        
-    except Exception as e:
+        return result.ok, result.message
+    except SQLAlchemyError as e:
         db.session.rollback()
         current_app.logger.error(f"Confirm stock deduction failed for product {product_id}: {e}")
         return False, "库存操作失败，请重试"
 
 def _release_stock(product_id, quantity, order_id=None, remark="释放库存"):
-    """订单取消/超时/退款，释放预扣库存"""
-    if quantity <= 0:
-        return False, "数量必须为正数"
-
+    """订单取消/超时/退款，释放预扣库存（见 stock_engine.release）；预扣已被确认或超时释放时不重复释放"""
     try:
-        stock = ProductStock.query.with_for_update().filter_by(product_id=product_id).first()
-        
-        if not stock:
-            return False, "库存记录不存在"
-            
-        if stock.prelock_stock < quantity:
-             current_app.logger.warning(f"Release stock issue: prelock stock {stock.prelock_stock} < requested {quantity} for product {product_id}")
-             # 预扣量不足，可能重复释放或流程错误，只释放存在的预扣量
-             actual_release_quantity = stock.prelock_stock
-        else:
-                        actual_release_quantity = quantity
-
-        if actual_release_quantity > 0:
-            stock.prelock_stock -= actual_release_quantity
-            stock.available_stock += actual_release_quantity
-        
-            _log_stock_change(product_id, 3, actual_release_quantity, order_id=order_id, remark=remark)
-        
+        result = None
+        if order_id is not None:
+            result = _settle_reservation(
+                lambda oid, pids: stock_reservations.release(oid, pids, remark=remark), product_id, order_id)
+            if result is not None and result.message in ("预扣已超时释放", "预扣已释放"):
+                # 重复取消或清扫已释放：库存已经退回，视为成功
+                return True, result.message
+        if result is None:
+            result = stock_engine.release(product_id, quantity, order_id=order_id, remark=remark)
         # 由调用者 commit
-        return True, "释放成功"
-        
-    except Exception as e:
+        return result.ok, result.message
+    except SQLAlchemyError as e:
         db.session.rollback()
         current_app.logger.error(f"Release stock failed for product {product_id}: {e}")
         return False, "库存操作失败，请重试"
@@ -178,73 +253,101 @@ def _release_stock(product_id, quantity, order_id=None, remark="释放库存"):
 # --- API Routes --- 
 
 @product_bp.route('', methods=['GET'])
+@conditional_get()  # 库存变动不会更新 product.updated_at，按响应体哈希生成 ETag
+@cached_response('products', ttl=30)
 def get_products():
-    """获取产品列表，包含库存信息，支持筛选"""
+    """获取产品列表，包含库存信息，支持筛选
+
+    传入 limit 或 cursor 参数时启用游标分页（按 created_at, id 降序的 keyset 分页），
+    响应中附带 next_cursor、has_more 与缓存的 total；否则保持旧版全量返回。
+    category 参数接受分类 id 或 slug，结果包含该分类及其全部子孙分类下的产品。
+    fields 参数（如 fields=id,name,price,images）可只返回指定字段，
+    未请求库存字段时不会 JOIN 库存表。
+    """
     category = request.args.get('category')
     featured = request.args.get('featured')
-    # 可以添加分页参数 page, per_page
-    
-    query = Product.query.options(joinedload(Product.stock))
-    
+    cursor = request.args.get('cursor')
+    limit_str = request.args.get('limit')
+    paginate = cursor is not None or limit_str is not None
+
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # 游标需要 created_at，分页时总是加载该列
+    plan = compile_fields(fields, ('created_at',) if paginate else ())
+
+    filters = []
     if category:
-        query = query.filter(Product.category == category)
+        filters.append(_category_subtree_filter(category))
     if featured and featured.lower() == 'true':
-        query = query.filter(Product.is_featured == True)
-        
-    # 添加排序，例如按创建时间降序
-    query = query.order_by(Product.created_at.desc())
-    
-    # 执行查询
-    products_db = query.all()
+        filters.append(Product.is_featured == True)
+
+    query = Product.query.options(*plan.load_options).filter(*filters)
+
+    # 添加排序，按创建时间降序，id 作为同一时间下的稳定次序
+    query = query.order_by(Product.created_at.desc().nulls_last(), Product.id.desc())
+
+    if paginate:
+        try:
+            limit = int(limit_str) if limit_str is not None else PRODUCT_PAGE_DEFAULT_LIMIT
+        except (ValueError, TypeError):
+            return jsonify({"error": "limit 必须是有效的整数"}), 400
+        if limit <= 0:
+            return jsonify({"error": "limit 必须为正整数"}), 400
+        limit = min(limit, PRODUCT_PAGE_MAX_LIMIT)
+
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = _decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            query = query.filter(_keyset_filter(cursor_created_at, cursor_id))
+
+        # 多取一条用于判断是否还有下一页
+        products_db = query.limit(limit + 1).all()
+        has_more = len(products_db) > limit
+        products_db = products_db[:limit]
+    else:
+        # 执行查询
+        products_db = query.all()
     
     # 格式化输出
-    products_list = []
-    for p in products_db:
-        stock_info = p.stock
-        products_list.append({
-            "id": p.id,
-            "name": p.name,
-            "description": p.description,
-            "price": p.price,
-            "category_id": p.category_id,
-            "category_name": p.category.name if p.category else None,
-            "images": p.images or [],
-            "is_featured": p.is_featured,
-            "warning_stock": p.warning_stock,
-            "total_stock": stock_info.total_stock if stock_info else 0,
-            "available_stock": stock_info.available_stock if stock_info else 0,
-            "prelock_stock": stock_info.prelock_stock if stock_info else 0,
-            "created_at": p.created_at.isoformat() if p.created_at else None,
-            "updated_at": p.updated_at.isoformat() if p.updated_at else None
-        })
-        
-    return jsonify({"products": products_list})
+    products_list = [plan.serialize(p) for p in products_db]
+
+    if not paginate:
+        return jsonify({"products": products_list})
+
+    filter_key = (category or '', bool(featured and featured.lower() == 'true'))
+    next_cursor = None
+    if has_more and products_db:
+        last = products_db[-1]
+        next_cursor = _encode_cursor(last.created_at, last.id)
+
+    return jsonify({
+        "products": products_list,
+        "total": _get_product_total(filter_key, filters),
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": next_cursor
+    })
 
 @product_bp.route('/<int:pid>', methods=['GET'])
+@conditional_get()
+@cached_response('products', ttl=60)
 def get_product_detail(pid: int):
     """获取单个产品详情，包含库存信息"""
-    product = Product.query.options(joinedload(Product.stock)).get(pid)
+    try:
+        plan = compile_fields(parse_fields(request.args.get('fields')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    product = _load_product(pid, plan.load_options)
     
     if not product:
         return jsonify({"error": "产品不存在"}), 404
         
-    stock_info = product.stock
-    product_data = {
-        "id": product.id,
-        "name": product.name,
-        "description": product.description,
-        "price": product.price,
-        "category_id": product.category_id,
-        "category_name": product.category.name if product.category else None,
-        "images": product.images or [],
-        "is_featured": product.is_featured,
-        "warning_stock": product.warning_stock,
-        "total_stock": stock_info.total_stock if stock_info else 0,
-        "available_stock": stock_info.available_stock if stock_info else 0,
-        "prelock_stock": stock_info.prelock_stock if stock_info else 0,
-        "created_at": product.created_at.isoformat() if product.created_at else None,
-        "updated_at": product.updated_at.isoformat() if product.updated_at else None
-    }
+    product_data = plan.serialize(product)
     return jsonify({"product": product_data})
 
 @product_bp.route('', methods=['POST'])
@@ -304,9 +407,9 @@ def add_product():
         # 处理图片上传
         image_paths = []
         if 'images' in request.files:
-            image_files = request.files.getlist('images')
-            if image_files and any(f.filename for f in image_files):
-                image_paths = _save_uploaded_images(image_files, name)
+            uploaded = request.files.getlist('images')
+            if uploaded and any(f.filename for f in uploaded):
+                image_paths = _save_uploaded_images(uploaded, name)
 
         # 创建产品实例
         new_product = Product(
@@ -334,28 +437,19 @@ def add_product():
         # 提交事务
         db.session.commit()
         
+        _invalidate_product_caches()
+        
         # 记录初始库存日志 (可选)
-        _log_stock_change(new_product.id, 4, total_stock, remark="产品创建，初始化库存")
+        _log_stock_change(new_product.id, 4, total_stock, remark="产品创建，初始化库存",
+                          before=(0, 0, 0), after=(total_stock, total_stock, 0))
         db.session.commit() # 提交日志
+
+        # 缩略图在后台生成，完成后写回 images（见 image_pipeline.py）
+        schedule_product_images(new_product.id, image_paths)
         
-        # 返回成功信息和新产品数据
-        stock_info = new_product.stock
-        product_data = {
-            "id": new_product.id,
-            "name": new_product.name,
-            "description": new_product.description,
-            "price": new_product.price,
-            "category_id": new_product.category_id,
-            "category_name": new_product.category.name if new_product.category else None,
-            "images": new_product.images or [],
-            "is_featured": new_product.is_featured,
-            "warning_stock": new_product.warning_stock,
-            "total_stock": stock_info.total_stock if stock_info else 0,
-            "available_stock": stock_info.available_stock if stock_info else 0,
-            "prelock_stock": stock_info.prelock_stock if stock_info else 0,
-            "created_at": new_product.created_at.isoformat() if new_product.created_at else None,
-            "updated_at": new_product.updated_at.isoformat() if new_product.updated_at else None
-        }
+        # 返回成功信息和新产品数据 (commit 后对象已过期，按统一策略重新加载)
+        new_product = _load_product(new_product.id)
+        product_data = DEFAULT_PLAN.serialize(new_product)
         return jsonify({"message": "产品添加成功", "product": product_data}), 201
         
     except IntegrityError as e:
@@ -370,7 +464,7 @@ def add_product():
 @product_bp.route('/<int:pid>', methods=['POST', 'PUT']) # 支持 POST 或 PUT 更新
 def update_product(pid):
     """更新现有产品及其库存信息"""
-    product = Product.query.options(joinedload(Product.stock)).get(pid)
+    product = _load_product(pid)
     if not product:
         return jsonify({"error": "产品不存在"}), 404
     
@@ -403,15 +497,19 @@ def update_product(pid):
         
         new_total_stock = None
         diff_total_stock = 0 # 总库存变动量
+        read_total_stock = 0 # 计算变动量时读到的总库存，更新时据此判断期间是否被修改
         if total_stock_str is not None:
             try:
                 new_total_stock = int(total_stock_str)
                 if new_total_stock < 0: raise ValueError("总库存不能为负数")
+                if product.stock and product.stock.shard_count:
+                    return jsonify({"error": "该产品已开启分片库存，请通过库存调整接口修改库存"}), 409
                 if product.stock:
                      # 计算总库存变动量，用于调整可用库存
                     if new_total_stock < product.stock.prelock_stock:
                          return jsonify({"error": f"总库存 ({new_total_stock}) 不能小于当前的预扣库存 ({product.stock.prelock_stock})"}), 400
-                    diff_total_stock = new_total_stock - product.stock.total_stock
+                    read_total_stock = product.stock.total_stock
+                    diff_total_stock = new_total_stock - read_total_stock
                 else:
                     # 如果之前没有库存记录，相当于初始化
                     diff_total_stock = new_total_stock
@@ -439,60 +537,34 @@ def update_product(pid):
         product.warning_stock = warning_stock
         product.is_featured = is_featured
 
+        # 更新库存信息：总库存变动量交给库存引擎（条件 UPDATE 同时调整可用库存，并在同一事务中写库存日志），
+        # 读取之后并发的预扣/确认不会被覆盖；变动量按读到的总库存算出，总库存期间被修改过时不生效，返回 409；
+        # 没有库存记录时由引擎创建
+        if diff_total_stock:
+            result = stock_engine.adjust(pid, diff_total_stock, remark="后台修改总库存", admin_id=None,
+                                         expected_total=read_total_stock)
+            if not result.ok:
+                db.session.rollback()
+                return jsonify({"error": result.message}), 409
+
         # 处理图片上传 (追加)
+        added_images = []
         if 'images' in request.files:
-            image_files = request.files.getlist('images')
-            if image_files and any(f.filename for f in image_files):
-                new_image_paths = _save_uploaded_images(image_files, name)
-                if not product.images:
-                    product.images = []
-                # 合并并去重 (如果需要)
-                product.images = list(dict.fromkeys(product.images + new_image_paths)) # 简单去重
+            uploaded = request.files.getlist('images')
+            if uploaded and any(f.filename for f in uploaded):
+                new_image_paths = _save_uploaded_images(uploaded, name)
+                # 合并并去重：相同内容的图片文件名相同
+                product.images, added_images = merge_images(product.images, new_image_paths)
         
-        # 更新库存信息
-        stock_changed = False
-        if new_total_stock is not None:
-            stock = product.stock
-            if not stock:
-                # 如果没有库存记录，则创建
-                stock = ProductStock(product_id=pid, total_stock=new_total_stock, available_stock=new_total_stock, prelock_stock=0)
-                product.stock = stock
-                db.session.add(stock) # 需要显式添加，因为它不是通过 product cascade 创建的
-            else:
-                stock.total_stock = new_total_stock
-                # 调整可用库存：可用库存增加量 = 总库存增加量
-                # 需确保 available_stock 不会变成负数
-                stock.available_stock = max(0, stock.available_stock + diff_total_stock)
-            stock_changed = True
-            
         # 提交事务
         db.session.commit()
-        
-        # 记录库存变动日志 (如果后台修改了库存)
-        if stock_changed and diff_total_stock != 0:
-            # 假设由管理员操作，需要获取管理员ID
-            # admin_id = get_current_user().id # 示例
-            _log_stock_change(pid, 4, diff_total_stock, admin_id=None, remark="后台修改总库存")
-            db.session.commit() # 提交日志
-
-        # 返回更新后的产品数据
-        stock_info = product.stock
-        product_data = {
-            "id": product.id,
-            "name": product.name,
-            "description": product.description,
-            "price": product.price,
-            "category_id": product.category_id,
-            "category_name": product.category.name if product.category else None,
-            "images": product.images or [],
-            "is_featured": product.is_featured,
-            "warning_stock": product.warning_stock,
-            "total_stock": stock_info.total_stock if stock_info else 0,
-            "available_stock": stock_info.available_stock if stock_info else 0,
-            "prelock_stock": stock_info.prelock_stock if stock_info else 0,
-            "created_at": product.created_at.isoformat() if product.created_at else None,
-            "updated_at": product.updated_at.isoformat() if product.updated_at else None
-        }
+        _invalidate_product_caches() # 分类/精选状态可能改变
+
+        schedule_product_images(pid, added_images)
+
+        # 返回更新后的产品数据 (commit 后对象已过期，按统一策略重新加载)
+        product = _load_product(pid)
+        product_data = DEFAULT_PLAN.serialize(product)
         return jsonify({"message": "产品更新成功", "product": product_data})
         
     except IntegrityError as e:
@@ -519,20 +591,24 @@ def delete_product(pid):
         
         db.session.delete(product)
         db.session.commit()
+        _invalidate_product_caches()
         
         # 删除关联的图片文件 (可选，但建议做)
         if product.images:
             upload_dir = current_app.config['UPLOADS_DIR']
-            for img_path in product.images:
-                try:
-                    # 移除开头的斜杠，并构建绝对路径
-                    relative_path = img_path.lstrip('/') 
-                    abs_path = os.path.join(upload_dir, os.path.dirname(relative_path) ,os.path.basename(relative_path))
-                    if os.path.exists(abs_path):
-                        os.remove(abs_path)
-                        current_app.logger.info(f"Deleted image file: {abs_path}")
-                except Exception as e:
-                    current_app.logger.error(f"Error deleting image file {img_path}: {e}")
+            for entry in product.images:
+                # 按内容命名的图片可能被其他产品共用
+                if _image_in_use(image_original(entry)):
+                    continue
+                # 原图与各尺寸缩略图
+                for img_path in image_files(entry):
+                    try:
+                        abs_path = upload_path(img_path, upload_dir)
+                        if abs_path and os.path.exists(abs_path):
+                            os.remove(abs_path)
+                            current_app.logger.info(f"Deleted image file: {abs_path}")
+                    except Exception as e:
+                        current_app.logger.error(f"Error deleting image file {img_path}: {e}")
         
         return jsonify({"message": "产品已删除"})
         
@@ -541,7 +617,16 @@ def delete_product(pid):
         current_app.logger.error(f"Error deleting product {pid}: {e}", exc_info=True)
         return jsonify({"error": f"删除产品失败: {str(e)}"}), 500
 
+def _categories_version():
+    """分类列表版本：启用分类的数量与最近更新时间"""
+    count, last_modified = db.session.query(
+        func.count(ProductCategory.id), func.max(ProductCategory.updated_at)
+    ).filter(ProductCategory.is_active == True).one()
+    return f"{count}|{last_modified}", last_modified
+
 @product_bp.route('/categories', methods=['GET'])
+@conditional_get(_categories_version)
+@cached_response('categories', ttl=300)
 def get_categories():
     """获取所有产品分类 (从数据库获取)"""
     try:
@@ -565,7 +650,38 @@ def get_categories():
         return jsonify({"error": "获取分类失败"}), 500
 
 # 库存调整API
-@product_bp.route('/products/<int:product_id>/adjust-stock', methods=['POST'])
+@product_bp.route('/<int:product_id>/stock-shards', methods=['PUT'])
+@admin_required
+def set_product_stock_shards(product_id):
+    """
+    开启/调整/关闭产品的分片库存模式（秒杀、促销热点商品）
+    参数:
+    - shards: 分片数，0 表示合并回单行库存
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        ok, message = stock_shards.set_shard_count(product_id, data.get('shards'))
+        if not ok:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': message}), 404 if message == "库存记录不存在" else 400
+        db.session.commit()
+        _invalidate_product_caches()
+        stock = ProductStock.query.filter_by(product_id=product_id).one()
+        total, available, prelock = stock.counts()
+        return jsonify({
+            'success': True,
+            'message': message,
+            'data': {
+                'product_id': product_id,
+                'shard_count': stock.shard_count,
+                'current_stock': {'total': total, 'available': available, 'prelock': prelock},
+            }
+        })
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'数据库错误: {str(e)}'}), 500
+
+@product_bp.route('/<int:product_id>/adjust-stock', methods=['POST'])
 def adjust_product_stock(product_id):
     """
     调整产品库存API
@@ -582,46 +698,18 @@ def adjust_product_stock(product_id):
         if not isinstance(adjust_total, int):
             return jsonify({'success': False, 'message': '库存调整值必须为整数'}), 400
             
-        # 查询产品及库存信息
-        product = Product.query.get(product_id)
-        if not product:
+        # 查询产品是否存在
+        if db.session.get(Product, product_id) is None:
             return jsonify({'success': False, 'message': '产品不存在'}), 404
             
-        # 获取当前库存记录
-        stock = ProductStock.query.filter_by(product_id=product_id).first()
-        if not stock:
-            # 如果不存在库存记录，创建新记录
-            stock = ProductStock(product_id=product_id, total_stock=0, available_stock=0, prelock_stock=0)
-            db.session.add(stock)
-            
-        # 记录调整前的库存状态
-        before_total = stock.total_stock
-        before_available = stock.available_stock
-        before_prelock = stock.prelock_stock
-        
-        # 调整库存 (总库存和可用库存同时调整)
-        # 验证调整后库存不能为负数
-        if stock.total_stock + adjust_total < 0:
-            return jsonify({'success': False, 'message': '库存不足，无法调整至负数'}), 400
-            
-        # 更新总库存和可用库存
-        stock.total_stock += adjust_total
-        stock.available_stock += adjust_total
-        
-        # 添加库存日志
-        stock_log = StockLog(
-            product_id=product_id,
-            change_type=4,  # 4: 后台修改
-            change_amount=adjust_total,
-            remark=remark,
-            operation_type='admin_adjust',
-            before_total=before_total,
-            before_available=before_available,
-            before_prelock=before_prelock
-        )
-        db.session.add(stock_log)
+        # 总库存和可用库存在一条条件 UPDATE 中同时调整，调整后不能为负数；库存日志在同一事务中写入
+        result = stock_engine.adjust(product_id, adjust_total, remark=remark)
+        if not result.ok:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': result.message}), 400
         
         db.session.commit()
+        _invalidate_product_caches()
         
         return jsonify({
             'success': True, 
@@ -629,9 +717,9 @@ def adjust_product_stock(product_id):
             'data': {
                 'product_id': product_id,
                 'current_stock': {
-                    'total': stock.total_stock,
-                    'available': stock.available_stock,
-                    'prelock': stock.prelock_stock
+                    'total': result.total,
+                    'available': result.available,
+                    'prelock': result.prelock
                 },
                 'adjustment': adjust_total
             }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+产品序列化模块 - 所有产品输出共用的字段表
+
+字段表在导入时构建，每种字段组合只编译一次（取值函数列表 + 查询加载选项），
+接口可通过 fields= 参数只取需要的字段，列表查询随之只加载需要的列和关系。
+"""
+
+from functools import lru_cache
+from operator import attrgetter
+
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+from image_pipeline import image_srcset, image_urls
+from models import Product, ProductCategory
+
+
+def _iso(getter):
+    def get(p):
+        value = getter(p)
+        return value.isoformat() if value else None
+    return get
+
+
+def _stock_attr(index):
+    """分片模式下库存为各分片之和（只有分片商品会额外加载分片行）"""
+    def get(p):
+        stock = p.stock
+        if not stock:
+            return 0
+        return stock.counts()[index]
+    return get
+
+
+def _category_name(p):
+    category = p.category
+    return category.name if category else None
+
+
+# 字段名 -> (取值函数, 依赖的 Product 列, 依赖的关系)
+_FIELD_SPECS = {
+    'id': (attrgetter('id'), ('id',), ()),
+    'name': (attrgetter('name'), ('name',), ()),
+    'slug': (attrgetter('slug'), ('slug',), ()),
+    'description': (attrgetter('description'), ('description',), ()),
+    'price': (lambda p: float(p.price), ('price',), ()),  # Numeric 为 Decimal，jsonify 会输出字符串
+    'category_id': (attrgetter('category_id'), ('category_id',), ()),
+    'category_name': (_category_name, ('category_id',), ('category',)),
+    'category': (_category_name, ('category_id',), ('category',)),  # Product.to_dict 使用的旧键名
+    'images': (lambda p: image_urls(p.images), ('images',), ()),
+    'image_srcset': (lambda p: image_srcset(p.images), ('images',), ()),  # 缩略图尺寸，见 image_pipeline.py
+    'is_featured': (attrgetter('is_featured'), ('is_featured',), ()),
+    'warning_stock': (attrgetter('warning_stock'), ('warning_stock',), ()),
+    'total_stock': (_stock_attr(0), (), ('stock',)),
+    'available_stock': (_stock_attr(1), (), ('stock',)),
+    'prelock_stock': (_stock_attr(2), (), ('stock',)),
+    'effective_stock': (attrgetter('effective_stock'), (), ('stock',)),
+    'stock_status': (attrgetter('stock_status'), ('warning_stock',), ('stock',)),
+    'tags': (lambda p: [t.name for t in p.tags], (), ('tags',)),
+    'created_at': (_iso(attrgetter('created_at')), ('created_at',), ()),
+    'updated_at': (_iso(attrgetter('updated_at')), ('updated_at',), ()),
+}
+
+ALL_FIELDS = frozenset(_FIELD_SPECS)
+
+# 接口默认输出的字段（保持与旧版返回结构一致）
+DEFAULT_FIELDS = (
+    'id', 'name', 'description', 'price', 'category_id', 'category_name', 'images',
+    'is_featured', 'warning_stock', 'total_stock', 'available_stock', 'prelock_stock',
+    'created_at', 'updated_at',
+)
+
+# Product.to_dict 输出的字段
+TO_DICT_FIELDS = (
+    'id', 'name', 'slug', 'description', 'price', 'created_at', 'updated_at',
+    'is_featured', 'images', 'warning_stock', 'category_id', 'category',
+)
+TO_DICT_STOCK_FIELDS = (
+    'total_stock', 'available_stock', 'prelock_stock', 'effective_stock', 'stock_status',
+)
+
+
+class SerializerPlan:
+    """一组字段的编译结果：按顺序的 (字段名, 取值函数) 以及对应的查询加载选项"""
+
+    __slots__ = ('fields', 'getters', 'columns', 'relations', 'load_options')
+
+    def __init__(self, fields, extra_columns=()):
+        self.fields = fields
+        self.getters = tuple((name, _FIELD_SPECS[name][0]) for name in fields)
+
+        columns = {'id', *extra_columns}
+        relations = set()
+        for name in fields:
+            _, cols, rels = _FIELD_SPECS[name]
+            columns.update(cols)
+            relations.update(rels)
+        if 'category' in relations:
+            columns.add('category_id')
+        self.columns = frozenset(columns)
+        self.relations = frozenset(relations)
+
+        options = [load_only(*(getattr(Product, c) for c in sorted(self.columns)))]
+        if 'stock' in relations:
+            options.append(joinedload(Product.stock))
+        if 'category' in relations:
+            options.append(joinedload(Product.category).load_only(ProductCategory.name))
+        if 'tags' in relations:
+            options.append(selectinload(Product.tags))
+        self.load_options = tuple(options)
+
+    def serialize(self, product):
+        return {name: get(product) for name, get in self.getters}
+
+
+@lru_cache(maxsize=64)
+def compile_fields(fields, extra_columns=()):
+    """编译字段组合（fields 为元组），结果按组合缓存"""
+    return SerializerPlan(fields, extra_columns)
+
+
+def parse_fields(raw):
+    """解析 fields= 查询参数，返回字段元组；未指定时返回默认字段；含未知字段时抛出 ValueError"""
+    if not raw:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in ALL_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    return fields or DEFAULT_FIELDS
+
+
+def serialize_product(product, fields=DEFAULT_FIELDS):
+    """按字段组合序列化单个产品"""
+    return compile_fields(tuple(fields)).serialize(product)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应缓存模块 - 公共只读接口的进程内缓存
+
+- 默认后端为带 TTL 的 LRU 缓存，按条目数和字节数双重限制内存占用
+- 每个接口通过 @cached_response(namespace, ttl) 声明自己的命名空间和有效期，
+  app.config['RESPONSE_CACHE_TTLS'] 可按命名空间覆盖有效期
+- 写接口调用 invalidate(namespace) 主动失效对应命名空间下的全部条目
+- 缓存是进程内的，多 worker 部署时其他 worker 依赖 TTL 过期，TTL 不宜设置过长
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+
+class CacheBackend(ABC):
+    """缓存后端接口，自定义后端（如 Redis）实现以下方法后传给 init_response_cache 即可"""
+
+    @abstractmethod
+    def get(self, key):
+        """命中时返回缓存值，未命中或已过期返回 None"""
+
+    @abstractmethod
+    def set(self, key, value, ttl, size=0):
+        """写入缓存，ttl 秒后过期；size 为值的字节数，用于内存限制"""
+
+    @abstractmethod
+    def delete_prefix(self, prefix):
+        """删除键以 prefix 开头的全部条目"""
+
+    @abstractmethod
+    def clear(self):
+        """清空缓存"""
+
+    def stats(self):
+        return {}
+
+
+class MemoryLRUCache(CacheBackend):
+    """线程安全的 TTL + LRU 内存缓存"""
+
+    def __init__(self, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl, size=0):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory-lru',
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+
+def init_response_cache(app, backend=None):
+    """为应用挂载缓存后端；未传入时按配置创建内存 LRU 缓存"""
+    app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+    app.config.setdefault('RESPONSE_CACHE_TTLS', {})
+    if backend is None:
+        backend = MemoryLRUCache(
+            max_entries=app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 512),
+            max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+        )
+    app.extensions['response_cache'] = backend
+    return backend
+
+
+def get_cache():
+    """当前应用的缓存后端，未初始化时返回 None"""
+    return current_app.extensions.get('response_cache')
+
+
+def _cache_key(namespace):
+    # 查询参数排序后参与键计算，参数顺序不同的同一请求共用一个条目
+    args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    return f'{namespace}:{request.path}?{args}'
+
+
+def cached_response(namespace, ttl=60):
+    """缓存 GET 接口的 200 响应体；命中时直接返回，不访问数据库"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if (cache is None or request.method != 'GET'
+                    or not current_app.config.get('RESPONSE_CACHE_ENABLED', True)):
+                return fn(*args, **kwargs)
+
+            key = _cache_key(namespace)
+            entry = cache.get(key)
+            if entry is not None:
+                body, status, mimetype = entry
+                response = current_app.response_class(body, status=status, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = current_app.make_response(fn(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                body = response.get_data()
+                effective_ttl = current_app.config['RESPONSE_CACHE_TTLS'].get(namespace, ttl)
+                cache.set(key, (body, response.status_code, response.mimetype), effective_ttl, size=len(body))
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate(*namespaces):
+    """失效一个或多个命名空间下的全部缓存条目"""
+    cache = get_cache()
+    if cache is None:
+        return
+    for namespace in namespaces:
+        cache.delete_prefix(f'{namespace}:')
+
+
+def cache_stats():
+    cache = get_cache()
+    return cache.stats() if cache is not None else {}
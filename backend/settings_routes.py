@@ -1,11 +1,13 @@
 from flask import Blueprint, jsonify, request, current_app
 import os
 import json
-from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from functools import wraps
 import re
 from unicodedata import normalize
+from datetime import datetime, timezone
+from conditional import conditional_get
+from static_files import save_upload
+from utils.auth import admin_required
 
 # 创建蓝图
 settings_bp = Blueprint('settings', __name__, url_prefix='/api/settings')
@@ -18,9 +20,8 @@ def get_settings_path():
 
 # 上传目录设置
 def get_upload_dir():
-    """获取上传目录"""
-    base_dir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
-    upload_dir = os.path.join(base_dir, 'uploads', 'settings')
+    """获取上传目录 (SETTINGS_UPLOAD_DIR，见 config.py)"""
+    upload_dir = current_app.config['SETTINGS_UPLOAD_DIR']
     os.makedirs(upload_dir, exist_ok=True)
     return upload_dir
 
@@ -70,26 +71,6 @@ def save_settings(settings):
         current_app.logger.error(f"保存设置文件时出错: {str(e)}")
         return False
 
-# 管理员检查装饰器
-def admin_required(fn):
-    """验证用户是否为管理员的装饰器"""
-    @wraps(fn)
-    @jwt_required()  # 首先需要有有效的JWT
-    def wrapper(*args, **kwargs):
-        # 获取当前用户身份
-        current_user_id = get_jwt_identity()
-        
-        # 这里应该查询数据库判断用户是否为管理员
-        # 简化版本：假设有个判断函数 is_admin
-        from models import User
-        user = User.query.get(current_user_id)
-        
-        if not user or not user.is_admin:
-            return jsonify({"error": "需要管理员权限"}), 403
-            
-        return fn(*args, **kwargs)
-    return wrapper
-
 # 安全文件名生成
 def _slugify(text: str) -> str:
     """生成安全的slug，用于文件名"""
@@ -97,8 +78,17 @@ def _slugify(text: str) -> str:
     text = re.sub(r'[^A-Za-z0-9]+', '_', text).strip('_').lower()
     return text or 'file'
 
+def _settings_version():
+    """设置文件版本：修改时间与大小，不需要读取和解析 JSON"""
+    try:
+        stat = os.stat(get_settings_path())
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns}|{stat.st_size}", datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
 # 获取设置接口
 @settings_bp.route('', methods=['GET'])
+@conditional_get(_settings_version)
 def get_site_settings():
     """获取网站设置"""
     try:
@@ -165,15 +155,9 @@ def upload_logo():
             
         file.seek(0)  # 重置文件指针
             
-        # 保存文件
+        # 保存文件：文件名为 logo_<内容哈希>，可长期缓存（见 static_files.py）
         upload_dir = get_upload_dir()
-        # 生成唯一文件名
-        timestamp = int(os.path.getmtime(get_settings_path())) if os.path.exists(get_settings_path()) else 0
-        new_filename = f"logo_{timestamp}_{_slugify('logo')}.{ext}"
-        filepath = os.path.join(upload_dir, new_filename)
-        
-        # 保存文件
-        file.save(filepath)
+        new_filename = save_upload(file, upload_dir, 'logo', f".{ext}")
         
         # 更新设置中的logo URL
         logo_url = f"/uploads/settings/{new_filename}"
@@ -32,7 +32,8 @@ python --version
 echo 虚拟环境: %VIRTUAL_ENV%
 echo =============================================
 
-REM 启动Flask服务器
+REM 启动Flask服务器（默认使用开发配置，见 config.py）
+if "%APP_CONFIG%"=="" set APP_CONFIG=development
 echo 启动Flask服务器...
 flask run --host=0.0.0.0 %*
 
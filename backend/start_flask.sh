@@ -27,6 +27,7 @@ echo "Python版本: $(python --version)"
 echo "虚拟环境: $(which python)"
 echo "============================================="
 
-# 启动Flask服务器
+# 启动Flask服务器（默认使用开发配置，见 config.py）
+export APP_CONFIG="${APP_CONFIG:-development}"
 echo "启动Flask服务器..."
 flask run --host=0.0.0.0 "$@" 
\ No newline at end of file
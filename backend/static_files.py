@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静态文件与上传文件发送 - 长缓存、Range、预压缩副本与前端代理发送
+
+- 上传文件以内容哈希命名 (save_upload)，内容变化文件名随之变化，
+  响应带 Cache-Control: public, max-age=31536000, immutable，浏览器与 CDN 不再重新验证；
+  STATIC_IMMUTABLE_PREFIXES 下的静态资源（如 vite 构建输出的 assets/，文件名自带哈希）同样处理
+- 其他文件（index.html、旧的非哈希上传文件）为 no-cache，依靠 ETag / Last-Modified 重新验证
+- Range / If-Range：由 werkzeug send_file 按 ETag 与 Last-Modified 处理（206 / 416），
+  If-Range 与当前版本不一致时返回完整文件
+- 预压缩：静态资源存在 .br / .gz 同名文件且不早于原文件时，按 Accept-Encoding 直接发送压缩副本，
+  请求中不做压缩；响应带 Vary: Accept-Encoding，不同编码的 ETag 不同
+- FILE_OFFLOAD = 'x-accel' / 'x-sendfile'：只返回响应头，由 nginx (X-Accel-Redirect) 或 Apache/lighttpd (X-Sendfile)
+  读取并发送文件，worker 不再逐块写出文件内容；此时 Range 与预压缩交给代理处理（如 nginx gzip_static）
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+# 哈希文件名的缓存时间：一年
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# 内容哈希文件名：<前缀>_<16 位十六进制>.<扩展名>，缩略图为 <前缀>_<哈希>_<宽度>w.<扩展名>（见 image_pipeline.py）
+HASHED_NAME_RE = re.compile(r'_[0-9a-f]{16}(?:_\d+w)?\.[A-Za-z0-9]+$')
+
+# (Accept-Encoding 中的编码, 同名文件后缀)，按优先顺序
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+FILE_OFFLOAD_MODES = (None, 'x-accel', 'x-sendfile')
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(stream):
+    """读取整个上传流计算 SHA-256，返回前 16 位并把读取位置恢复到开头"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()[:16]
+
+
+@contextmanager
+def atomic_output(path):
+    """写入 path 的临时文件，成功后原子重命名；哈希文件名对应的内容一经出现就是完整的，可以安全地永久缓存"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            yield out
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_upload(file, directory, prefix, ext):
+    """以 <prefix>_<内容哈希><ext> 保存上传文件并返回文件名；相同内容已存在时不重复写入"""
+    filename = f"{prefix}_{content_hash(file.stream)}{ext}"
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        with atomic_output(path) as out:
+            file.save(out)
+    return filename
+
+
+def upload_path(url, uploads_dir):
+    """上传文件地址 (/uploads/products/x.jpg) 对应的本地路径；地址越出 uploads_dir 时为 None"""
+    return safe_join(uploads_dir, url.lstrip('/').removeprefix('uploads/'))
+
+
+def is_immutable(filename, immutable_prefixes=()):
+    return bool(HASHED_NAME_RE.search(filename)) or filename.startswith(tuple(immutable_prefixes))
+
+
+def _precompressed(path):
+    """客户端接受且不早于原文件的预压缩副本：(副本路径, 编码)，没有时为 (path, None)"""
+    mtime = os.stat(path).st_mtime
+    for encoding, suffix in PRECOMPRESSED:
+        if request.accept_encodings.quality(encoding) <= 0:
+            continue
+        try:
+            if os.stat(path + suffix).st_mtime >= mtime:
+                return path + suffix, encoding
+        except OSError:
+            continue
+    return path, None
+
+
+def _offload(path, location, filename, mimetype, max_age):
+    mode = current_app.config.get('FILE_OFFLOAD')
+    response = send_file(path, request.environ, mimetype=mimetype, use_x_sendfile=True, conditional=False,
+                         max_age=max_age)
+    # 只处理 304，Range 由代理按文件处理
+    response = response.make_conditional(request.environ)
+    if response.status_code == 304:
+        response.headers.pop('X-Sendfile', None)
+    elif mode == 'x-accel':
+        response.headers.pop('X-Sendfile', None)
+        prefix = current_app.config['X_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = quote(f"{prefix}/{location}/{filename}")
+    return response
+
+
+def send_from(directory, filename, location, precompressed=False, immutable_prefixes=()):
+    """发送 directory 下的 filename；location 为 X-Accel-Redirect 中的位置名 (uploads / static)"""
+    path = safe_join(os.path.abspath(directory), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    immutable = is_immutable(filename, immutable_prefixes)
+    max_age = IMMUTABLE_MAX_AGE if immutable else None
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if current_app.config.get('FILE_OFFLOAD'):
+        response = _offload(path, location, filename, mimetype, max_age)
+    else:
+        served, encoding = _precompressed(path) if precompressed else (path, None)
+        response = send_file(served, request.environ, mimetype=mimetype, conditional=True, max_age=max_age)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if precompressed:
+            response.vary.add('Accept-Encoding')
+
+    if immutable and response.status_code in (200, 206, 304):
+        response.cache_control.immutable = True
+    return response
+
+
+def static_view(filename):
+    """替换 Flask 的 static 端点：项目根目录下的前端文件，支持预压缩副本"""
+    return send_from(current_app.static_folder, filename, 'static', precompressed=True,
+                     immutable_prefixes=current_app.config['STATIC_IMMUTABLE_PREFIXES'])
+
+
+def init_static_files(app):
+    """校验 FILE_OFFLOAD 并让 static 端点使用 static_view"""
+    mode = app.config.get('FILE_OFFLOAD') or None
+    if mode not in FILE_OFFLOAD_MODES:
+        raise ValueError(f"FILE_OFFLOAD 只能为 x-accel 或 x-sendfile，当前为 {mode!r}")
+    app.config['FILE_OFFLOAD'] = mode
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = static_view
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存引擎 - 每个库存操作都是一条带条件的原子 UPDATE
+
+    UPDATE product_stock
+       SET available_stock = available_stock - :q, prelock_stock = prelock_stock + :q
+     WHERE product_id = :p AND available_stock >= :q
+    RETURNING total_stock, available_stock, prelock_stock
+
+- 库存是否充足由数据库在同一条语句里判断，不再"先读再写"，没有丢失更新，也不依赖 SELECT ... FOR UPDATE
+- 数据库支持 RETURNING（SQLite >= 3.35、PostgreSQL）时一次往返即可拿到变更后的库存；
+  否则按 rowcount 判断成功与否，再读取本事务已锁定的行
+- 变更前后的库存由返回值推算并完整写入 StockLog（before_* / after_*），日志在同一事务中紧接着插入
+- reserve / confirm_batch / release_batch 处理整单：按 product_id 升序逐个商品执行条件 UPDATE，
+  所有事务以相同顺序加锁，不会互相死锁；整单在保存点 (SAVEPOINT) 中执行，任一商品失败时回滚到保存点，
+  已执行的 UPDATE 不留痕迹（不会再写一遍库存、改动 status_changed_at），整单不生效
+- 分片模式（stock_shards.py 开启）：热点商品的库存分散在 N 个分片行上，预扣从随机分片开始尝试，
+  并发预扣落在不同的行上，不再全部排队等待同一行；商品库存为 product_stock 本行与各分片之和
+- 每条 UPDATE 同时维护 product_stock 的有效库存与库存状态列（models.stock_status_values），供低库存索引查询
+- 引擎不提交事务，由调用者 commit / rollback；会话中已加载的 ProductStock 对象不会自动刷新
+- 事务中写过 product_stock / product_stock_shard（引擎、预留超时释放、分片调整、批量接口或 ORM 修改）时，
+  提交后失效 products 响应缓存，商品列表与详情不会在 TTL 内显示旧库存
+"""
+
+import random
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, Product, ProductStock, ProductStockShard, StockLog, stock_status_values
+from response_cache import invalidate
+
+# 库存日志变动类型
+CHANGE_PRELOCK = 1   # 下单预扣
+CHANGE_CONFIRM = 2   # 支付确认
+CHANGE_RELEASE = 3   # 取消/超时释放
+CHANGE_ADJUST = 4    # 后台修改
+CHANGE_INITIALIZE = 5  # 批量初始化（stock_routes）
+
+# 操作结果；失败时库存字段为 None
+StockResult = namedtuple('StockResult', ['ok', 'message', 'total', 'available', 'prelock'])
+
+# adjust(expected_total=...) 时总库存在读取之后已被修改
+STALE_TOTAL_MESSAGE = "库存已被其他操作修改，请刷新后重试"
+
+_STOCK_COLUMNS = (ProductStock.total_stock, ProductStock.available_stock, ProductStock.prelock_stock)
+
+# 释放数量超过预扣量时按当前预扣量比较并交换的最大重试次数
+_RELEASE_CAS_RETRIES = 5
+# 分片模式下单个分片不够、按各分片现有量拆分时的最大重试次数
+_SHARD_SPLIT_RETRIES = 5
+
+
+def _conditional_update(product_id, values, *conditions):
+    """执行带条件的 UPDATE，条件不满足（或库存记录不存在）时返回 None，否则返回变更后的库存行"""
+    stmt = (
+        update(ProductStock)
+        .where(ProductStock.product_id == product_id, *conditions)
+        .values(stock_status_values(values))
+        .execution_options(synchronize_session=False)
+    )
+    session = db.session
+    if session.get_bind().dialect.update_returning:
+        return session.execute(stmt.returning(*_STOCK_COLUMNS)).first()
+    if session.execute(stmt).rowcount == 0:
+        return None
+    return session.execute(select(*_STOCK_COLUMNS).where(ProductStock.product_id == product_id)).first()
+
+
+def _log_values(product_id, change_type, change_amount, after, delta_total, delta_available, delta_prelock,
+                operation_type, order_id=None, admin_id=None, remark=None):
+    """库存日志字段：变动后库存取自 UPDATE 的返回值，变动前库存 = 变动后库存 - 本次变化量"""
+    return dict(
+        product_id=product_id,
+        change_type=change_type,
+        change_amount=change_amount,
+        order_id=order_id,
+        admin_id=admin_id,
+        remark=remark,
+        operation_type=operation_type,
+        before_total=after.total_stock - delta_total,
+        before_available=after.available_stock - delta_available,
+        before_prelock=after.prelock_stock - delta_prelock,
+        after_total=after.total_stock,
+        after_available=after.available_stock,
+        after_prelock=after.prelock_stock,
+    )
+
+
+def _write_logs(entries):
+    """插入库存日志；多条时为一次 executemany"""
+    if entries:
+        db.session.execute(insert(StockLog), entries)
+
+
+def _success(message, row):
+    return StockResult(True, message, row.total_stock, row.available_stock, row.prelock_stock)
+
+
+def _failure(product_id, message):
+    """条件不满足时区分库存记录不存在与数量不足（只在失败路径多一次查询）"""
+    exists = db.session.execute(
+        select(ProductStock.id).where(ProductStock.product_id == product_id)
+    ).first()
+    return StockResult(False, message if exists else "库存记录不存在", None, None, None)
+
+
+def _stale_total(product_id, expected_total):
+    """总库存已不等于调用者读到的值时返回失败结果，否则返回 None（失败路径才查询）"""
+    if expected_total is None:
+        return None
+    total = db.session.execute(
+        select(ProductStock.total_stock).where(ProductStock.product_id == product_id)
+    ).scalar()
+    if total is not None and total != expected_total:
+        return StockResult(False, STALE_TOTAL_MESSAGE, None, None, None)
+    return None
+
+
+def _invalid_quantity(quantity):
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        return StockResult(False, "数量必须为正数", None, None, None)
+    return None
+
+
+# 各操作对库存列的增减方向（乘以数量）
+_PRELOCK = {'available_stock': -1, 'prelock_stock': 1}
+_CONFIRM = {'prelock_stock': -1, 'total_stock': -1}
+_RELEASE = {'prelock_stock': -1, 'available_stock': 1}
+_ADJUST = {'total_stock': 1, 'available_stock': 1}
+
+
+def _values(model, changes, quantity):
+    return {getattr(model, column): getattr(model, column) + sign * quantity for column, sign in changes.items()}
+
+
+# --- 分片库存：库存 = product_stock 本行 + 各分片之和 (分片的开启与再平衡见 stock_shards.py) ---
+
+def _shard_count(product_id):
+    return db.session.execute(
+        select(ProductStock.shard_count).where(ProductStock.product_id == product_id)
+    ).scalar() or 0
+
+
+def _shard_update(product_id, shard_no, values, *conditions):
+    stmt = (
+        update(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id, ProductStockShard.shard_no == shard_no, *conditions)
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount > 0
+
+
+def _shard_undo(product_id, changes, applied):
+    for shard_no, amount in applied:
+        _shard_update(product_id, shard_no, _values(ProductStockShard, changes, -amount))
+
+
+def _shard_take(product_id, shard_count, quantity, changes, guard, partial):
+    """在分片上执行变更，返回 [(shard_no, 数量), ...]；数量不足时返回 None（partial 时返回已取到的部分）
+
+    先从随机分片开始逐个尝试单个分片满足整笔数量；都不够时按各分片现有量拆分，
+    每一份都以 "guard 列 >= 份额" 为条件，期间被并发修改则重读重试。
+    """
+    guard_column = getattr(ProductStockShard, guard) if guard else None
+    start = random.randrange(shard_count)
+    for offset in range(shard_count):
+        shard_no = (start + offset) % shard_count
+        conditions = (guard_column >= quantity,) if guard_column is not None else ()
+        if _shard_update(product_id, shard_no, _values(ProductStockShard, changes, quantity), *conditions):
+            return [(shard_no, quantity)]
+    if guard_column is None:
+        return None
+
+    applied = []
+    remaining = quantity
+    for _ in range(_SHARD_SPLIT_RETRIES):
+        shards = db.session.execute(
+            select(ProductStockShard.shard_no, guard_column)
+            .where(ProductStockShard.product_id == product_id, guard_column > 0)
+            .order_by(guard_column.desc())
+        ).all()
+        if sum(amount for _, amount in shards) < remaining and not partial:
+            break
+        for shard_no, amount in shards:
+            take = min(remaining, amount)
+            if _shard_update(product_id, shard_no, _values(ProductStockShard, changes, take), guard_column >= take):
+                applied.append((shard_no, take))
+                remaining -= take
+            if remaining == 0:
+                return applied
+        if not shards:
+            break
+    if partial:
+        return applied
+    _shard_undo(product_id, changes, applied)
+    return None
+
+
+def _shard_totals(product_id):
+    """本行与各分片合计的库存（字段名与 ProductStock 一致）"""
+    def shard_sum(column):
+        return (select(func.coalesce(func.sum(column), 0))
+                .where(ProductStockShard.product_id == product_id)
+                .scalar_subquery())
+
+    return db.session.execute(
+        select((ProductStock.total_stock + shard_sum(ProductStockShard.total_stock)).label('total_stock'),
+               (ProductStock.available_stock + shard_sum(ProductStockShard.available_stock)).label('available_stock'),
+               (ProductStock.prelock_stock + shard_sum(ProductStockShard.prelock_stock)).label('prelock_stock'))
+        .where(ProductStock.product_id == product_id)
+    ).first()
+
+
+def _shard_row(product_id, quantity, changes, guard, partial=False, shard_count=None):
+    """分片模式下的行原语；非分片商品返回 (None, None)"""
+    shard_count = shard_count if shard_count is not None else _shard_count(product_id)
+    if not shard_count:
+        return None, None
+    applied = _shard_take(product_id, shard_count, quantity, changes, guard, partial)
+    if applied is None:
+        return None, None
+    return _shard_totals(product_id), sum(amount for _, amount in applied)
+
+
+# --- 行原语：返回 (变更后的库存行, 实际变动数量)，条件不满足时返回 (None, None) ---
+# 先对 product_stock 本行执行条件 UPDATE；分片商品本行可用/预扣为 0，条件不满足后转到分片上执行
+
+def _single_row(product_id, quantity, changes, guard):
+    row = _conditional_update(product_id, _values(ProductStock, changes, quantity),
+                              getattr(ProductStock, guard) >= quantity)
+    if row is None:
+        return None
+    return row, quantity
+
+
+def _prelock_row(product_id, quantity):
+    return _single_row(product_id, quantity, _PRELOCK, 'available_stock') \
+        or _shard_row(product_id, quantity, _PRELOCK, 'available_stock')
+
+
+def _confirm_row(product_id, quantity):
+    result = _single_row(product_id, quantity, _CONFIRM, 'prelock_stock') \
+        or _shard_row(product_id, quantity, _CONFIRM, 'prelock_stock')
+    if result[0] is None:
+        current_app.logger.warning(f"Confirm stock deduction issue: prelock stock < requested {quantity} for product {product_id}")
+    return result
+
+
+def _release_row(product_id, quantity):
+    """预扣量不足时（重复释放或流程错误）只释放现存的预扣量"""
+    result = _single_row(product_id, quantity, _RELEASE, 'prelock_stock')
+    if result is not None:
+        return result
+    shard_count = _shard_count(product_id)
+    if shard_count:
+        row, released = _shard_row(product_id, quantity, _RELEASE, 'prelock_stock',
+                                   partial=True, shard_count=shard_count)
+        if released != quantity:
+            current_app.logger.warning(f"Release stock issue: sharded prelock stock < requested {quantity} for product {product_id}")
+        return row, released
+    for _ in range(_RELEASE_CAS_RETRIES):
+        current = db.session.execute(
+            select(*_STOCK_COLUMNS).where(ProductStock.product_id == product_id)
+        ).first()
+        if current is None:
+            return None, None
+        current_app.logger.warning(f"Release stock issue: prelock stock {current.prelock_stock} < requested {quantity} for product {product_id}")
+        released = current.prelock_stock
+        if released == 0:
+            return current, 0
+        # 以读到的预扣量为条件比较并交换，期间被并发修改则重试
+        row = _conditional_update(
+            product_id,
+            {ProductStock.prelock_stock: 0,
+             ProductStock.available_stock: ProductStock.available_stock + released},
+            ProductStock.prelock_stock == released,
+        )
+        if row is not None:
+            return row, released
+    return None, None
+
+
+def _prelock_log(product_id, quantity, row, order_id):
+    return _log_values(product_id, CHANGE_PRELOCK, -quantity, row, 0, -quantity, quantity,
+                       'order_create', order_id=order_id, remark=f"订单 {order_id} 预扣")
+
+
+def _confirm_log(product_id, quantity, row, order_id):
+    return _log_values(product_id, CHANGE_CONFIRM, -quantity, row, -quantity, 0, -quantity,
+                       'payment_confirm', order_id=order_id, remark=f"订单 {order_id} 支付确认")
+
+
+def _release_log(product_id, released, row, order_id, remark="释放库存"):
+    return _log_values(product_id, CHANGE_RELEASE, released, row, 0, released, -released,
+                       'order_cancel', order_id=order_id, remark=remark)
+
+
+# --- 单个商品操作 ---
+
+def prelock(product_id, quantity, order_id=None):
+    """下单预扣：可用库存转入预扣库存，可用库存不足时失败"""
+    invalid = _invalid_quantity(quantity)
+    if invalid:
+        return invalid
+    row, _ = _prelock_row(product_id, quantity)
+    if row is None:
+        return _failure(product_id, "可用库存不足")
+    _write_logs([_prelock_log(product_id, quantity, row, order_id)])
+    return _success("预扣成功", row)
+
+
+def confirm(product_id, quantity, order_id=None):
+    """支付确认：从预扣库存和总库存中扣减，预扣库存不足时失败"""
+    invalid = _invalid_quantity(quantity)
+    if invalid:
+        return invalid
+    row, _ = _confirm_row(product_id, quantity)
+    if row is None:
+        return _failure(product_id, "预扣库存异常")
+    _write_logs([_confirm_log(product_id, quantity, row, order_id)])
+    return _success("确认扣减成功", row)
+
+
+def release(product_id, quantity, order_id=None, remark="释放库存"):
+    """取消/超时/退款：预扣库存退回可用库存，预扣量不足时只释放现存的预扣量"""
+    invalid = _invalid_quantity(quantity)
+    if invalid:
+        return invalid
+    row, released = _release_row(product_id, quantity)
+    if row is None:
+        return _failure(product_id, "库存操作失败，请重试")
+    if released:
+        _write_logs([_release_log(product_id, released, row, order_id, remark)])
+    return _success("释放成功", row)
+
+
+# --- 多个商品（整单）操作 ---
+
+# 整单操作结果：失败时 product_id 为出错的商品；stocks 为 {product_id: (total, available, prelock)}
+BatchResult = namedtuple('BatchResult', ['ok', 'message', 'product_id', 'stocks'])
+
+
+def _normalize_items(items):
+    """合并重复商品并按 product_id 升序排列；所有事务都按同一顺序加锁，不会互相死锁"""
+    merged = {}
+    for product_id, quantity in items:
+        if _invalid_quantity(quantity):
+            return None, BatchResult(False, "数量必须为正数", product_id, {})
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    if not merged:
+        return None, BatchResult(False, "商品列表不能为空", None, {})
+    return sorted(merged.items()), None
+
+
+def _apply_batch(items, apply_row, build_log, failure_message, success_message):
+    normalized, error = _normalize_items(items)
+    if error:
+        return error
+
+    logs = []
+    stocks = {}
+    savepoint = db.session.begin_nested()
+    for product_id, quantity in normalized:
+        row, amount = apply_row(product_id, quantity)
+        if row is None:
+            # 全部成功或全部不生效：回滚到整单开始前的保存点，之前商品的 UPDATE 一并撤销
+            savepoint.rollback()
+            failure = _failure(product_id, failure_message)
+            return BatchResult(False, failure.message, product_id, {})
+        stocks[product_id] = (row.total_stock, row.available_stock, row.prelock_stock)
+        if amount:
+            logs.append(build_log(product_id, amount, row))
+    savepoint.commit()
+    _write_logs(logs)
+    return BatchResult(True, success_message, None, stocks)
+
+
+def reserve(items, order_id=None):
+    """整单预扣 items=[(product_id, quantity), ...]：任一商品库存不足则整单不生效
+
+    每个商品一条条件 UPDATE（按 product_id 升序），库存日志一次批量插入；由调用者提交。
+    """
+    return _apply_batch(
+        items, _prelock_row,
+        lambda pid, q, row: _prelock_log(pid, q, row, order_id),
+        "可用库存不足", "预扣成功",
+    )
+
+
+def confirm_batch(items, order_id=None):
+    """整单支付确认：任一商品预扣库存不足则整单不生效"""
+    return _apply_batch(
+        items, _confirm_row,
+        lambda pid, q, row: _confirm_log(pid, q, row, order_id),
+        "预扣库存异常", "确认扣减成功",
+    )
+
+
+def release_batch(items, order_id=None, remark="释放库存"):
+    """整单释放预扣库存；预扣量不足的商品只释放现存的预扣量，库存记录不存在时整单不生效"""
+    return _apply_batch(
+        items, _release_row,
+        lambda pid, q, row: _release_log(pid, q, row, order_id, remark),
+        "库存操作失败，请重试", "释放成功",
+    )
+
+
+# --- 后台调整 ---
+
+def adjust(product_id, delta, remark=None, admin_id=None, expected_total=None):
+    """后台调整：总库存与可用库存同时增减，调整后不能为负；库存记录不存在且为增加时创建记录
+
+    expected_total 为调用者读到的总库存（没有库存记录时为 0）：按"改成某个总库存"换算出的变化量只在
+    总库存仍等于该值时生效（UPDATE ... WHERE total_stock = :expected_total），期间被修改过时返回失败，
+    不会把并发的修改叠加进去
+    """
+    if not isinstance(delta, int) or isinstance(delta, bool):
+        return StockResult(False, "库存调整值必须为整数", None, None, None)
+
+    shard_count = _shard_count(product_id)
+    if shard_count and expected_total is not None:
+        # 分片库存分散在多行上，无法用一条条件 UPDATE 比较总库存
+        return StockResult(False, STALE_TOTAL_MESSAGE, None, None, None)
+    if shard_count:
+        # 增加落在随机分片上；减少从可用库存多的分片依次扣减
+        if delta >= 0:
+            row, _ = _shard_row(product_id, delta, _ADJUST, None, shard_count=shard_count)
+        else:
+            row, _ = _shard_row(product_id, -delta, {'total_stock': -1, 'available_stock': -1},
+                                   'available_stock', shard_count=shard_count)
+        if row is None:
+            return StockResult(False, "库存不足，无法调整至负数", None, None, None)
+    else:
+        values = _values(ProductStock, _ADJUST, delta)
+        conditions = (ProductStock.total_stock + delta >= 0, ProductStock.available_stock + delta >= 0)
+        if expected_total is not None:
+            conditions += (ProductStock.total_stock == expected_total,)
+        row = _conditional_update(product_id, values, *conditions)
+        if row is None:
+            result = _failure(product_id, "库存不足，无法调整至负数")
+            if result.message != "库存记录不存在":
+                return _stale_total(product_id, expected_total) or result
+            if delta < 0:
+                return StockResult(False, "库存不足，无法调整至负数", None, None, None)
+            # 首次调整时创建库存记录；并发创建冲突时（唯一约束）回到条件 UPDATE
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(ProductStock).values(
+                        product_id=product_id, total_stock=0, available_stock=0, prelock_stock=0,
+                        warning_stock=select(func.coalesce(Product.warning_stock, 0))
+                        .where(Product.id == product_id).scalar_subquery()))
+            except IntegrityError:
+                pass
+            row = _conditional_update(product_id, values, *conditions)
+            if row is None:
+                return _stale_total(product_id, expected_total) or _failure(product_id, "库存不足，无法调整至负数")
+
+    _write_logs([_log_values(product_id, CHANGE_ADJUST, delta, row, delta, delta, 0,
+                             'admin_adjust', admin_id=admin_id, remark=remark)])
+    return _success("库存调整成功", row)
+
+
+# --- 提交后失效商品缓存 ---
+
+_STOCK_TABLES = frozenset((ProductStock.__tablename__, ProductStockShard.__tablename__))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_stock_statement(orm_execute_state):
+    """session.execute 执行的库存 INSERT / UPDATE（引擎、超时释放、分片调整、批量接口）"""
+    if orm_execute_state.is_update or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if getattr(table, 'name', None) in _STOCK_TABLES:
+            orm_execute_state.session.info['stock_written'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_stock_flush(session, flush_context):
+    """通过 ORM 新增、修改或删除的库存与分片对象"""
+    if any(isinstance(obj, (ProductStock, ProductStockShard))
+           for obj in session.new | session.dirty | session.deleted):
+        session.info['stock_written'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_stock_caches(session):
+    if session.info.pop('stock_written', False) and has_app_context():
+        invalidate('products')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stock_mark(session):
+    session.info.pop('stock_written', None)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存账本 - 按库存日志与定期快照查询任意时刻的库存
+
+- 每条库存日志记录变动前后的完整库存 (before_* / after_*)，变化量 = after - before；
+  旧日志缺少 after_* 时按 change_type 与 change_amount 推算（见 _delta）
+- take_snapshots() 定期为有变动的产品写入 stock_snapshot：
+  快照值 = 当前库存（含分片） - as_of 之后日志的变化量合计，在一条 INSERT ... SELECT 中完成，
+  以真实库存为基准，不依赖日志从产品创建起是否完整
+- as_of 取当前时间减 SNAPSHOT_LAG_SECONDS，给仍在进行中的事务留出提交时间，
+  快照不会漏掉 created_time 早于 as_of、但快照时尚未提交的日志
+- stock_as_of(product_id, at) 取 at 之前最近的快照，再聚合回放 (as_of, at] 之间的日志，
+  回放的日志数不超过一个快照周期内该产品的变动数；没有更早的快照时从之后最近的快照
+  （或当前库存）倒推
+- 定期执行：flask --app app snapshot-stock [--loop --interval 3600]
+"""
+
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, case, exists, func, insert, literal, select
+from sqlalchemy.types import DateTime
+
+import stock_engine
+from app_logging import get_logger
+from models import db, ProductStock, ProductStockShard, StockLog, StockSnapshot
+
+log = get_logger('stock.ledger')
+
+# 快照时间点落后当前时间的秒数
+SNAPSHOT_LAG_SECONDS = 60
+
+# 查询结果：snapshot_as_of 为所用快照的时间（未使用快照时为 None），replayed 为回放的日志条数
+StockAsOf = namedtuple('StockAsOf', ['total', 'available', 'prelock', 'snapshot_as_of', 'replayed'])
+
+# 单次快照结果
+SnapshotStats = namedtuple('SnapshotStats', ['as_of', 'products', 'duration_ms'])
+
+
+def _delta(after, before, inferred):
+    """单条日志对某一库存列的变化量：有前后值时取差值，否则按变动类型推算"""
+    return case((and_(after.is_not(None), before.is_not(None)), after - before), else_=inferred)
+
+
+def _when(change_types, amount):
+    return case((StockLog.change_type.in_(change_types), amount), else_=0)
+
+
+# 旧日志的 change_amount：预扣/确认记为负数，释放记为正数，后台修改与初始化为总库存变化量
+_DELTA_TOTAL = _delta(
+    StockLog.after_total, StockLog.before_total,
+    _when((stock_engine.CHANGE_CONFIRM, stock_engine.CHANGE_ADJUST, stock_engine.CHANGE_INITIALIZE),
+          StockLog.change_amount))
+_DELTA_AVAILABLE = _delta(
+    StockLog.after_available, StockLog.before_available,
+    _when((stock_engine.CHANGE_PRELOCK, stock_engine.CHANGE_RELEASE, stock_engine.CHANGE_ADJUST,
+           stock_engine.CHANGE_INITIALIZE), StockLog.change_amount))
+_DELTA_PRELOCK = _delta(
+    StockLog.after_prelock, StockLog.before_prelock,
+    case((StockLog.change_type.in_((stock_engine.CHANGE_PRELOCK, stock_engine.CHANGE_RELEASE)),
+          -StockLog.change_amount),
+         (StockLog.change_type == stock_engine.CHANGE_CONFIRM, StockLog.change_amount),
+         else_=0))
+
+_DELTA_SUMS = (
+    func.coalesce(func.sum(_DELTA_TOTAL), 0),
+    func.coalesce(func.sum(_DELTA_AVAILABLE), 0),
+    func.coalesce(func.sum(_DELTA_PRELOCK), 0),
+)
+
+
+def _log_sums(product_id, *conditions):
+    """指定产品满足条件的日志的 (总库存, 可用库存, 预扣库存) 变化量合计与条数"""
+    return db.session.execute(
+        select(*_DELTA_SUMS, func.count(StockLog.log_id))
+        .where(StockLog.product_id == product_id, *conditions)
+    ).one()
+
+
+def _shift(values, sums, sign):
+    return tuple(value + sign * delta for value, delta in zip(values, sums[:3]))
+
+
+def stock_as_of(product_id, at):
+    """产品在 at 时刻（含该时刻的日志）的库存；产品没有库存记录时返回 None"""
+    snapshot = db.session.execute(
+        select(StockSnapshot).where(StockSnapshot.product_id == product_id, StockSnapshot.as_of <= at)
+        .order_by(StockSnapshot.as_of.desc()).limit(1)
+    ).scalar_one_or_none()
+    if snapshot is not None:
+        sums = _log_sums(product_id, StockLog.created_time > snapshot.as_of, StockLog.created_time <= at)
+        base = (snapshot.total_stock, snapshot.available_stock, snapshot.prelock_stock)
+        return StockAsOf(*_shift(base, sums, 1), snapshot.as_of, sums[3])
+
+    # at 早于该产品的所有快照：从之后最近的快照倒推
+    snapshot = db.session.execute(
+        select(StockSnapshot).where(StockSnapshot.product_id == product_id, StockSnapshot.as_of > at)
+        .order_by(StockSnapshot.as_of).limit(1)
+    ).scalar_one_or_none()
+    if snapshot is not None:
+        sums = _log_sums(product_id, StockLog.created_time > at, StockLog.created_time <= snapshot.as_of)
+        base = (snapshot.total_stock, snapshot.available_stock, snapshot.prelock_stock)
+        return StockAsOf(*_shift(base, sums, -1), snapshot.as_of, sums[3])
+
+    # 还没有快照：从当前库存倒推
+    stock = db.session.execute(select(ProductStock).where(ProductStock.product_id == product_id)).scalar_one_or_none()
+    if stock is None:
+        return None
+    sums = _log_sums(product_id, StockLog.created_time > at)
+    return StockAsOf(*_shift(stock.counts(), sums, -1), None, sums[3])
+
+
+def _shard_sums():
+    return (
+        select(ProductStockShard.product_id,
+               func.sum(ProductStockShard.total_stock).label('total'),
+               func.sum(ProductStockShard.available_stock).label('available'),
+               func.sum(ProductStockShard.prelock_stock).label('prelock'))
+        .group_by(ProductStockShard.product_id)
+        .subquery()
+    )
+
+
+def _later_log_sums(as_of):
+    return (
+        select(StockLog.product_id, _DELTA_SUMS[0].label('total'), _DELTA_SUMS[1].label('available'),
+               _DELTA_SUMS[2].label('prelock'))
+        .where(StockLog.created_time > as_of)
+        .group_by(StockLog.product_id)
+        .subquery()
+    )
+
+
+def take_snapshots(now=None, lag_seconds=SNAPSHOT_LAG_SECONDS):
+    """为上次快照之后有库存变动（或还没有快照）的产品写入 as_of = now - lag 的快照并提交"""
+    started = time.perf_counter()
+    as_of = (now or datetime.utcnow()) - timedelta(seconds=lag_seconds)
+    previous = db.session.execute(select(func.max(StockSnapshot.as_of))).scalar()
+    if previous is not None and previous >= as_of:
+        return SnapshotStats(as_of, 0, 0)
+
+    shards = _shard_sums()
+    later = _later_log_sums(as_of)
+
+    def column(name):
+        return (getattr(ProductStock, f'{name}_stock') + func.coalesce(shards.c[name], 0)
+                - func.coalesce(later.c[name], 0))
+
+    snapshotted = exists().where(StockSnapshot.product_id == ProductStock.product_id)
+    if previous is None:
+        needs_snapshot = ~snapshotted
+    else:
+        changed = exists().where(StockLog.product_id == ProductStock.product_id,
+                                 StockLog.created_time > previous, StockLog.created_time <= as_of)
+        needs_snapshot = changed | ~snapshotted
+
+    query = (
+        select(ProductStock.product_id, literal(as_of, DateTime), column('total'), column('available'),
+               column('prelock'), literal(datetime.utcnow(), DateTime))
+        .outerjoin(shards, shards.c.product_id == ProductStock.product_id)
+        .outerjoin(later, later.c.product_id == ProductStock.product_id)
+        .where(needs_snapshot)
+    )
+    result = db.session.execute(
+        insert(StockSnapshot).from_select(
+            ['product_id', 'as_of', 'total_stock', 'available_stock', 'prelock_stock', 'created_at'], query)
+    )
+    db.session.commit()
+
+    stats = SnapshotStats(as_of, result.rowcount, round((time.perf_counter() - started) * 1000, 1))
+    log.info("stock snapshot", extra={'as_of': as_of.isoformat(), 'products': stats.products,
+                                      'duration_ms': stats.duration_ms})
+    return stats
+
+
+@click.command('snapshot-stock')
+@click.option('--lag', type=float, default=SNAPSHOT_LAG_SECONDS, show_default=True, help='快照时间点落后当前时间的秒数')
+@click.option('--loop', is_flag=True, help='持续运行，每 interval 秒生成一次快照')
+@click.option('--interval', type=float, default=3600.0, show_default=True, help='--loop 时的快照间隔（秒）')
+@with_appcontext
+def snapshot_stock_command(lag, loop, interval):
+    """为有库存变动的产品生成库存快照"""
+    while True:
+        stats = take_snapshots(lag_seconds=lag)
+        click.echo(f"as_of={stats.as_of.isoformat()} products={stats.products} duration_ms={stats.duration_ms}")
+        if not loop:
+            break
+        db.session.remove()
+        time.sleep(interval)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预扣记录与超时释放 - 下单预扣 10 分钟内未支付则自动释放
+
+- hold() 在同一事务中预扣库存 (stock_engine.reserve) 并写入 stock_reservation，记录过期时间
+- confirm() / release() 先把本订单 status='held' 的记录原子地改为 confirmed / released，
+  只有改到的记录才扣减/释放库存；与清扫并发时同一笔预扣只会被处理一次
+- sweep_expired() 按 expires_at 顺序每批取 RESERVATION_SWEEP_BATCH_SIZE 条已过期的 held 记录，
+  改为 expired 后按商品合并，通过 stock_engine.release_batch 释放（与 _release_stock 语义相同），每批提交一次
+- 清扫方式二选一：
+  - 独立进程：flask --app app sweep-reservations [--loop --interval 30]，gunicorn 部署时使用这种方式
+  - 进程内后台线程：RESERVATION_SWEEP_INTERVAL (秒) 大于 0 时由 start_reservation_sweeper 启动（开发服务器、单进程部署）；
+    gunicorn 下不启动（见 gunicorn.conf.py）
+- 每次清扫输出一条日志 (swept / released_units / batches / duration_ms)，
+  累计指标写入 reservation_sweep_metrics 表，见 sweep_stats()
+
+hold / confirm / release 不提交事务，由调用者 commit / rollback；sweep_expired 自行按批提交。
+"""
+
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import stock_engine
+from app_logging import get_logger
+from models import db, ReservationSweepMetrics, StockReservation
+
+log = get_logger('stock.reservation')
+
+# 预扣有效期（秒），PRD：下单后 10 分钟内未支付释放库存
+RESERVATION_TTL_SECONDS = 600
+RESERVATION_SWEEP_BATCH_SIZE = 500
+
+STATUS_HELD = 'held'
+STATUS_CONFIRMED = 'confirmed'
+STATUS_RELEASED = 'released'
+STATUS_EXPIRED = 'expired'
+
+EXPIRED_REMARK = "预扣超时自动释放"
+
+# 单次清扫结果
+SweepStats = namedtuple('SweepStats', ['swept', 'released_units', 'batches', 'duration_ms'])
+
+_CLAIM_COLUMNS = (StockReservation.id, StockReservation.product_id, StockReservation.quantity)
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def _claim(conditions, new_status, now):
+    """把满足条件的 held 记录改为 new_status，返回被改到的 (id, product_id, quantity)"""
+    stmt = (
+        update(StockReservation)
+        .where(StockReservation.status == STATUS_HELD, *conditions)
+        .values(status=new_status, settled_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    session = db.session
+    if session.get_bind().dialect.update_returning:
+        return session.execute(stmt.returning(*_CLAIM_COLUMNS)).all()
+    rows = session.execute(
+        select(*_CLAIM_COLUMNS).where(StockReservation.status == STATUS_HELD, *conditions).with_for_update()
+    ).all()
+    if rows:
+        session.execute(stmt.where(StockReservation.id.in_([row.id for row in rows])))
+    return rows
+
+
+def _unclaim(ids):
+    """库存操作失败时把记录恢复为 held，随调用者的事务一起生效或回滚"""
+    db.session.execute(
+        update(StockReservation)
+        .where(StockReservation.id.in_(ids))
+        .values(status=STATUS_HELD, settled_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def hold(items, order_id=None, ttl=None):
+    """整单预扣并记录过期时间；items=[(product_id, quantity), ...]，返回 stock_engine.BatchResult"""
+    result = stock_engine.reserve(items, order_id=order_id)
+    if not result.ok:
+        return result
+    now = datetime.utcnow()
+    ttl = _config('RESERVATION_TTL_SECONDS', RESERVATION_TTL_SECONDS) if ttl is None else ttl
+    expires_at = now + timedelta(seconds=ttl)
+    db.session.execute(insert(StockReservation), [
+        dict(order_id=order_id, product_id=product_id, quantity=quantity,
+             status=STATUS_HELD, created_at=now, expires_at=expires_at)
+        for product_id, quantity in items
+    ])
+    return result
+
+
+def _settle(order_id, product_ids, new_status, apply_batch):
+    conditions = [StockReservation.order_id == order_id]
+    if product_ids is not None:
+        conditions.append(StockReservation.product_id.in_(product_ids))
+    claimed = _claim(conditions, new_status, datetime.utcnow())
+    if not claimed:
+        return stock_engine.BatchResult(False, "没有待处理的预扣记录", None, {})
+    result = apply_batch([(row.product_id, row.quantity) for row in claimed])
+    if not result.ok:
+        _unclaim([row.id for row in claimed])
+    return result
+
+
+def confirm(order_id, product_ids=None):
+    """支付确认：扣减本订单仍在有效期内的预扣；已超时释放的预扣不能再确认"""
+    return _settle(order_id, product_ids, STATUS_CONFIRMED,
+                   lambda items: stock_engine.confirm_batch(items, order_id=order_id))
+
+
+def release(order_id, product_ids=None, remark="释放库存"):
+    """取消订单：释放本订单尚未确认、尚未过期的预扣"""
+    return _settle(order_id, product_ids, STATUS_RELEASED,
+                   lambda items: stock_engine.release_batch(items, order_id=order_id, remark=remark))
+
+
+def reservation_statuses(order_id, product_id=None):
+    """订单的预扣记录状态集合（失败路径用于区分已处理与没有预扣记录）"""
+    stmt = select(StockReservation.status).where(StockReservation.order_id == order_id)
+    if product_id is not None:
+        stmt = stmt.where(StockReservation.product_id == product_id)
+    return set(db.session.execute(stmt).scalars())
+
+
+# --- 超时清扫 ---
+
+class SweepMetrics:
+    """累计清扫指标，保存在 reservation_sweep_metrics 单行表中
+
+    gunicorn 下清扫由独立的 sweep-reservations 进程执行，进程内计数对 worker 不可见；
+    每次清扫后用一条 UPDATE 累加，sweep-stats 接口在任何进程中读到的都是同一份指标。
+    """
+
+    ROW_ID = 1
+
+    def clear(self):
+        db.session.execute(delete(ReservationSweepMetrics))
+        db.session.commit()
+
+    def record(self, stats):
+        """累加一次清扫结果并单独提交；写入失败只记日志，不影响清扫本身"""
+        m = ReservationSweepMetrics
+        values = {
+            m.runs: m.runs + 1,
+            m.swept_total: m.swept_total + stats.swept,
+            m.last_swept: stats.swept,
+            m.last_duration_ms: stats.duration_ms,
+            m.max_duration_ms: case((m.max_duration_ms < stats.duration_ms, stats.duration_ms),
+                                    else_=m.max_duration_ms),
+            m.last_run_at: datetime.utcnow(),
+        }
+        try:
+            stmt = update(m).where(m.id == self.ROW_ID).values(values).execution_options(synchronize_session=False)
+            if db.session.execute(stmt).rowcount == 0:
+                # 首次清扫创建指标行；并发创建冲突时（主键）回到 UPDATE
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(m).values(
+                            id=self.ROW_ID, runs=0, swept_total=0, last_swept=0,
+                            last_duration_ms=0.0, max_duration_ms=0.0))
+                except IntegrityError:
+                    pass
+                db.session.execute(stmt)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception("reservation sweep metrics not recorded")
+
+    def snapshot(self):
+        row = db.session.get(ReservationSweepMetrics, self.ROW_ID, populate_existing=True)
+        return {
+            'runs': row.runs if row else 0,
+            'swept_total': row.swept_total if row else 0,
+            'last_swept': row.last_swept if row else 0,
+            'last_duration_ms': row.last_duration_ms if row else 0.0,
+            'max_duration_ms': row.max_duration_ms if row else 0.0,
+            'last_run_at': row.last_run_at.isoformat() if row and row.last_run_at else None,
+        }
+
+
+sweep_metrics = SweepMetrics()
+
+
+def sweep_stats():
+    return sweep_metrics.snapshot()
+
+
+def _release_expired(claimed):
+    """按商品合并后一次整单释放；个别商品的库存记录已不存在时逐个释放其余商品"""
+    merged = {}
+    for row in claimed:
+        merged[row.product_id] = merged.get(row.product_id, 0) + row.quantity
+    items = list(merged.items())
+    if stock_engine.release_batch(items, remark=EXPIRED_REMARK).ok:
+        return
+    for product_id, quantity in items:
+        result = stock_engine.release(product_id, quantity, remark=EXPIRED_REMARK)
+        if not result.ok:
+            log.warning("expired reservation release failed",
+                        extra={'product_id': product_id, 'quantity': quantity, 'reason': result.message})
+
+
+def sweep_expired(batch_size=None, now=None):
+    """释放所有在 now 之前过期的预扣，返回 SweepStats；每批一个事务"""
+    batch_size = batch_size or _config('RESERVATION_SWEEP_BATCH_SIZE', RESERVATION_SWEEP_BATCH_SIZE)
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    swept = released_units = batches = 0
+    try:
+        while True:
+            ids = db.session.execute(
+                select(StockReservation.id)
+                .where(StockReservation.status == STATUS_HELD, StockReservation.expires_at <= now)
+                .order_by(StockReservation.expires_at)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            claimed = _claim([StockReservation.id.in_(ids)], STATUS_EXPIRED, now)
+            if claimed:
+                _release_expired(claimed)
+            db.session.commit()
+            batches += 1
+            swept += len(claimed)
+            released_units += sum(row.quantity for row in claimed)
+            if len(ids) < batch_size:
+                break
+    except Exception:
+        db.session.rollback()
+        raise
+
+    stats = SweepStats(swept, released_units, batches, round((time.perf_counter() - started) * 1000, 2))
+    sweep_metrics.record(stats)
+    extra = stats._asdict()
+    if swept:
+        log.info("reservation sweep", extra=extra)
+    else:
+        log.debug("reservation sweep", extra=extra)
+    return stats
+
+
+class ReservationSweeper(threading.Thread):
+    """后台清扫线程：每 interval 秒执行一次 sweep_expired"""
+
+    def __init__(self, app, interval, batch_size=None):
+        super().__init__(name='reservation-sweeper', daemon=True)
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self.app.app_context():
+                try:
+                    sweep_expired(self.batch_size)
+                except Exception:
+                    log.exception("reservation sweep failed")
+                finally:
+                    db.session.remove()
+            self._stop_event.wait(self.interval)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self.join(timeout)
+
+
+def start_reservation_sweeper(app):
+    """RESERVATION_SWEEP_INTERVAL 大于 0 时启动后台清扫线程；多进程部署时各进程同时清扫也只会释放一次"""
+    interval = float(app.config.get('RESERVATION_SWEEP_INTERVAL', 0) or 0)
+    if interval <= 0:
+        return None
+    sweeper = ReservationSweeper(app, interval, app.config.get('RESERVATION_SWEEP_BATCH_SIZE'))
+    app.extensions['reservation_sweeper'] = sweeper
+    sweeper.start()
+    return sweeper
+
+
+@click.command('sweep-reservations')
+@click.option('--batch-size', type=int, default=None, help='每批处理的预扣记录数')
+@click.option('--loop', is_flag=True, help='持续运行，每 interval 秒清扫一次')
+@click.option('--interval', type=float, default=30.0, show_default=True, help='--loop 时的清扫间隔（秒）')
+@with_appcontext
+def sweep_reservations_command(batch_size, loop, interval):
+    """释放超时未支付的预扣库存"""
+    while True:
+        stats = sweep_expired(batch_size)
+        click.echo(f"swept={stats.swept} released_units={stats.released_units} "
+                   f"batches={stats.batches} duration_ms={stats.duration_ms}")
+        if not loop:
+            break
+        db.session.remove()
+        time.sleep(interval)
@@ -1,55 +1,241 @@
-from flask import Blueprint, request, jsonify
-from sqlalchemy.exc import SQLAlchemyError
-from datetime import datetime
-from models import Product, StockRecord, db
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存路由模块 - 库存日志查询、历史库存查询与批量初始化/调整库存
 
-stock_bp = Blueprint('stock', __name__)
+库存日志按 (product_id, created_time) 复合索引分页查询，导出 (NDJSON / CSV) 通过服务端游标流式输出。
+某一时刻的库存由最近的库存快照加回放之间的日志得出（见 stock_ledger.py）。
+低库存列表与库存状态变化的增量拉取读取 product_stock 上随库存变动维护的有效库存/库存状态列，走索引，不加载全部产品。
+
+批量接口按集合处理，语句数与条目数无关：
+1. 每 10000 个产品 ID 一条 IN 查询，同时取回产品是否存在及其库存行
+2. 在内存中逐条校验并计算结果（同一产品出现多次时依次累加），每条返回各自的结果
+3. 缺少库存记录的产品一次 executemany INSERT；已有库存的产品一次 executemany UPDATE，
+   UPDATE 以读取时的库存值为条件（乐观并发），期间被预扣等操作修改时整批回滚重试
+4. 库存日志一次 executemany INSERT
+"""
+
+import base64
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context
+from sqlalchemy import and_, bindparam, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+import stock_engine
+from stock_ledger import stock_as_of
+from models import db, Product, ProductStock, StockLog, stock_status_case, stock_status_values
+from product_routes import _decode_cursor, _encode_cursor, _invalidate_product_caches
+from utils.auth import admin_required
+
+stock_bp = Blueprint('stock', __name__, url_prefix='/api')
+
+# 库存变更类型常量（与 stock_engine / StockLog.change_type 一致）
+CHANGE_TYPE_ORDER_CREATE = stock_engine.CHANGE_PRELOCK     # 订单创建
+CHANGE_TYPE_ORDER_PAID = stock_engine.CHANGE_CONFIRM       # 订单支付
+CHANGE_TYPE_ORDER_CANCEL = stock_engine.CHANGE_RELEASE     # 订单取消
+CHANGE_TYPE_ADMIN_ADJUST = stock_engine.CHANGE_ADJUST      # 后台调整
+CHANGE_TYPE_INITIALIZE = stock_engine.CHANGE_INITIALIZE    # 初始化
+
+# 库存日志分页参数与导出时每批读取的行数
+STOCK_LOG_PAGE_DEFAULT_LIMIT = 50
+STOCK_LOG_PAGE_MAX_LIMIT = 200
+STOCK_LOG_EXPORT_BATCH = 1000
+
+# 低库存列表与库存状态变化拉取的分页参数
+STOCK_ALERT_PAGE_DEFAULT_LIMIT = 50
+STOCK_ALERT_PAGE_MAX_LIMIT = 200
+# 状态变化拉取只返回早于当前时间此秒数的变化，给进行中的事务留出提交时间，游标之前不会再出现新行
+STOCK_STATUS_FEED_LAG_SECONDS = 5
+
+# 单条 IN 查询的最大 ID 数（SQLite 默认最多 32766 个绑定参数）
+_IN_CHUNK_SIZE = 10000
+# 乐观并发冲突时整批重试次数
+_BULK_RETRIES = 3
+
+# 批量写入直接使用 Core 表，跳过 ORM 批量持久化的逐行处理
+_stock_table = ProductStock.__table__
+_log_table = StockLog.__table__
+
+
+class _StaleSnapshot(Exception):
+    """读取库存后、写入前库存已被其他事务修改"""
+
+
+# 库存日志输出的字段（分页 JSON、NDJSON 与 CSV 导出共用）
+_LOG_FIELDS = (
+    ('id', StockLog.log_id),
+    ('product_id', StockLog.product_id),
+    ('change_type', StockLog.change_type),
+    ('change_amount', StockLog.change_amount),
+    ('before_total', StockLog.before_total),
+    ('before_available', StockLog.before_available),
+    ('before_prelock', StockLog.before_prelock),
+    ('after_total', StockLog.after_total),
+    ('after_available', StockLog.after_available),
+    ('after_prelock', StockLog.after_prelock),
+    ('order_id', StockLog.order_id),
+    ('operation_type', StockLog.operation_type),
+    ('remark', StockLog.remark),
+    ('created_time', StockLog.created_time),
+    ('created_by', StockLog.admin_id),
+)
+_LOG_KEYS = tuple(key for key, _ in _LOG_FIELDS)
+
+
+def _log_dict(row):
+    data = dict(zip(_LOG_KEYS, row))
+    if data['created_time'] is not None:
+        data['created_time'] = data['created_time'].isoformat()
+    return data
+
+
+def _parse_time(value):
+    """解析 start / end 参数：YYYY-MM-DD 或 ISO 8601 时间"""
+    return datetime.fromisoformat(value) if value else None
+
+
+def _log_filters(product_id, args):
+    """按产品、时间范围与变动类型筛选；参数错误时抛出 ValueError"""
+    filters = [StockLog.product_id == product_id]
+    start_str, end_str = args.get('start'), args.get('end')
+    try:
+        start, end = _parse_time(start_str), _parse_time(end_str)
+    except ValueError as e:
+        raise ValueError('start / end 必须是 YYYY-MM-DD 或 ISO 8601 时间') from e
+    if start is not None:
+        filters.append(StockLog.created_time >= start)
+    if end is not None:
+        # 只给日期时包含当天全天
+        if len(end_str) == 10:
+            filters.append(StockLog.created_time < end + timedelta(days=1))
+        else:
+            filters.append(StockLog.created_time <= end)
+    change_type = args.get('change_type')
+    if change_type:
+        if not change_type.isdigit():
+            raise ValueError('change_type 必须是整数')
+        filters.append(StockLog.change_type == int(change_type))
+    return filters
+
+
+def _parse_limit(default, maximum):
+    """解析 limit 参数，超过上限时取上限；参数错误时抛出 ValueError"""
+    try:
+        limit = int(request.args.get('limit', default))
+    except ValueError as e:
+        raise ValueError('limit 必须是有效的整数') from e
+    if limit <= 0:
+        raise ValueError('limit 必须为正整数')
+    return min(limit, maximum)
+
+
+def _log_keyset_filter(created_time, log_id):
+    """(created_time DESC NULLS LAST, log_id DESC) 排序下位于游标之后的条件"""
+    if created_time is None:
+        return and_(StockLog.created_time.is_(None), StockLog.log_id < log_id)
+    return or_(
+        StockLog.created_time < created_time,
+        and_(StockLog.created_time == created_time, StockLog.log_id < log_id),
+        StockLog.created_time.is_(None),
+    )
+
+
+def _export_logs(product_id, filters, fmt):
+    """流式导出：按时间正序逐批从服务端游标读取，内存占用与日志条数无关"""
+    stmt = (
+        select(*(column for _, column in _LOG_FIELDS))
+        .where(*filters)
+        .order_by(StockLog.created_time.asc().nulls_first(), StockLog.log_id.asc())
+        .execution_options(stream_results=True, yield_per=STOCK_LOG_EXPORT_BATCH)
+    )
+
+    def generate():
+        result = db.session.execute(stmt)
+        try:
+            if fmt == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(_LOG_KEYS)
+                for partition in result.partitions():
+                    writer.writerows(partition)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                for partition in result.partitions():
+                    yield ''.join(json.dumps(_log_dict(row), ensure_ascii=False) + '\n' for row in partition)
+        finally:
+            result.close()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=stock_logs_{product_id}.{fmt}'
+    return response
 
-# 库存变更类型常量
-CHANGE_TYPE_ORDER_CREATE = 1  # 订单创建
-CHANGE_TYPE_ORDER_CANCEL = 2  # 订单取消
-CHANGE_TYPE_ORDER_PAID = 3    # 订单支付
-CHANGE_TYPE_ADMIN_ADJUST = 4  # 后台调整
-CHANGE_TYPE_INITIALIZE = 5    # 初始化
 
 @stock_bp.route('/products/<int:product_id>/stock-logs', methods=['GET'])
+@admin_required
 def get_product_stock_logs(product_id):
-    """获取指定产品的库存变动记录"""
+    """获取指定产品的库存变动记录
+
+    按 (created_time, id) 降序游标分页：limit（默认 50，最大 200）、cursor（上一页的 next_cursor）；
+    start / end（日期或时间）与 change_type 筛选。
+    format=ndjson 或 csv 时忽略分页，按时间正序流式导出筛选范围内的全部记录。
+    """
     try:
         # 检查产品是否存在
-        product = Product.query.get(product_id)
-        if not product:
+        if db.session.get(Product, product_id) is None:
             return jsonify({
                 'success': False,
                 'message': f'ID为{product_id}的产品不存在'
             }), 404
-        
-        # 查询库存记录
-        stock_logs = StockRecord.query.filter_by(product_id=product_id).order_by(
-            StockRecord.created_time.desc()
+
+        try:
+            filters = _log_filters(product_id, request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        fmt = request.args.get('format')
+        if fmt in ('ndjson', 'csv'):
+            return _export_logs(product_id, filters, fmt)
+        if fmt:
+            return jsonify({'success': False, 'message': 'format 只支持 ndjson 或 csv'}), 400
+
+        try:
+            limit = _parse_limit(STOCK_LOG_PAGE_DEFAULT_LIMIT, STOCK_LOG_PAGE_MAX_LIMIT)
+            cursor = request.args.get('cursor')
+            if cursor:
+                filters.append(_log_keyset_filter(*_decode_cursor(cursor)))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        rows = db.session.execute(
+            select(*(column for _, column in _LOG_FIELDS))
+            .where(*filters)
+            .order_by(StockLog.created_time.desc().nulls_last(), StockLog.log_id.desc())
+            .limit(limit + 1)
         ).all()
-        
-        # 转换为JSON格式
-        logs_data = []
-        for log in stock_logs:
-            logs_data.append({
-                'id': log.id,
-                'product_id': log.product_id,
-                'change_type': log.change_type,
-                'change_amount': log.change_amount,
-                'before_total': log.before_total,
-                'before_available': log.before_available,
-                'before_prelock': log.before_prelock,
-                'remark': log.remark,
-                'created_time': log.created_time.isoformat() if log.created_time else None,
-                'created_by': log.created_by
-            })
-        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = _encode_cursor(last.created_time, last.log_id)
+
         return jsonify({
             'success': True,
-            'logs': logs_data
+            'logs': [_log_dict(row) for row in rows],
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': next_cursor
         })
-        
+
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({
@@ -57,239 +243,392 @@ def get_product_stock_logs(product_id):
             'message': f'获取库存记录失败: {str(e)}'
         }), 500
 
-@stock_bp.route('/products/initialize-stock', methods=['POST'])
-def initialize_product_stock():
-    """初始化产品库存（批量）"""
+
+@stock_bp.route('/products/<int:product_id>/stock-as-of', methods=['GET'])
+@admin_required
+def get_product_stock_as_of(product_id):
+    """查询产品在 at（日期或 ISO 8601 时间，只给日期时为当天结束）时刻的库存：最近的快照 + 回放之间的日志"""
+    at_str = request.args.get('at')
+    if not at_str:
+        return jsonify({'success': False, 'message': '缺少 at 参数'}), 400
     try:
-        data = request.get_json()
-        if not data or not isinstance(data, list):
-            return jsonify({
-                'success': False,
-                'message': '无效的数据格式，请提供产品库存列表'
-            }), 400
-        
-        results = []
-        for item in data:
-            product_id = item.get('product_id')
-            total_stock = item.get('total_stock', 0)
-            
-            if not product_id:
-                results.append({
-                    'success': False,
-                    'product_id': None,
-                    'message': '缺少产品ID'
-                })
-                continue
-            
-            # 检查产品是否存在
-            product = Product.query.get(product_id)
-            if not product:
-                results.append({
-                    'success': False,
-                    'product_id': product_id,
-                    'message': f'ID为{product_id}的产品不存在'
-                })
-                continue
-            
-            # 检查是否已有库存记录
-            if hasattr(product, 'stock') and product.stock:
-                # 已有库存记录，更新库存
-                before_total = product.stock.total_stock
-                before_available = product.stock.available_stock
-                before_prelock = product.stock.prelock_stock
-                
-                # 计算变化量
-                change_amount = total_stock - before_total
-                
-                # 更新库存
-                product.stock.total_stock = total_stock
-                product.stock.available_stock = total_stock - before_prelock
-                
-                # 记录库存变动
-                stock_record = StockRecord(
-                    product_id=product_id,
-                    change_type=CHANGE_TYPE_INITIALIZE,
-                    change_amount=change_amount,
-                    before_total=before_total,
-                    before_available=before_available,
-                    before_prelock=before_prelock,
-                    remark=item.get('remark', '系统批量初始化库存'),
-                    created_time=datetime.now(),
-                    created_by=request.headers.get('X-User-ID', 'system')
-                )
-                db.session.add(stock_record)
-            else:
-                # 初始化库存记录
-                product.initialize_stock(
-                    total_stock=total_stock,
-                    available_stock=total_stock,
-                    prelock_stock=0
-                )
-                
-                # 记录库存变动
-                stock_record = StockRecord(
-                    product_id=product_id,
-                    change_type=CHANGE_TYPE_INITIALIZE,
-                    change_amount=total_stock,
-                    before_total=0,
-                    before_available=0,
-                    before_prelock=0,
-                    remark=item.get('remark', '系统初始化库存'),
-                    created_time=datetime.now(),
-                    created_by=request.headers.get('X-User-ID', 'system')
-                )
-                db.session.add(stock_record)
-            
-            results.append({
-                'success': True,
-                'product_id': product_id,
-                'current_stock': {
-                    'total': product.stock.total_stock,
-                    'available': product.stock.available_stock,
-                    'prelock': product.stock.prelock_stock
-                }
-            })
-        
-        db.session.commit()
+        at = _parse_time(at_str)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'at 必须是 YYYY-MM-DD 或 ISO 8601 时间'}), 400
+    if len(at_str) == 10:
+        at = at + timedelta(days=1) - timedelta(microseconds=1)
+
+    try:
+        if db.session.get(Product, product_id) is None:
+            return jsonify({'success': False, 'message': f'ID为{product_id}的产品不存在'}), 404
+        result = stock_as_of(product_id, at)
+        if result is None:
+            return jsonify({'success': False, 'message': '该产品没有库存记录'}), 404
         return jsonify({
             'success': True,
-            'results': results
+            'product_id': product_id,
+            'at': at.isoformat(),
+            'stock': _current_stock(result[:3]),
+            'snapshot_as_of': result.snapshot_as_of.isoformat() if result.snapshot_as_of else None,
+            'replayed_logs': result.replayed
         })
-        
     except SQLAlchemyError as e:
         db.session.rollback()
-        return jsonify({
-            'success': False,
-            'message': f'初始化库存失败: {str(e)}'
-        }), 500
+        return jsonify({'success': False, 'message': f'查询历史库存失败: {str(e)}'}), 500
 
-@stock_bp.route('/products/batch-adjust-stock', methods=['POST'])
-def batch_adjust_product_stock():
-    """批量调整产品库存"""
+
+# 低库存：有效库存不高于预警值（库存状态为无库存或库存警告），按 ix_product_stock_stock_margin 索引查询
+_STOCK_MARGIN = ProductStock.effective_stock - ProductStock.warning_stock
+_ALERT_COLUMNS = (ProductStock.product_id, Product.name, ProductStock.stock_status, ProductStock.effective_stock,
+                  ProductStock.warning_stock, ProductStock.status_changed_at)
+
+
+def _alert_dict(row):
+    return {
+        'product_id': row.product_id,
+        'name': row.name,
+        'stock_status': row.stock_status,
+        'effective_stock': row.effective_stock,
+        'warning_stock': row.warning_stock,
+        'status_changed_at': row.status_changed_at.isoformat() if row.status_changed_at else None,
+    }
+
+
+def _encode_margin_cursor(margin, product_id):
+    raw = f'{margin}|{product_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_margin_cursor(cursor):
     try:
-        data = request.get_json()
+        padded = cursor + '=' * (-len(cursor) % 4)
+        margin, product_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|')
+        return int(margin), int(product_id)
+    except (ValueError, UnicodeError, TypeError) as e:
+        raise ValueError('无效的分页游标') from e
+
+
+@stock_bp.route('/products/low-stock', methods=['GET'])
+@admin_required
+def get_low_stock_products():
+    """有效库存不高于预警值的产品，最紧缺的在前；按 (有效库存 - 预警值, 产品ID) 游标分页
+
+    分片商品的库存状态由分片再平衡任务定期刷新，可能略有滞后；没有库存记录的产品不在列表中。
+    """
+    try:
+        limit = _parse_limit(STOCK_ALERT_PAGE_DEFAULT_LIMIT, STOCK_ALERT_PAGE_MAX_LIMIT)
+        filters = [_STOCK_MARGIN <= 0]
+        cursor = request.args.get('cursor')
+        if cursor:
+            margin, product_id = _decode_margin_cursor(cursor)
+            filters.append(or_(_STOCK_MARGIN > margin,
+                               and_(_STOCK_MARGIN == margin, ProductStock.product_id > product_id)))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        rows = db.session.execute(
+            select(*_ALERT_COLUMNS)
+            .join(Product, Product.id == ProductStock.product_id)
+            .where(*filters)
+            .order_by(_STOCK_MARGIN, ProductStock.product_id)
+            .limit(limit + 1)
+        ).all()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'获取低库存产品失败: {str(e)}'}), 500
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_margin_cursor(last.effective_stock - last.warning_stock, last.product_id)
+    return jsonify({
+        'success': True,
+        'products': [_alert_dict(row) for row in rows],
+        'limit': limit,
+        'has_more': has_more,
+        'next_cursor': next_cursor
+    })
+
+
+@stock_bp.route('/products/stock-status-changes', methods=['GET'])
+@admin_required
+def get_stock_status_changes():
+    """库存状态变化的增量拉取：返回游标之后 stock_status 发生过变化的产品（每个产品只出现其最新状态）
+
+    按 (status_changed_at, 产品ID) 升序；不带 cursor 时从头返回。调用方保存 next_cursor，下次从该处继续，
+    没有新变化时 next_cursor 与传入的游标相同。
+    """
+    try:
+        limit = _parse_limit(STOCK_ALERT_PAGE_DEFAULT_LIMIT, STOCK_ALERT_PAGE_MAX_LIMIT)
+        cursor = request.args.get('cursor')
+        cutoff = datetime.utcnow() - timedelta(seconds=STOCK_STATUS_FEED_LAG_SECONDS)
+        filters = [ProductStock.status_changed_at <= cutoff]
+        if cursor:
+            changed_at, product_id = _decode_cursor(cursor)
+            if changed_at is None:
+                raise ValueError('无效的分页游标')
+            filters.append(or_(ProductStock.status_changed_at > changed_at,
+                               and_(ProductStock.status_changed_at == changed_at,
+                                    ProductStock.product_id > product_id)))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        rows = db.session.execute(
+            select(*_ALERT_COLUMNS)
+            .join(Product, Product.id == ProductStock.product_id)
+            .where(*filters)
+            .order_by(ProductStock.status_changed_at, ProductStock.product_id)
+            .limit(limit + 1)
+        ).all()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'获取库存状态变化失败: {str(e)}'}), 500
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = _encode_cursor(rows[-1].status_changed_at, rows[-1].product_id)
+    return jsonify({
+        'success': True,
+        'changes': [_alert_dict(row) for row in rows],
+        'limit': limit,
+        'has_more': has_more,
+        'next_cursor': cursor
+    })
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _item_product_id(item):
+    """返回 (product_id, 错误消息)"""
+    if not isinstance(item, dict) or not item.get('product_id'):
+        return None, '缺少产品ID'
+    product_id = item['product_id']
+    if not _is_int(product_id):
+        return None, '产品ID必须为整数'
+    return product_id, None
+
+
+def _load_stocks(product_ids):
+    """product_id -> 库存行 (total, available, prelock, shard_count)；产品存在但没有库存记录时为 None"""
+    ids = list(product_ids)
+    stocks = {}
+    for start in range(0, len(ids), _IN_CHUNK_SIZE):
+        rows = db.session.execute(
+            select(Product.id, ProductStock.total_stock, ProductStock.available_stock,
+                   ProductStock.prelock_stock, ProductStock.shard_count)
+            .outerjoin(ProductStock, ProductStock.product_id == Product.id)
+            .where(Product.id.in_(ids[start:start + _IN_CHUNK_SIZE]))
+        ).all()
+        for row in rows:
+            stocks[row.id] = None if row.total_stock is None else tuple(row[1:])
+    return stocks
+
+
+def _current_stock(values):
+    return {'total': values[0], 'available': values[1], 'prelock': values[2]}
+
+
+def _write_stocks(snapshot, state, created):
+    """插入新库存行、以读取时的值为条件更新已有库存行；有行未更新到说明快照已过期"""
+    if created:
+        # 维护列（有效库存、库存状态）在同一条语句里按产品预警值计算
+        warning = (select(func.coalesce(Product.warning_stock, 0))
+                   .where(Product.id == bindparam('product_id')).scalar_subquery())
+        effective = bindparam('new_available') - bindparam('new_prelock')
+        db.session.execute(
+            insert(_stock_table).values(
+                product_id=bindparam('product_id'), total_stock=bindparam('new_total'),
+                available_stock=bindparam('new_available'), prelock_stock=bindparam('new_prelock'),
+                warning_stock=warning, effective_stock=effective, stock_status=stock_status_case(effective, warning),
+                status_changed_at=datetime.utcnow()),
+            [dict(product_id=pid, new_total=state[pid][0], new_available=state[pid][1], new_prelock=state[pid][2])
+             for pid in created]
+        )
+
+    params = [
+        dict(pid=pid, old_total=snapshot[pid][0], old_available=snapshot[pid][1], old_prelock=snapshot[pid][2],
+             new_total=values[0], new_available=values[1], new_prelock=values[2])
+        for pid, values in state.items() if pid not in created
+    ]
+    if not params:
+        return
+    stmt = (
+        update(_stock_table)
+        .where(_stock_table.c.product_id == bindparam('pid'),
+               _stock_table.c.total_stock == bindparam('old_total'),
+               _stock_table.c.available_stock == bindparam('old_available'),
+               _stock_table.c.prelock_stock == bindparam('old_prelock'))
+        .values(stock_status_values({ProductStock.total_stock: bindparam('new_total'),
+                                     ProductStock.available_stock: bindparam('new_available'),
+                                     ProductStock.prelock_stock: bindparam('new_prelock')}))
+    )
+    if db.session.get_bind().dialect.supports_sane_multi_rowcount:
+        if db.session.execute(stmt, params).rowcount != len(params):
+            raise _StaleSnapshot()
+    else:
+        for param in params:
+            if db.session.execute(stmt, param).rowcount != 1:
+                raise _StaleSnapshot()
+
+
+def _apply_bulk(data, apply_item, on_sharded):
+    """逐条计算结果后集中写库；apply_item(当前库存或 None, 条目) 返回错误消息或 (新库存, 日志字段, 成功消息)"""
+    admin_id = g.get('current_user_id')
+    snapshot = _load_stocks({pid for pid, error in map(_item_product_id, data) if error is None})
+
+    state = {}
+    created = {}  # 需要新建库存记录的产品（保持顺序）
+    results = []
+    logs = []
+    for item in data:
+        product_id, error = _item_product_id(item)
+        if error is None and product_id not in snapshot:
+            error = f'ID为{product_id}的产品不存在'
+        if error:
+            results.append({'success': False, 'product_id': product_id, 'message': error})
+            continue
+
+        stock = snapshot[product_id]
+        if stock is not None and stock[3]:
+            results.append(on_sharded(product_id, item))
+            continue
+
+        current = state.get(product_id) or (stock[:3] if stock is not None else None)
+        outcome = apply_item(current, item)
+        if isinstance(outcome, str):
+            results.append({'success': False, 'product_id': product_id, 'message': outcome})
+            continue
+
+        new_values, log_fields, message = outcome
+        if current is None:
+            created[product_id] = True
+            current = (0, 0, 0)
+        state[product_id] = new_values
+        logs.append(dict(product_id=product_id, admin_id=admin_id, before_total=current[0],
+                         before_available=current[1], before_prelock=current[2], after_total=new_values[0],
+                         after_available=new_values[1], after_prelock=new_values[2], **log_fields))
+        result = {'success': True, 'product_id': product_id}
+        if message:
+            result['message'] = message
+        result['current_stock'] = _current_stock(new_values)
+        results.append(result)
+
+    _write_stocks(snapshot, state, created)
+    if logs:
+        db.session.execute(insert(_log_table), logs)
+    return results
+
+
+def _run_bulk(data, apply_item, on_sharded=None):
+    """执行批量操作并提交；乐观并发冲突时整批重试，仍失败返回 None"""
+    on_sharded = on_sharded or (lambda pid, item: {
+        'success': False, 'product_id': pid, 'message': '该产品已开启分片库存，请使用库存调整接口'})
+    for _ in range(_BULK_RETRIES):
+        try:
+            results = _apply_bulk(data, apply_item, on_sharded)
+            db.session.commit()
+        except (_StaleSnapshot, IntegrityError):
+            # 库存被并发修改，或其他请求同时创建了库存记录
+            db.session.rollback()
+            continue
+        _invalidate_product_caches()
+        return results
+    return None
+
+
+def _initialize_item(current, item):
+    total_stock = item.get('total_stock', 0)
+    if not _is_int(total_stock) or total_stock < 0:
+        return '总库存必须为非负整数'
+    before_total, _, prelock = current or (0, 0, 0)
+    if total_stock < prelock:
+        return f'总库存 ({total_stock}) 不能小于当前的预扣库存 ({prelock})'
+    remark = item.get('remark') or ('系统批量初始化库存' if current else '系统初始化库存')
+    log_fields = dict(change_type=CHANGE_TYPE_INITIALIZE, change_amount=total_stock - before_total,
+                      operation_type='initialize', remark=remark)
+    return (total_stock, total_stock - prelock, prelock), log_fields, None
+
+
+def _adjust_item(current, item):
+    adjust_total = item.get('adjust_total', 0)
+    if not _is_int(adjust_total):
+        return '库存调整值必须为整数'
+    remark = item.get('remark') or '批量调整库存'
+    if current is None:
+        # 没有库存记录时初始化，减少量按 0 处理
+        amount = max(0, adjust_total)
+        log_fields = dict(change_type=CHANGE_TYPE_ADMIN_ADJUST, change_amount=amount,
+                          operation_type='admin_adjust', remark=remark)
+        return (amount, amount, 0), log_fields, '初始化库存成功'
+    total, available, prelock = current
+    if total + adjust_total < 0 or available + adjust_total < 0:
+        return '调整后的库存不能小于0'
+    log_fields = dict(change_type=CHANGE_TYPE_ADMIN_ADJUST, change_amount=adjust_total,
+                      operation_type='admin_adjust', remark=remark)
+    return (total + adjust_total, available + adjust_total, prelock), log_fields, '调整库存成功'
+
+
+def _adjust_sharded(product_id, item):
+    """分片库存的产品逐个交给库存引擎调整"""
+    adjust_total = item.get('adjust_total', 0)
+    result = stock_engine.adjust(product_id, adjust_total, remark=item.get('remark') or '批量调整库存',
+                                 admin_id=g.get('current_user_id'))
+    if not result.ok:
+        return {'success': False, 'product_id': product_id, 'message': result.message}
+    return {'success': True, 'product_id': product_id, 'message': '调整库存成功',
+            'current_stock': _current_stock((result.total, result.available, result.prelock))}
+
+
+def _bulk_endpoint(apply_item, invalid_message, failure_message, on_sharded=None):
+    try:
+        data = request.get_json(silent=True)
         if not data or not isinstance(data, list):
             return jsonify({
                 'success': False,
-                'message': '无效的数据格式，请提供产品库存调整列表'
+                'message': invalid_message
             }), 400
-        
-        results = []
-        for item in data:
-            product_id = item.get('product_id')
-            adjust_total = item.get('adjust_total', 0)
-            
-            if not product_id:
-                results.append({
-                    'success': False,
-                    'product_id': None,
-                    'message': '缺少产品ID'
-                })
-                continue
-            
-            # 检查产品是否存在
-            product = Product.query.get(product_id)
-            if not product:
-                results.append({
-                    'success': False,
-                    'product_id': product_id,
-                    'message': f'ID为{product_id}的产品不存在'
-                })
-                continue
-            
-            # 检查是否已有库存记录
-            if not hasattr(product, 'stock') or not product.stock:
-                # 初始化库存记录
-                product.initialize_stock(
-                    total_stock=max(0, adjust_total),
-                    available_stock=max(0, adjust_total),
-                    prelock_stock=0
-                )
-                
-                # 记录库存变动
-                stock_record = StockRecord(
-                    product_id=product_id,
-                    change_type=CHANGE_TYPE_ADMIN_ADJUST,
-                    change_amount=max(0, adjust_total),
-                    before_total=0,
-                    before_available=0,
-                    before_prelock=0,
-                    remark=item.get('remark', '批量调整库存'),
-                    created_time=datetime.now(),
-                    created_by=request.headers.get('X-User-ID', 'system')
-                )
-                db.session.add(stock_record)
-                
-                results.append({
-                    'success': True,
-                    'product_id': product_id,
-                    'message': '初始化库存成功',
-                    'current_stock': {
-                        'total': product.stock.total_stock,
-                        'available': product.stock.available_stock,
-                        'prelock': product.stock.prelock_stock
-                    }
-                })
-                continue
-            
-            # 已有库存记录，调整库存
-            before_total = product.stock.total_stock
-            before_available = product.stock.available_stock
-            before_prelock = product.stock.prelock_stock
-            
-            # 检查调整后是否小于0
-            if before_total + adjust_total < 0:
-                results.append({
-                    'success': False,
-                    'product_id': product_id,
-                    'message': '调整后的库存不能小于0'
-                })
-                continue
-            
-            # 更新库存
-            product.stock.total_stock = before_total + adjust_total
-            # 调整可用库存，确保不会小于0
-            new_available = before_available + adjust_total
-            product.stock.available_stock = max(0, new_available)
-            
-            # 记录库存变动
-            stock_record = StockRecord(
-                product_id=product_id,
-                change_type=CHANGE_TYPE_ADMIN_ADJUST,
-                change_amount=adjust_total,
-                before_total=before_total,
-                before_available=before_available,
-                before_prelock=before_prelock,
-                remark=item.get('remark', '批量调整库存'),
-                created_time=datetime.now(),
-                created_by=request.headers.get('X-User-ID', 'system')
-            )
-            db.session.add(stock_record)
-            
-            results.append({
-                'success': True,
-                'product_id': product_id,
-                'message': '调整库存成功',
-                'current_stock': {
-                    'total': product.stock.total_stock,
-                    'available': product.stock.available_stock,
-                    'prelock': product.stock.prelock_stock
-                }
-            })
-        
-        db.session.commit()
+
+        results = _run_bulk(data, apply_item, on_sharded)
+        if results is None:
+            return jsonify({
+                'success': False,
+                'message': '库存正在被其他操作修改，请重试'
+            }), 409
         return jsonify({
             'success': True,
             'results': results
         })
-        
+
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({
             'success': False,
-            'message': f'批量调整库存失败: {str(e)}'
+            'message': f'{failure_message}: {str(e)}'
         }), 500
 
+
+@stock_bp.route('/products/initialize-stock', methods=['POST'])
+@admin_required
+def initialize_product_stock():
+    """初始化产品库存（批量）：把总库存设为 total_stock，可用库存 = 总库存 - 预扣库存"""
+    return _bulk_endpoint(_initialize_item, '无效的数据格式，请提供产品库存列表', '初始化库存失败')
+
+
+@stock_bp.route('/products/batch-adjust-stock', methods=['POST'])
+@admin_required
+def batch_adjust_product_stock():
+    """批量调整产品库存：总库存与可用库存同时增减 adjust_total"""
+    return _bulk_endpoint(_adjust_item, '无效的数据格式，请提供产品库存调整列表', '批量调整库存失败',
+                          on_sharded=_adjust_sharded)
+
+
 # 导出库存变更类型常量
 def get_stock_change_types():
     """获取库存变更类型常量"""
@@ -299,4 +638,4 @@ def get_stock_change_types():
         'ORDER_PAID': CHANGE_TYPE_ORDER_PAID,
         'ADMIN_ADJUST': CHANGE_TYPE_ADMIN_ADJUST,
         'INITIALIZE': CHANGE_TYPE_INITIALIZE
-    } 
\ No newline at end of file
+    }
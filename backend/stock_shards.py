@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+库存分片 - 秒杀/促销热点商品的可选分片库存模式
+
+单行库存下同一商品的所有预扣都要更新 product_stock 的同一行，在 PostgreSQL 等行锁数据库上
+并发预扣只能逐个排队。开启分片后商品的可用库存分散到 N 个 product_stock_shard 行：
+
+- stock_engine 的预扣从随机分片开始尝试，并发请求大多落在不同的行上；确认/释放同样就近扣减
+- 商品库存 = product_stock 本行 + 各分片之和（ProductStock.counts()、effective_stock、stock_status 均按此计算）
+- 分片之间会随预扣变得不均，某个分片售罄后请求需要多试几个分片；rebalance() 把可用库存重新均分，
+  可由 flask --app app rebalance-stock-shards [--loop --interval 60] 定期执行
+- set_shard_count(product_id, 0) 把分片合并回单行并关闭分片模式
+- 分片变动不回写 product_stock 本行，本行维护的有效库存/库存状态（低库存查询用）由 rebalance_all 定期刷新
+
+SQLite 全库只有一个写锁，分片不会提高并发写入吞吐，仅用于 PostgreSQL 等行级锁数据库。
+以下函数不提交事务（rebalance_all 与命令行除外）。
+"""
+
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from app_logging import get_logger
+from models import db, ProductStock, ProductStockShard, refresh_stock_status
+
+log = get_logger('stock.shards')
+
+MAX_SHARD_COUNT = 64
+
+
+def _lock_stock(product_id):
+    return db.session.execute(
+        select(ProductStock).where(ProductStock.product_id == product_id)
+        .with_for_update().execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+
+
+def _lock_shards(product_id):
+    return db.session.execute(
+        select(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id)
+        .order_by(ProductStockShard.shard_no)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalars().all()
+
+
+def _merge_shards(stock):
+    """分片库存并回本行并删除分片"""
+    for shard in _lock_shards(stock.product_id):
+        stock.total_stock += shard.total_stock
+        stock.available_stock += shard.available_stock
+        stock.prelock_stock += shard.prelock_stock
+        db.session.delete(shard)
+    stock.shard_count = 0
+    db.session.flush()
+
+
+def _distribute(stock, shards):
+    """本行与各分片的可用库存均分到各分片；每行 total - available 保持不变，预扣留在原处"""
+    available = stock.available_stock + sum(shard.available_stock for shard in shards)
+    stock.total_stock -= stock.available_stock
+    stock.available_stock = 0
+    base, extra = divmod(available, len(shards))
+    for index, shard in enumerate(shards):
+        target = base + (1 if index < extra else 0)
+        shard.total_stock += target - shard.available_stock
+        shard.available_stock = target
+
+
+def set_shard_count(product_id, shard_count):
+    """开启 (shard_count > 0)、调整或关闭 (0) 分片模式，返回 (是否成功, 消息)"""
+    if not isinstance(shard_count, int) or isinstance(shard_count, bool) or not 0 <= shard_count <= MAX_SHARD_COUNT:
+        return False, f"分片数必须为 0-{MAX_SHARD_COUNT} 的整数"
+    stock = _lock_stock(product_id)
+    if stock is None:
+        return False, "库存记录不存在"
+    if stock.shard_count:
+        _merge_shards(stock)
+    if shard_count == 0:
+        return True, "已关闭分片库存"
+
+    shards = [ProductStockShard(product_id=product_id, shard_no=n, total_stock=0, available_stock=0, prelock_stock=0)
+              for n in range(shard_count)]
+    db.session.add_all(shards)
+    _distribute(stock, shards)
+    stock.shard_count = shard_count
+    db.session.flush()
+    return True, f"已开启 {shard_count} 个库存分片"
+
+
+def rebalance(product_id):
+    """把商品的可用库存重新均分到各分片；返回均分后各分片的可用库存，非分片商品返回 None"""
+    stock = _lock_stock(product_id)
+    if stock is None or not stock.shard_count:
+        return None
+    shards = _lock_shards(product_id)
+    if not shards:
+        return None
+    _distribute(stock, shards)
+    db.session.flush()
+    return [shard.available_stock for shard in shards]
+
+
+def _needs_rebalance(product_id, tolerance):
+    availables = db.session.execute(
+        select(ProductStockShard.available_stock).where(ProductStockShard.product_id == product_id)
+    ).scalars().all()
+    return bool(availables) and max(availables) - min(availables) > tolerance
+
+
+def rebalance_all(tolerance=1):
+    """刷新分片商品的库存状态列，再逐个检查，可用库存最多与最少的分片相差超过 tolerance 时再平衡；每个商品一个事务"""
+    started = time.perf_counter()
+    product_ids = db.session.execute(
+        select(ProductStock.product_id).where(ProductStock.shard_count > 0)
+    ).scalars().all()
+    # 分片上的预扣/确认/释放不回写本行，顺带刷新本行维护的有效库存与库存状态
+    refresh_stock_status(db.session, product_ids)
+    db.session.commit()
+    rebalanced = 0
+    for product_id in product_ids:
+        try:
+            if _needs_rebalance(product_id, tolerance) and rebalance(product_id) is not None:
+                rebalanced += 1
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception("stock shard rebalance failed", extra={'product_id': product_id})
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    log.info("stock shard rebalance", extra={'products': len(product_ids), 'rebalanced': rebalanced,
+                                              'duration_ms': duration_ms})
+    return rebalanced
+
+
+@click.command('rebalance-stock-shards')
+@click.option('--tolerance', type=int, default=1, show_default=True, help='分片可用库存最大差值超过该值才再平衡')
+@click.option('--loop', is_flag=True, help='持续运行，每 interval 秒执行一次')
+@click.option('--interval', type=float, default=60.0, show_default=True, help='--loop 时的执行间隔（秒）')
+@with_appcontext
+def rebalance_stock_shards_command(tolerance, loop, interval):
+    """把分片商品的可用库存重新均分到各分片"""
+    while True:
+        click.echo(f"rebalanced={rebalance_all(tolerance)}")
+        if not loop:
+            break
+        db.session.remove()
+        time.sleep(interval)
@@ -0,0 +1,55 @@
+"""应用工厂测试：配置选择、共享密钥要求、环境变量覆盖与延迟注册蓝图"""
+import pytest
+
+from app import create_app
+from config import DevelopmentConfig, ProductionConfig, TestingConfig, get_config
+
+
+class _Production(ProductionConfig):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def _rules(app):
+    return {rule.rule for rule in app.url_map.iter_rules()}
+
+
+def test_production_requires_shared_jwt_secret(monkeypatch):
+    monkeypatch.delenv('JWT_SECRET_KEY', raising=False)
+    with pytest.raises(RuntimeError):
+        create_app(_Production)
+
+    monkeypatch.setenv('JWT_SECRET_KEY', 'shared-secret')
+    assert create_app(_Production).config['JWT_SECRET_KEY'] == 'shared-secret'
+
+
+def test_development_falls_back_to_random_secret(monkeypatch):
+    monkeypatch.delenv('JWT_SECRET_KEY', raising=False)
+
+    class _Development(DevelopmentConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+    assert len(create_app(_Development).config['JWT_SECRET_KEY']) == 64
+
+
+def test_config_names_and_env_overrides(monkeypatch):
+    assert get_config('testing') is TestingConfig
+    with pytest.raises(ValueError):
+        get_config('staging')
+
+    monkeypatch.setenv('RESERVATION_TTL_SECONDS', '120')
+    monkeypatch.setenv('RESERVATION_SWEEP_INTERVAL', '0')
+    monkeypatch.setenv('UPLOADS_DIR', '/srv/ysj/uploads')
+    app = create_app(_Production)
+    assert app.config['RESERVATION_TTL_SECONDS'] == 120
+    assert app.config['PRODUCT_IMG_DIR'] == '/srv/ysj/uploads/products'
+
+
+def test_lazy_blueprints_register_before_first_request(monkeypatch):
+    monkeypatch.setenv('LAZY_BLUEPRINTS', 'true')
+    app = create_app(_Production)
+    assert '/api/products' not in _rules(app)
+    assert '/api/cache/stats' in _rules(app)
+
+    # 第一个请求即可命中延迟注册的蓝图路由（未登录被拒绝，而不是 404）
+    assert app.test_client().get('/api/products/low-stock').status_code == 401
+    assert '/api/products' in _rules(app)
@@ -0,0 +1,45 @@
+"""日志模块测试"""
+import json
+import logging
+
+from app_logging import JsonFormatter, SamplingFilter
+
+
+def _record(level, msg, **extra):
+    record = logging.LogRecord('ysj.test', level, __file__, 1, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_keeps_every_nth_debug_event():
+    sampler = SamplingFilter(rate=0.25)
+    kept = [sampler.filter(_record(logging.DEBUG, 'hot event')) for _ in range(8)]
+    assert kept.count(True) == 2
+    # 不同事件独立计数，INFO 及以上不采样
+    assert sampler.filter(_record(logging.DEBUG, 'other event'))
+    assert all(sampler.filter(_record(logging.INFO, 'hot event')) for _ in range(3))
+
+
+def test_zero_rate_drops_debug():
+    sampler = SamplingFilter(rate=0)
+    assert not sampler.filter(_record(logging.DEBUG, 'x'))
+    assert sampler.filter(_record(logging.WARNING, 'x'))
+
+
+def test_json_formatter_emits_extra_fields():
+    line = JsonFormatter().format(_record(logging.INFO, '新闻列表', page=2))
+    payload = json.loads(line)
+    assert payload['msg'] == '新闻列表'
+    assert payload['level'] == 'INFO'
+    assert payload['page'] == 2
+
+
+def test_debug_endpoint_does_not_log_credentials(client, caplog):
+    caplog.set_level(logging.DEBUG, logger='ysj.user')
+    resp = client.get('/api/debug', headers={'Authorization': 'Bearer secret-token', 'Cookie': 'session=abc',
+                                             'X-Request-Source': 'test'})
+    assert resp.status_code == 200
+    record = next(r for r in caplog.records if r.getMessage() == 'debug endpoint')
+    assert record.headers['X-Request-Source'] == 'test'
+    assert 'Authorization' not in record.headers and 'Cookie' not in record.headers
+    assert 'secret-token' not in json.dumps(resp.get_json())
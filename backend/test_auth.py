@@ -0,0 +1,64 @@
+"""统一管理员鉴权 (utils.auth) 测试"""
+from models import db
+from utils.auth import principal_cache
+
+
+def test_admin_routes_reject_missing_token_and_non_admin(client, make_user):
+    assert client.get('/api/users').status_code == 401
+    assert client.get('/api/admin/news').status_code == 401
+
+    _, headers = make_user(is_admin=False)
+    resp = client.get('/api/users', headers=headers)
+    assert resp.status_code == 403
+    assert client.get('/api/admin/news', headers=headers).status_code == 403
+
+
+def test_demotion_revokes_existing_tokens(client, make_user):
+    admin, admin_headers = make_user(is_admin=True)
+    other, other_headers = make_user(is_admin=True)
+    assert client.get('/api/users', headers=other_headers).status_code == 200
+
+    resp = client.put(f'/api/users/{other.id}/admin', json={'is_admin': False}, headers=admin_headers)
+    assert resp.status_code == 200
+    assert other.token_version == 1
+    # 旧令牌携带 is_admin=True 声明，版本号已过期，整体被拒绝
+    assert client.get('/api/users', headers=other_headers).status_code == 401
+
+    # 重新登录拿到的新令牌不再有管理员权限
+    login = client.post('/api/login', json={'login': other.username, 'password': 'secret123'})
+    new_headers = {'Authorization': f"Bearer {login.get_json()['access_token']}"}
+    assert client.get('/api/users', headers=new_headers).status_code == 403
+
+    resp = client.post('/api/users/batch', json={'user_ids': [other.id], 'action': 'make_admin'},
+                       headers=admin_headers)
+    assert resp.get_json()['affected_count'] == 1
+    assert client.get('/api/users', headers=new_headers).status_code == 401
+
+
+def test_admin_check_trusts_claims(client, make_user, count_statements):
+    admin, headers = make_user(is_admin=True)
+    assert client.get('/api/admin/news', headers=headers).status_code == 200
+
+    # 令牌版本已缓存后，管理员接口不再查询 user 表
+    with count_statements() as statements:
+        assert client.get('/api/admin/news', headers=headers).status_code == 200
+    assert not any('FROM user' in s for s in statements)
+
+
+def test_legacy_token_without_claims_falls_back_to_database(app, client, make_user):
+    from flask_jwt_extended import create_access_token
+
+    admin, _ = make_user(is_admin=True)
+    user, _ = make_user(is_admin=False)
+    legacy_admin = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+    legacy_user = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+    assert client.get('/api/admin/news', headers=legacy_admin).status_code == 200
+    assert client.get('/api/admin/news', headers=legacy_user).status_code == 403
+
+
+def test_deleted_user_token_is_rejected(client, make_user):
+    user, headers = make_user(is_admin=True)
+    db.session.delete(user)
+    db.session.commit()
+    principal_cache.clear()
+    assert client.get('/api/users', headers=headers).status_code == 401
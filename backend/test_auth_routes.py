@@ -0,0 +1,57 @@
+"""登录 / 注册接口测试"""
+
+
+def _register(client, **overrides):
+    payload = {'username': 'alice', 'phone': '13912345678', 'email': 'alice@example.com', 'password': 'secret123'}
+    payload.update(overrides)
+    return client.post('/api/register', json=payload)
+
+
+def test_login_queries_single_identifier_column(client, count_statements):
+    assert _register(client).status_code == 201
+
+    for identifier, column in (('13912345678', 'phone'), ('alice@example.com', 'email'), ('alice', 'username')):
+        with count_statements() as statements:
+            resp = client.post('/api/login', json={'login': identifier, 'password': 'secret123'})
+        assert resp.status_code == 200
+        # SQLite 与 PostgreSQL 对 user 表名的引号不同，去掉引号后比较
+        lookup = [s.replace('"', '') for s in statements if s.lstrip().startswith('SELECT')][0]
+        assert 'FROM user' in lookup
+        where = lookup.split('WHERE', 1)[1]
+        assert f'user.{column} =' in where
+        assert ' OR ' not in where
+
+    resp = client.post('/api/login', json={'login': 'alice', 'password': 'wrong'})
+    assert resp.status_code == 401
+
+
+def test_login_falls_back_to_username_shaped_like_phone_or_email(client):
+    assert _register(client, username='13800000001').status_code == 201
+    assert _register(client, username='carol@example.com', phone='13900000002', email=None).status_code == 201
+
+    for identifier in ('13800000001', 'carol@example.com'):
+        resp = client.post('/api/login', json={'login': identifier, 'password': 'secret123'})
+        assert resp.status_code == 200, identifier
+    # 手机号本身仍优先按手机号列匹配
+    assert client.post('/api/login', json={'login': '13912345678', 'password': 'secret123'}).status_code == 200
+    assert client.post('/api/login', json={'login': '13700000000', 'password': 'secret123'}).status_code == 401
+
+
+def test_register_maps_unique_violations_without_preflight_selects(client, count_statements):
+    assert _register(client).status_code == 201
+
+    with count_statements() as statements:
+        resp = _register(client, phone='13900000000', email='other@example.com')
+    assert resp.status_code == 409
+    assert resp.get_json()['error'] == '用户名已存在'
+    assert not any(s.lstrip().startswith('SELECT') for s in statements)
+
+    resp = _register(client, username='bob', email='bob@example.com')
+    assert resp.status_code == 409
+    assert resp.get_json()['error'] == '手机号已被注册'
+
+    resp = _register(client, username='bob', phone='13900000000')
+    assert resp.status_code == 409
+    assert resp.get_json()['error'] == '邮箱已被注册'
+
+    assert _register(client, username='bob', phone='13900000000', email=None).status_code == 201
@@ -0,0 +1,70 @@
+"""条件 GET (ETag / Last-Modified) 测试"""
+from datetime import datetime, timedelta
+
+from models import db, Product, ProductStock, ProductCategory, NewsArticle
+
+
+def test_product_list_returns_304_for_matching_etag(client):
+    p = Product(name="蜂蜜", price=1)
+    p.stock = ProductStock(total_stock=3, available_stock=3, prelock_stock=0)
+    db.session.add(p)
+    db.session.commit()
+
+    first = client.get('/api/products')
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/products', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    # 库存变化不会更新 product.updated_at，但响应体变化会让 ETag 失效
+    p.stock.available_stock = 2
+    db.session.commit()
+    changed = client.get('/api/products', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_categories_use_cheap_validator(client):
+    db.session.add(ProductCategory(name="蜂蜜", updated_at=datetime(2025, 1, 1, 8, 0, 0)))
+    db.session.commit()
+
+    first = client.get('/api/products/categories')
+    assert first.headers['Last-Modified'] == 'Wed, 01 Jan 2025 08:00:00 GMT'
+
+    by_etag = client.get('/api/products/categories', headers={'If-None-Match': first.headers['ETag']})
+    assert by_etag.status_code == 304
+    by_date = client.get('/api/products/categories', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert by_date.status_code == 304
+
+    db.session.add(ProductCategory(name="蜂胶"))
+    db.session.commit()
+    assert client.get('/api/products/categories', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+def test_news_detail_revalidates_on_update(client):
+    article = NewsArticle(title="春季采蜜", content="正文", updated_at=datetime(2025, 3, 1))
+    db.session.add(article)
+    db.session.commit()
+
+    first = client.get(f'/api/news/{article.slug}')
+    etag = first.headers['ETag']
+    assert client.get(f'/api/news/{article.slug}', headers={'If-None-Match': etag}).status_code == 304
+
+    article.content = "新正文"
+    article.updated_at = datetime(2025, 3, 1) + timedelta(hours=1)
+    db.session.commit()
+    assert client.get(f'/api/news/{article.slug}', headers={'If-None-Match': etag}).status_code == 200
+
+    assert client.get('/api/news/missing').status_code == 404
+
+
+def test_news_list_etag_depends_on_page(client):
+    db.session.add(NewsArticle(title="资讯", content="正文"))
+    db.session.commit()
+    page1 = client.get('/api/news?page=1')
+    page2 = client.get('/api/news?page=2')
+    assert page1.headers['ETag'] != page2.headers['ETag']
+    assert client.get('/api/news?page=1', headers={'If-None-Match': page1.headers['ETag']}).status_code == 304
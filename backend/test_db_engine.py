@@ -0,0 +1,62 @@
+"""SQLite 连接 PRAGMA 配置测试"""
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from db_engine import init_sqlite_tuning
+
+
+def _pragma(db, name):
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+
+def test_pragmas_applied_on_connect(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'tuned.db'}",
+        SQLITE_PRAGMAS={'busy_timeout': 1234, 'mmap_size': None},
+    )
+    db = SQLAlchemy()
+    db.init_app(app)
+    pragmas = init_sqlite_tuning(app, db)
+    assert 'mmap_size' not in pragmas
+
+    with app.app_context():
+        assert _pragma(db, 'journal_mode') == 'wal'
+        assert _pragma(db, 'synchronous') == 1  # NORMAL
+        assert _pragma(db, 'busy_timeout') == 1234
+        assert _pragma(db, 'foreign_keys') == 1
+        assert _pragma(db, 'temp_store') == 2  # MEMORY
+        db.engine.dispose()
+
+
+def test_tuning_can_be_disabled(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'plain.db'}",
+        SQLITE_TUNING_ENABLED=False,
+    )
+    db = SQLAlchemy()
+    db.init_app(app)
+    assert init_sqlite_tuning(app, db) is None
+    with app.app_context():
+        assert _pragma(db, 'journal_mode') == 'delete'
+        db.engine.dispose()
+
+
+def test_savepoint_as_first_statement_stays_in_outer_transaction(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'savepoint.db'}")
+    db = SQLAlchemy()
+    db.init_app(app)
+    init_sqlite_tuning(app, db)
+
+    with app.app_context():
+        db.session.execute(db.text('CREATE TABLE t (v INTEGER)'))
+        db.session.commit()
+        with db.session.begin_nested():
+            db.session.execute(db.text('INSERT INTO t VALUES (1)'))
+        db.session.rollback()
+        assert db.session.execute(db.text('SELECT count(*) FROM t')).scalar() == 0
+        db.session.remove()
+        db.engine.dispose()
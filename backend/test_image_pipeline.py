@@ -0,0 +1,173 @@
+"""产品图片处理测试：多尺寸缩略图、去除 EXIF（含原图）、srcset 输出、后台处理与补处理"""
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from image_pipeline import ImagePipeline, image_files, strip_metadata, variant_widths
+from models import db, Product
+from static_files import upload_path
+
+
+@pytest.fixture
+def uploads(app, tmp_path):
+    app.config['UPLOADS_DIR'] = str(tmp_path / 'uploads')
+    app.config['PRODUCT_IMG_DIR'] = str(tmp_path / 'uploads' / 'products')
+    return tmp_path / 'uploads'
+
+
+def _exif(orientation=None):
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCam'  # Make
+    exif[0x8825] = {1: 'N', 2: (31.0, 14.0, 0.0)}  # GPS
+    if orientation:
+        exif[0x0112] = orientation
+    return exif.tobytes()
+
+
+def _jpeg(size=(2000, 1000), orientation=None):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 150, 50)).save(buf, 'JPEG', exif=_exif(orientation))
+    return buf.getvalue()
+
+
+def _png(size, mode='RGBA'):
+    buf = io.BytesIO()
+    Image.new(mode, size, (10, 20, 30, 128)).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def _create_product(client, name, content, filename='photo.jpg'):
+    resp = client.post('/api/products', data={
+        'name': name, 'price': '10', 'images': (io.BytesIO(content), filename),
+    }, content_type='multipart/form-data')
+    assert resp.status_code == 201, resp.get_json()
+    return resp.get_json()['product']
+
+
+def _open(app, url):
+    return Image.open(upload_path(url, app.config['UPLOADS_DIR']))
+
+
+def test_variant_widths_never_upscale():
+    assert variant_widths(3000, (200, 400, 800, 1600)) == [200, 400, 800, 1600]
+    assert variant_widths(1000, (200, 400, 800, 1600)) == [200, 400, 800, 1000]
+    assert variant_widths(150, (200, 400, 800, 1600)) == [150]
+
+
+def test_upload_generates_stripped_variants_and_srcset(app, client, uploads):
+    product = _create_product(client, 'Honey', _jpeg())
+
+    # images 仍为地址列表，指向最大的原格式缩略图
+    assert len(product['images']) == 1
+    assert product['images'][0].endswith('_1600w.jpg')
+
+    resp = client.get(f"/api/products/{product['id']}?fields=id,image_srcset")
+    entry = resp.get_json()['product']['image_srcset'][0]
+    assert (entry['width'], entry['height']) == (1600, 800)
+    assert entry['srcset'].split(', ')[0].endswith('_200w.jpg 200w')
+    assert [item.split(' ')[1] for item in entry['webp_srcset'].split(', ')] == ['200w', '400w', '800w', '1600w']
+
+    stored = db.session.get(Product, product['id']).images[0]
+    # 原图同样公开访问，保存时已去除 EXIF
+    with _open(app, stored['original']) as original:
+        assert not original.getexif()
+    for variant in stored['variants']:
+        with _open(app, variant['src']) as img:
+            assert img.format == 'JPEG'
+            assert img.size == (variant['width'], variant['height'])
+            assert not img.getexif()
+        with _open(app, variant['webp']) as img:
+            assert img.format == 'WEBP'
+            assert img.size == (variant['width'], variant['height'])
+
+    # 缩略图按 immutable 长期缓存
+    assert client.get(stored['variants'][0]['webp']).cache_control.immutable
+
+
+def test_exif_orientation_applied(app, client, uploads):
+    # 方向 6：顺时针旋转 90 度显示，横图变为竖图
+    product = _create_product(client, 'Rotated', _jpeg((1200, 600), orientation=6))
+    stored = db.session.get(Product, product['id']).images[0]
+    assert (stored['width'], stored['height']) == (600, 1200)
+    # 原图只保留方向标签
+    with _open(app, stored['original']) as original:
+        assert dict(original.getexif()) == {0x0112: 6}
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG', 'WEBP'])
+def test_strip_metadata_is_lossless(fmt):
+    buf = io.BytesIO()
+    Image.new('RGB', (40, 20), (200, 150, 50)).save(buf, fmt, exif=_exif(orientation=3))
+    stripped = strip_metadata(buf.getvalue())
+    assert b'TestCam' not in stripped
+    with Image.open(io.BytesIO(stripped)) as img, Image.open(buf) as source:
+        assert dict(img.getexif()) == {0x0112: 3}
+        assert img.tobytes() == source.tobytes()
+    # 没有元数据时不改动
+    assert strip_metadata(_png((4, 4))) is None
+
+
+def test_small_png_keeps_alpha(app, client, uploads):
+    product = _create_product(client, 'Logo', _png((100, 50)), 'logo.png')
+    stored = db.session.get(Product, product['id']).images[0]
+    assert [v['width'] for v in stored['variants']] == [100]
+    with _open(app, stored['src']) as img:
+        assert img.format == 'PNG' and img.mode == 'RGBA'
+    with _open(app, stored['variants'][0]['webp']) as img:
+        assert img.mode == 'RGBA'
+
+
+def test_animated_gif_left_as_is(client, uploads):
+    frames = [Image.new('RGB', (40, 40), color) for color in ((255, 0, 0), (0, 0, 255))]
+    buf = io.BytesIO()
+    frames[0].save(buf, 'GIF', save_all=True, append_images=frames[1:])
+    product = _create_product(client, 'Bee', buf.getvalue(), 'bee.gif')
+    assert db.session.get(Product, product['id']).images == product['images']
+    assert product['images'][0].endswith('.gif')
+
+
+def test_delete_removes_variants(app, client, uploads):
+    product = _create_product(client, 'Honey', _jpeg((800, 400)))
+    stored = db.session.get(Product, product['id']).images[0]
+    paths = [upload_path(url, app.config['UPLOADS_DIR']) for url in image_files(stored)]
+    assert len(paths) == 7 and all(os.path.exists(p) for p in paths)
+
+    assert client.delete(f"/api/products/{product['id']}").status_code == 200
+    assert not any(os.path.exists(p) for p in paths)
+
+
+def test_background_pipeline(threaded_app, tmp_path):
+    threaded_app.config['UPLOADS_DIR'] = str(tmp_path / 'uploads')
+    os.makedirs(tmp_path / 'uploads' / 'products')
+    (tmp_path / 'uploads' / 'products' / 'honey.jpg').write_bytes(_jpeg((500, 500)))
+    product = Product(name='Honey', price=1, images=['/uploads/products/honey.jpg'])
+    db.session.add(product)
+    db.session.commit()
+
+    pipeline = ImagePipeline(threaded_app, workers=1)
+    try:
+        future = pipeline.submit(product.id, product.images)
+        future.result(timeout=30)
+    finally:
+        pipeline.shutdown()
+
+    db.session.expire_all()
+    assert db.session.get(Product, product.id).images[0]['src'] == '/uploads/products/honey_500w.jpg'
+
+
+def test_backfill_command(app, uploads):
+    os.makedirs(uploads / 'products')
+    (uploads / 'products' / 'old.png').write_bytes(_png((300, 300), 'RGB'))
+    db.session.add(Product(name='Old', price=1, images=['/uploads/products/old.png', '/uploads/products/missing.jpg']))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['process-product-images'])
+    assert result.exit_code == 0, result.output
+    assert 'products=1 images=1' in result.output
+    images = Product.query.one().images
+    assert [v['webp'] for v in images[0]['variants']] == ['/uploads/products/old_200w.webp',
+                                                       '/uploads/products/old_300w.webp']
+    # 找不到的文件保持原样
+    assert images[1] == '/uploads/products/missing.jpg'
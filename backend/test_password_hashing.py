@@ -0,0 +1,85 @@
+"""密码哈希进程池与登录时透明重算测试"""
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from models import db, User
+from password_hashing import PasswordHasher, PasswordHasherBusy, normalize_method
+
+
+def test_normalize_method_expands_defaults():
+    assert normalize_method('scrypt') == 'scrypt:32768:8:1'
+    assert normalize_method('scrypt:16384') == 'scrypt:16384:8:1'
+    assert normalize_method('pbkdf2:sha256:1000') == 'pbkdf2:sha256:1000'
+    assert normalize_method('pbkdf2').startswith('pbkdf2:sha256:')
+
+
+def test_process_pool_hash_and_verify():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+    try:
+        pwhash = hasher.hash('secret123')
+        assert pwhash.startswith('pbkdf2:sha256:1000$')
+        assert hasher.verify(pwhash, 'secret123')
+        assert not hasher.verify(pwhash, 'wrong')
+        assert not hasher.needs_rehash(pwhash)
+        assert hasher.needs_rehash(generate_password_hash('secret123', 'pbkdf2:sha256:500'))
+    finally:
+        hasher.shutdown()
+
+
+def test_slow_hash_times_out_and_keeps_its_slot():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1, max_concurrency=1)
+    try:
+        hasher.hash('warm-up')  # 首次使用时启动子进程
+        hasher.timeout = 0.1
+        with pytest.raises(PasswordHasherBusy):
+            hasher._run(time.sleep, 1)
+        # 超时的任务仍在计算，名额未归还
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash('secret123')
+        time.sleep(1.2)
+        hasher.timeout = 10
+        assert hasher.hash('secret123').startswith('pbkdf2:sha256:1000$')
+    finally:
+        hasher.shutdown()
+
+
+def test_slot_wait_counts_towards_timeout():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1, max_concurrency=1)
+    try:
+        hasher.hash('warm-up')
+        hasher.timeout = 0.5
+        # 名额被占用 0.3 秒，拿到名额后只剩约 0.2 秒等结果
+        hasher._slots.acquire()
+        threading.Timer(0.3, hasher._slots.release).start()
+        started = time.monotonic()
+        with pytest.raises(PasswordHasherBusy):
+            hasher._run(time.sleep, 1)
+        assert time.monotonic() - started < 0.7
+    finally:
+        hasher.shutdown()
+
+
+def test_login_rehashes_outdated_hash(client, make_user):
+    user, _ = make_user()
+    user.password_hash = generate_password_hash('secret123', 'pbkdf2:sha256:500')
+    db.session.commit()
+
+    resp = client.post('/api/login', json={'login': user.username, 'password': 'secret123'})
+    assert resp.status_code == 200
+    assert db.session.get(User, user.id).password_hash.startswith('pbkdf2:sha256:1000$')
+
+
+def test_login_returns_503_when_hasher_is_saturated(app, client, make_user):
+    user, _ = make_user()
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', max_concurrency=1, timeout=0.05)
+    app.extensions['password_hasher'] = hasher
+    hasher._slots.acquire()
+    try:
+        resp = client.post('/api/login', json={'login': user.username, 'password': 'secret123'})
+    finally:
+        hasher._slots.release()
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '1'
@@ -0,0 +1,279 @@
+"""产品接口测试"""
+from datetime import datetime, timedelta
+
+import product_routes
+import stock_engine
+from models import db, Product, ProductStock, ProductCategory, ProductCategoryClosure, ProductTag, StockLog
+
+
+def _create_products(count, created_at=None):
+    base = created_at or datetime(2025, 1, 1)
+    products = []
+    for i in range(count):
+        p = Product(name=f"产品{i}", price=10 + i, created_at=base + timedelta(minutes=i))
+        p.stock = ProductStock(total_stock=5, available_stock=5, prelock_stock=0)
+        db.session.add(p)
+        products.append(p)
+    db.session.commit()
+    product_routes._invalidate_product_count()
+    return products
+
+
+def test_get_products_without_pagination_returns_all(client):
+    _create_products(3)
+    resp = client.get('/api/products')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert len(data['products']) == 3
+    assert 'next_cursor' not in data
+
+
+def test_keyset_pagination_walks_all_pages(client):
+    _create_products(5)
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/products?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(url).get_json()
+        assert data['total'] == 5
+        seen.extend(p['id'] for p in data['products'])
+        cursor = data['next_cursor']
+        if not data['has_more']:
+            assert cursor is None
+            break
+    assert seen == [5, 4, 3, 2, 1]
+
+
+def test_keyset_pagination_breaks_created_at_ties_by_id(client):
+    same_time = datetime(2025, 1, 1)
+    for i in range(3):
+        p = Product(name=f"同时{i}", price=1, created_at=same_time)
+        db.session.add(p)
+    db.session.commit()
+
+    first = client.get('/api/products?limit=2').get_json()
+    second = client.get(f"/api/products?limit=2&cursor={first['next_cursor']}").get_json()
+    assert [p['id'] for p in first['products']] == [3, 2]
+    assert [p['id'] for p in second['products']] == [1]
+
+
+def test_pagination_rejects_bad_params(client):
+    assert client.get('/api/products?limit=abc').status_code == 400
+    assert client.get('/api/products?limit=0').status_code == 400
+    assert client.get('/api/products?cursor=%%%').status_code == 400
+
+
+def test_total_is_served_from_cache(client):
+    _create_products(2)
+    assert client.get('/api/products?limit=1').get_json()['total'] == 2
+    # 绕过路由直接写库，缓存未失效时 total 保持不变
+    db.session.add(Product(name="直接写入", price=1))
+    db.session.commit()
+    assert client.get('/api/products?limit=1').get_json()['total'] == 2
+    product_routes._invalidate_product_count()
+    assert client.get('/api/products?limit=1').get_json()['total'] == 3
+
+
+def _create_categorized_products(count):
+    category = ProductCategory(name=f"分类{count}")
+    tag = ProductTag(name=f"标签{count}")
+    db.session.add_all([category, tag])
+    for i in range(count):
+        p = Product(name=f"带分类产品{count}-{i}", price=1, category=category, tags=[tag])
+        p.stock = ProductStock(total_stock=1, available_stock=1, prelock_stock=0)
+        db.session.add(p)
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def _count_list_statements(client, count_statements, url):
+    with count_statements() as statements:
+        resp = client.get(url)
+    assert resp.status_code == 200
+    return len(statements), resp.get_json()
+
+
+def test_product_list_statement_count_is_constant(client, count_statements):
+    _create_categorized_products(1)
+    small_count, small = _count_list_statements(client, count_statements, '/api/products')
+
+    _create_categorized_products(20)
+    large_count, large = _count_list_statements(client, count_statements, '/api/products')
+
+    assert len(small['products']) == 1
+    assert len(large['products']) == 21
+    assert all(p['category_name'] for p in large['products'])
+    assert large_count == small_count
+    # 产品+库存+分类一条 JOIN
+    assert large_count == 1
+
+    tags_count, tagged = _count_list_statements(client, count_statements, '/api/products?fields=id,tags')
+    assert tagged["products"][-1]["tags"] == ["标签1"]
+    # 请求标签时额外一条 SELECT ... IN
+    assert tags_count == 2
+
+
+def test_product_detail_loads_relations_eagerly(client, count_statements):
+    _create_categorized_products(1)
+    count, data = _count_list_statements(client, count_statements, '/api/products/1')
+    assert data['product']['category_name'] == "分类1"
+    assert count == 1
+
+
+def test_add_and_update_product_return_category_name(client):
+    category = ProductCategory(name="蜂蜜")
+    db.session.add(category)
+    db.session.commit()
+
+    resp = client.post('/api/products', data={
+        'name': '椴树蜜', 'price': '88.00', 'category_id': str(category.id), 'total_stock': '7'
+    })
+    assert resp.status_code == 201
+    created = resp.get_json()['product']
+    assert created['category_name'] == "蜂蜜"
+    assert created['total_stock'] == 7
+
+    resp = client.put(f"/api/products/{created['id']}", data={'name': '椴树蜜（新）', 'total_stock': '9'})
+    assert resp.status_code == 200
+    updated = resp.get_json()['product']
+    assert updated['name'] == '椴树蜜（新）'
+    assert updated['category_name'] == "蜂蜜"
+    assert updated['available_stock'] == 9
+
+
+def test_update_total_stock_goes_through_stock_engine(client):
+    product = _create_products(1)[0]
+    assert stock_engine.prelock(product.id, 2).ok
+    db.session.commit()
+
+    resp = client.put(f"/api/products/{product.id}", data={'name': product.name, 'description': '', 'total_stock': '8'})
+    assert resp.status_code == 200
+    updated = resp.get_json()['product']
+    assert (updated['total_stock'], updated['available_stock'], updated['prelock_stock']) == (8, 6, 2)
+
+    log = StockLog.query.filter_by(product_id=product.id, change_type=stock_engine.CHANGE_ADJUST).one()
+    assert log.change_amount == 3
+    assert (log.before_total, log.before_available, log.after_total, log.after_available) == (5, 3, 8, 6)
+
+    # 没有库存记录的产品由引擎创建库存
+    bare = Product(name="蜂巢蜜", price=1)
+    db.session.add(bare)
+    db.session.commit()
+    resp = client.put(f"/api/products/{bare.id}", data={'name': bare.name, 'description': '', 'total_stock': '4'})
+    assert resp.get_json()['product']['available_stock'] == 4
+
+
+def test_update_total_stock_conflicts_when_stock_changed_after_read(threaded_app, make_product, read_stock,
+                                                                     monkeypatch):
+    from sqlalchemy import update
+
+    pid = make_product(total=5, name="产品0")
+    original_adjust = stock_engine.adjust
+
+    def adjust_after_concurrent_change(product_id, delta, **kwargs):
+        # 接口读到总库存 5 之后、提交更新之前，另一个管理员在自己的连接里把总库存改成了 7
+        with db.engine.begin() as conn:
+            conn.execute(update(ProductStock).where(ProductStock.product_id == product_id).values(
+                total_stock=ProductStock.total_stock + 2, available_stock=ProductStock.available_stock + 2))
+        return original_adjust(product_id, delta, **kwargs)
+
+    monkeypatch.setattr(stock_engine, 'adjust', adjust_after_concurrent_change)
+    resp = threaded_app.test_client().put(f"/api/products/{pid}",
+                                          data={'name': "产品0", 'description': '', 'total_stock': '8'})
+    assert resp.status_code == 409
+    assert resp.get_json()['error'] == stock_engine.STALE_TOTAL_MESSAGE
+    # 并发的修改保留，按旧值算出的 +3 没有叠加上去
+    assert read_stock(pid) == (7, 7, 0)
+    assert StockLog.query.filter_by(product_id=pid).count() == 0
+
+
+def test_fields_projection_skips_stock_join(client, count_statements):
+    _create_categorized_products(2)
+    with count_statements() as statements:
+        resp = client.get('/api/products?fields=id,name,price,images')
+
+    products = resp.get_json()['products']
+    assert set(products[0]) == {'id', 'name', 'price', 'images'}
+    assert len(statements) == 1
+    assert 'product_stock' not in statements[0]
+    assert 'description' not in statements[0]
+
+
+def test_price_is_a_json_number(client):
+    p = Product(name="蜂蜜", price="9.90")
+    db.session.add(p)
+    db.session.commit()
+    product_routes._invalidate_product_count()
+
+    listed = client.get('/api/products').get_json()['products'][0]
+    detail = client.get(f'/api/products/{p.id}').get_json()['product']
+    assert listed['price'] == 9.9 and isinstance(listed['price'], float)
+    assert detail['price'] == 9.9 and isinstance(detail['price'], float)
+    assert b'"price":9.9' in client.get('/api/products?fields=id,price').data
+
+
+def test_unknown_field_is_rejected(client):
+    resp = client.get('/api/products?fields=id,secret')
+    assert resp.status_code == 400
+
+
+def test_to_dict_uses_shared_serializer(app):
+    _create_categorized_products(1)
+    product = Product.query.first()
+    data = product.to_dict()
+    assert data['category'] == "分类1"
+    assert data['stock_status'] == 1
+    assert 'total_stock' not in product.to_dict(include_stock=False)
+
+
+def _build_category_tree():
+    root = ProductCategory(name="蜂产品", slug="bee")
+    child = ProductCategory(name="蜂蜜", slug="honey", parent=root)
+    grandchild = ProductCategory(name="椴树蜜", slug="linden", parent=child)
+    other = ProductCategory(name="礼盒", slug="gift")
+    db.session.add_all([root, child, grandchild, other])
+    for i, category in enumerate([root, child, grandchild, other]):
+        db.session.add(Product(name=f"分类产品{i}", price=1, category=category))
+    db.session.commit()
+    return root, child, grandchild, other
+
+
+def test_category_filter_includes_descendants(client):
+    root, child, grandchild, other = _build_category_tree()
+
+    by_slug = client.get('/api/products?category=bee').get_json()['products']
+    assert sorted(p['category_name'] for p in by_slug) == sorted(["蜂产品", "蜂蜜", "椴树蜜"])
+
+    by_id = client.get(f'/api/products?category={child.id}').get_json()['products']
+    assert sorted(p['category_name'] for p in by_id) == sorted(["蜂蜜", "椴树蜜"])
+
+    assert client.get('/api/products?category=missing').get_json()['products'] == []
+
+    paged = client.get('/api/products?category=bee&limit=2').get_json()
+    assert paged['total'] == 3
+
+
+def test_category_closure_follows_tree_changes(client):
+    root, child, grandchild, other = _build_category_tree()
+
+    # 把“蜂蜜”子树移到“礼盒”下
+    child.parent = other
+    db.session.commit()
+    names = sorted(p['category_name'] for p in client.get('/api/products?category=gift').get_json()['products'])
+    assert names == sorted(["礼盒", "蜂蜜", "椴树蜜"])
+    assert len(client.get('/api/products?category=bee').get_json()['products']) == 1
+
+    rows = db.session.execute(
+        db.select(ProductCategoryClosure.depth).where(
+            ProductCategoryClosure.ancestor_id == other.id,
+            ProductCategoryClosure.descendant_id == grandchild.id,
+        )
+    ).scalar_one()
+    assert rows == 2
+
+
+def test_category_filter_is_a_single_query(client, count_statements):
+    _build_category_tree()
+    count, data = _count_list_statements(client, count_statements, '/api/products?category=bee')
+    assert len(data['products']) == 3
+    assert count == 1
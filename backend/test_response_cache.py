@@ -0,0 +1,101 @@
+"""响应缓存测试"""
+import time
+
+import pytest
+
+import stock_engine
+from models import db, Product, ProductStock
+from response_cache import CacheBackend, MemoryLRUCache, cache_stats
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+    class Incomplete(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_lru_evicts_least_recently_used():
+    cache = MemoryLRUCache(max_entries=2)
+    cache.set('a', 1, ttl=60)
+    cache.set('b', 2, ttl=60)
+    assert cache.get('a') == 1  # a 变为最近使用
+    cache.set('c', 3, ttl=60)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = MemoryLRUCache()
+    cache.set('a', 1, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_byte_limit_bounds_memory():
+    cache = MemoryLRUCache(max_bytes=10)
+    cache.set('a', 'x', ttl=60, size=6)
+    cache.set('b', 'y', ttl=60, size=6)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 6
+    cache.set('huge', 'z', ttl=60, size=11)
+    assert cache.get('huge') is None
+
+
+def test_product_list_is_cached_and_invalidated_by_writes(app, client):
+    app.config['RESPONSE_CACHE_ENABLED'] = True
+    db.session.add(Product(name="蜂王浆", price=1))
+    db.session.commit()
+
+    first = client.get('/api/products')
+    assert first.headers['X-Cache'] == 'MISS'
+    second = client.get('/api/products')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+
+    resp = client.post('/api/products', data={'name': '蜂胶', 'price': '2'})
+    assert resp.status_code == 201
+
+    third = client.get('/api/products')
+    assert third.headers['X-Cache'] == 'MISS'
+    assert len(third.get_json()['products']) == 2
+
+    stats = cache_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+
+
+def test_error_responses_are_not_cached(app, client):
+    app.config['RESPONSE_CACHE_ENABLED'] = True
+    assert client.get('/api/products/999').status_code == 404
+    assert client.get('/api/products/999').headers['X-Cache'] == 'MISS'
+
+
+def test_stock_writes_invalidate_product_cache(app, client):
+    app.config['RESPONSE_CACHE_ENABLED'] = True
+    product = Product(name="蜂王浆", price=1)
+    db.session.add(product)
+    db.session.flush()
+    db.session.add(ProductStock(product_id=product.id, total_stock=10, available_stock=10, prelock_stock=0))
+    db.session.commit()
+    url = '/api/products?fields=id,available_stock'
+
+    assert client.get(url).get_json()['products'][0]['available_stock'] == 10
+
+    # 回滚的库存写入不失效缓存
+    stock_engine.prelock(product.id, 3)
+    db.session.rollback()
+    assert client.get(url).headers['X-Cache'] == 'HIT'
+
+    # 下单预扣由库存引擎直接 UPDATE，提交后缓存失效
+    stock_engine.prelock(product.id, 3)
+    db.session.commit()
+    resp = client.get(url)
+    assert resp.headers['X-Cache'] == 'MISS'
+    assert resp.get_json()['products'][0]['available_stock'] == 7
@@ -0,0 +1,145 @@
+"""静态文件与上传文件发送测试：内容哈希文件名、缓存头、Range、预压缩副本与代理发送"""
+import gzip
+import io
+import os
+
+import pytest
+
+from static_files import IMMUTABLE_MAX_AGE, init_static_files
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'0123456789' * 10
+
+
+@pytest.fixture
+def uploads(app, tmp_path):
+    app.config['UPLOADS_DIR'] = str(tmp_path / 'uploads')
+    app.config['PRODUCT_IMG_DIR'] = str(tmp_path / 'uploads' / 'products')
+    return tmp_path / 'uploads'
+
+
+@pytest.fixture
+def static_dir(app, tmp_path):
+    root = tmp_path / 'site'
+    (root / 'assets').mkdir(parents=True)
+    app.static_folder = str(root)
+    return root
+
+
+def _create_product(client, name, content=PNG):
+    resp = client.post('/api/products', data={
+        'name': name, 'price': '10', 'images': (io.BytesIO(content), 'photo.PNG'),
+    }, content_type='multipart/form-data')
+    assert resp.status_code == 201, resp.get_json()
+    return resp.get_json()['product']
+
+
+def test_uploads_use_content_hash_and_immutable_cache(client, uploads):
+    first = _create_product(client, 'Honey')['images']
+    assert len(first) == 1
+    assert first[0].startswith('/uploads/products/honey_') and first[0].endswith('.png')
+    # 文件名前缀相同的产品上传相同内容得到同一个文件
+    assert _create_product(client, '蜂蜜 Honey')['images'] == first
+    assert len(os.listdir(uploads / 'products')) == 1
+
+    resp = client.get(first[0])
+    assert resp.status_code == 200
+    assert resp.data == PNG
+    assert resp.mimetype == 'image/png'
+    assert resp.cache_control.immutable
+    assert resp.cache_control.max_age == IMMUTABLE_MAX_AGE
+
+
+def test_shared_image_kept_until_last_product_deleted(client, uploads):
+    ids = [_create_product(client, name)['id'] for name in ('Honey', '蜂蜜 Honey')]
+    path = uploads / 'products' / os.listdir(uploads / 'products')[0]
+
+    assert client.delete(f'/api/products/{ids[0]}').status_code == 200
+    assert path.exists()
+    assert client.delete(f'/api/products/{ids[1]}').status_code == 200
+    assert not path.exists()
+
+
+def test_legacy_upload_names_revalidate(client, uploads):
+    (uploads / 'products').mkdir(parents=True)
+    (uploads / 'products' / 'honey_1.jpg').write_bytes(b'jpeg')
+
+    resp = client.get('/uploads/products/honey_1.jpg')
+    assert resp.status_code == 200
+    assert resp.cache_control.no_cache
+    assert not resp.cache_control.immutable
+    assert client.get('/uploads/products/honey_1.jpg', headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+    assert client.get('/uploads/../app.db').status_code == 404
+
+
+def test_range_and_if_range(client, uploads):
+    url = _create_product(client, 'Honey')['images'][0]
+    full = client.get(url)
+
+    part = client.get(url, headers={'Range': 'bytes=8-17'})
+    assert part.status_code == 206
+    assert part.data == PNG[8:18]
+    assert part.headers['Content-Range'] == f'bytes 8-17/{len(PNG)}'
+    assert part.cache_control.immutable
+
+    matching = client.get(url, headers={'Range': 'bytes=8-17', 'If-Range': full.headers['ETag']})
+    assert matching.status_code == 206
+    # If-Range 与当前版本不一致时返回完整文件
+    stale = client.get(url, headers={'Range': 'bytes=8-17', 'If-Range': '"stale"'})
+    assert stale.status_code == 200
+    assert stale.data == PNG
+
+    assert client.get(url, headers={'Range': f'bytes={len(PNG) + 10}-'}).status_code == 416
+
+
+def test_static_precompressed_siblings(client, static_dir):
+    script = b'console.log("ysj");\n' * 50
+    (static_dir / 'assets' / 'index-3f2a9c1b.js').write_bytes(script)
+    (static_dir / 'assets' / 'index-3f2a9c1b.js.gz').write_bytes(gzip.compress(script))
+    (static_dir / 'index.html').write_bytes(b'<html></html>')
+
+    plain = client.get('/assets/index-3f2a9c1b.js', headers={'Accept-Encoding': 'identity'})
+    assert plain.data == script
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+    assert plain.cache_control.immutable
+
+    compressed = client.get('/assets/index-3f2a9c1b.js', headers={'Accept-Encoding': 'br;q=0, gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.mimetype == 'text/javascript'
+    assert gzip.decompress(compressed.data) == script
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+    # 副本早于原文件（原文件已更新、副本未重新生成）时不使用
+    os.utime(static_dir / 'assets' / 'index-3f2a9c1b.js.gz', (0, 0))
+    assert 'Content-Encoding' not in client.get('/assets/index-3f2a9c1b.js',
+                                                headers={'Accept-Encoding': 'gzip'}).headers
+
+    index = client.get('/')
+    assert index.data == b'<html></html>'
+    assert index.cache_control.no_cache
+
+
+def test_offload_to_front_proxy(app, client, uploads, static_dir):
+    url = _create_product(client, 'Honey')['images'][0]
+    (static_dir / 'index.html').write_bytes(b'<html></html>')
+
+    app.config['FILE_OFFLOAD'] = 'x-accel'
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.data == b''
+    assert resp.headers['X-Accel-Redirect'] == '/_protected' + url
+    assert 'X-Sendfile' not in resp.headers
+    assert resp.cache_control.immutable
+    assert client.get('/').headers['X-Accel-Redirect'] == '/_protected/static/index.html'
+    assert 'X-Accel-Redirect' not in client.get(url, headers={'If-None-Match': resp.headers['ETag']}).headers
+
+    app.config['FILE_OFFLOAD'] = 'x-sendfile'
+    resp = client.get(url)
+    assert resp.headers['X-Sendfile'] == str(uploads) + url.removeprefix('/uploads')
+    assert resp.data == b''
+
+
+def test_invalid_offload_mode_rejected(app):
+    app.config['FILE_OFFLOAD'] = 'nginx'
+    with pytest.raises(ValueError):
+        init_static_files(app)
@@ -0,0 +1,241 @@
+"""库存引擎测试：条件 UPDATE 的正确性、库存日志与多线程并发下不超卖"""
+import threading
+
+import stock_engine
+from models import db, Product, ProductStock, StockLog
+
+
+def test_prelock_confirm_release_flow_and_logs(app, make_product, read_stock, count_statements):
+    pid = make_product(total=10)
+
+    with count_statements() as statements:
+        result = stock_engine.prelock(pid, 4, order_id='A1')
+    # 一条条件 UPDATE（RETURNING 取回变更后库存）+ 一条日志 INSERT
+    assert [s.split()[0] for s in statements] == ['UPDATE', 'INSERT']
+    assert result == stock_engine.StockResult(True, "预扣成功", 10, 6, 4)
+
+    assert stock_engine.confirm(pid, 3, order_id='A1').ok
+    assert stock_engine.release(pid, 1, order_id='A1').ok
+    db.session.commit()
+    assert read_stock(pid) == (7, 7, 0)
+
+    logs = StockLog.query.filter_by(product_id=pid).order_by(StockLog.log_id).all()
+    assert [(l.change_type, l.change_amount, l.operation_type) for l in logs] == [
+        (1, -4, 'order_create'), (2, -3, 'payment_confirm'), (3, 1, 'order_cancel')]
+    assert [(l.before_total, l.before_available, l.before_prelock) for l in logs] == [
+        (10, 10, 0), (10, 6, 4), (7, 6, 1)]
+
+
+def test_failures_do_not_change_stock(app, make_product, read_stock):
+    pid = make_product(total=2)
+    assert stock_engine.prelock(pid, 3) == stock_engine.StockResult(False, "可用库存不足", None, None, None)
+    assert stock_engine.confirm(pid, 1).message == "预扣库存异常"
+    assert stock_engine.prelock(9999, 1).message == "库存记录不存在"
+    assert stock_engine.prelock(pid, 0).message == "数量必须为正数"
+    assert stock_engine.adjust(pid, -3).message == "库存不足，无法调整至负数"
+    db.session.commit()
+    assert read_stock(pid) == (2, 2, 0)
+    assert StockLog.query.count() == 0
+
+
+def test_release_more_than_prelocked_releases_remaining(app, make_product):
+    pid = make_product(total=10, available=7, prelock=3)
+    result = stock_engine.release(pid, 5, order_id='B1')
+    db.session.commit()
+    assert (result.available, result.prelock) == (10, 0)
+    assert StockLog.query.filter_by(product_id=pid).one().change_amount == 3
+
+
+def test_adjust_creates_missing_stock_row(app):
+    product = Product(name="新品", price=1)
+    db.session.add(product)
+    db.session.commit()
+    result = stock_engine.adjust(product.id, 5, remark="入库")
+    db.session.commit()
+    assert (result.ok, result.total, result.available) == (True, 5, 5)
+
+
+def test_adjust_with_expected_total_only_applies_to_unchanged_total(app, make_product, read_stock):
+    pid = make_product(total=10, available=8, prelock=2)
+    assert stock_engine.adjust(pid, 3, expected_total=10).ok
+    result = stock_engine.adjust(pid, 3, expected_total=10)
+    assert (result.ok, result.message) == (False, stock_engine.STALE_TOTAL_MESSAGE)
+    # 总库存没变、可用库存不够时仍报库存不足
+    assert stock_engine.adjust(pid, -12, expected_total=13).message == "库存不足，无法调整至负数"
+    db.session.commit()
+    assert read_stock(pid) == (13, 11, 2)
+    assert StockLog.query.filter_by(product_id=pid).count() == 1
+
+
+def _run_concurrently(app, worker, threads):
+    barrier = threading.Barrier(threads)
+    results = []
+    lock = threading.Lock()
+
+    def run(idx):
+        with app.app_context():
+            barrier.wait()
+            outcome = worker(idx)
+            with lock:
+                results.append(outcome)
+            db.session.remove()
+
+    pool = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return results
+
+
+def test_concurrent_prelock_does_not_oversell(threaded_app):
+    from product_routes import _prelock_stock
+
+    product = Product(name="限量蜂蜜", price=99)
+    product.stock = ProductStock(total_stock=10, available_stock=10, prelock_stock=0)
+    db.session.add(product)
+    db.session.commit()
+    pid = product.id
+
+    def worker(idx):
+        ok, _ = _prelock_stock(pid, 1, order_id=f'ORDER-{idx}')
+        if ok:
+            db.session.commit()
+        else:
+            db.session.rollback()
+        return ok
+
+    results = _run_concurrently(threaded_app, worker, threads=16)
+
+    db.session.expire_all()
+    stock = ProductStock.query.filter_by(product_id=pid).one()
+    assert results.count(True) == 10
+    assert stock.available_stock == 0
+    assert stock.prelock_stock == 10
+    assert StockLog.query.filter_by(product_id=pid, change_type=1).count() == 10
+
+
+def test_concurrent_adjust_stock_keeps_every_update(threaded_app):
+    product = Product(name="蜂王浆", price=50)
+    product.stock = ProductStock(total_stock=0, available_stock=0, prelock_stock=0)
+    db.session.add(product)
+    db.session.commit()
+    pid = product.id
+
+    def worker(idx):
+        client = threaded_app.test_client()
+        return client.post(f'/api/products/{pid}/adjust-stock', json={'adjust_total': 1}).status_code
+
+    results = _run_concurrently(threaded_app, worker, threads=12)
+
+    db.session.expire_all()
+    stock = ProductStock.query.filter_by(product_id=pid).one()
+    assert results == [200] * 12
+    assert stock.total_stock == 12
+    assert stock.available_stock == 12
+
+
+def test_stress_mixed_operations_never_oversell(threaded_app, make_product, read_stock):
+    """32 个线程各自反复预扣 / 确认 / 释放，最终库存守恒且从未超卖"""
+    pid = make_product(total=50)
+    rounds = 10
+
+    def worker(idx):
+        sold = 0
+        for n in range(rounds):
+            order_id = f'T{idx}-{n}'
+            ok = stock_engine.prelock(pid, 2, order_id=order_id).ok
+            db.session.commit()
+            if not ok:
+                continue
+            if n % 3 == 0:
+                assert stock_engine.release(pid, 2, order_id=order_id).ok
+            else:
+                assert stock_engine.confirm(pid, 2, order_id=order_id).ok
+                sold += 2
+            db.session.commit()
+        return sold
+
+    results = _run_concurrently(threaded_app, worker, threads=32)
+
+    total, available, prelock = read_stock(pid)
+    sold = sum(results)
+    assert sold <= 50
+    assert (total, available, prelock) == (50 - sold, 50 - sold, 0)
+    confirmed = db.session.query(db.func.sum(StockLog.change_amount)).filter_by(product_id=pid, change_type=2).scalar()
+    assert -confirmed == sold
+
+
+def test_reserve_is_all_or_nothing(app, make_product, read_stock):
+    a = make_product(total=5, name="A")
+    b = make_product(total=1, name="B")
+    c = make_product(total=5, name="C")
+
+    result = stock_engine.reserve([(c, 2), (a, 2), (b, 2)], order_id='CART-1')
+    assert (result.ok, result.message, result.product_id) == (False, "可用库存不足", b)
+    db.session.commit()
+    assert [read_stock(pid) for pid in (a, b, c)] == [(5, 5, 0), (1, 1, 0), (5, 5, 0)]
+    assert StockLog.query.count() == 0
+
+    result = stock_engine.reserve([(c, 2), (a, 1), (b, 1), (a, 1)], order_id='CART-2')
+    assert result.ok
+    assert result.stocks == {a: (5, 3, 2), b: (1, 0, 1), c: (5, 3, 2)}
+    assert stock_engine.confirm_batch([(a, 2), (b, 1)], order_id='CART-2').ok
+    assert stock_engine.release_batch([(c, 2)], order_id='CART-2').ok
+    db.session.commit()
+    assert [read_stock(pid) for pid in (a, b, c)] == [(3, 3, 0), (0, 0, 0), (5, 5, 0)]
+
+    # 确认数量超过预扣量：整单失败，前面已确认的商品被撤销
+    stock_engine.reserve([(a, 1), (c, 1)], order_id='CART-3')
+    result = stock_engine.confirm_batch([(a, 1), (c, 2)], order_id='CART-3')
+    assert (result.ok, result.product_id) == (False, c)
+    assert read_stock(a) == (3, 2, 1)
+
+
+def test_failed_cart_leaves_stock_rows_untouched(app, make_product, read_stock):
+    a = make_product(total=2, name="A")
+    b = make_product(total=1, name="B")
+    def changed_at():
+        return db.session.execute(
+            db.select(ProductStock.product_id, ProductStock.status_changed_at).order_by(ProductStock.product_id)
+        ).all()
+
+    before = changed_at()
+
+    # A 被预扣到 0（状态变为缺货）后 B 不足：回滚到保存点，A 的状态变化时间不被改动
+    result = stock_engine.reserve([(a, 2), (b, 2)], order_id='CART-1')
+    assert (result.ok, result.product_id) == (False, b)
+    db.session.commit()
+    assert changed_at() == before
+    assert read_stock(a) == (2, 2, 0)
+
+
+def test_reserve_twenty_item_cart_statement_count(app, make_product, count_statements):
+    pids = [make_product(total=10, name=f"P{i}") for i in range(20)]
+
+    with count_statements() as statements:
+        result = stock_engine.reserve([(pid, 1) for pid in reversed(pids)], order_id='BIG')
+    assert result.ok
+    # 整单在一个保存点内：每个商品一条条件 UPDATE，日志一次 executemany
+    assert [s.split()[0] for s in statements] == ['SAVEPOINT'] + ['UPDATE'] * 20 + ['RELEASE', 'INSERT']
+    db.session.commit()
+    assert StockLog.query.filter_by(order_id='BIG').count() == 20
+
+
+def test_concurrent_overlapping_carts_never_oversell(threaded_app, make_product, read_stock):
+    pids = [make_product(total=6, name=f"C{i}") for i in range(4)]
+
+    def worker(idx):
+        # 每个线程的购物车包含不同顺序的重叠商品
+        cart = [(pids[(idx + k) % 4], 1) for k in range(3)]
+        result = stock_engine.reserve(cart, order_id=f'O{idx}')
+        db.session.commit()
+        return result.ok
+
+    results = _run_concurrently(threaded_app, worker, threads=12)
+
+    reserved = results.count(True)
+    stocks = [read_stock(pid) for pid in pids]
+    assert sum(6 - available for _, available, _ in stocks) == reserved * 3
+    assert all(available >= 0 and available + prelock == 6 for _, available, prelock in stocks)
+    assert StockLog.query.count() == reserved * 3
@@ -0,0 +1,111 @@
+"""库存账本测试：日志的变动前后库存、快照生成与任意时刻库存查询"""
+from datetime import datetime, timedelta
+
+import stock_engine
+import stock_ledger
+from models import db, ProductStock, StockLog, StockSnapshot
+
+T0 = datetime(2026, 1, 1)
+
+
+def _run_history(pid):
+    """在 T0 之后的 1/2/3/5/6 小时各执行一次库存操作"""
+    assert stock_engine.prelock(pid, 10, order_id='L1').ok
+    assert stock_engine.confirm(pid, 10, order_id='L1').ok
+    assert stock_engine.adjust(pid, 50, remark="补货").ok
+    assert stock_engine.prelock(pid, 5, order_id='L2').ok
+    assert stock_engine.release(pid, 5, order_id='L2').ok
+    db.session.commit()
+    logs = StockLog.query.filter_by(product_id=pid).order_by(StockLog.log_id).all()
+    for log, hours in zip(logs, (1, 2, 3, 5, 6)):
+        log.created_time = T0 + timedelta(hours=hours)
+    db.session.commit()
+    return logs
+
+
+def _as_of(pid, at):
+    result = stock_ledger.stock_as_of(pid, at)
+    return result[:3], result.snapshot_as_of, result.replayed
+
+
+def test_logs_record_before_and_after(app, make_product):
+    pid = make_product(total=100)
+    logs = _run_history(pid)
+    assert [(l.before_total, l.before_available, l.before_prelock, l.after_total, l.after_available, l.after_prelock)
+            for l in logs] == [(100, 100, 0, 100, 90, 10), (100, 90, 10, 90, 90, 0), (90, 90, 0, 140, 140, 0),
+                               (140, 140, 0, 140, 135, 5), (140, 135, 5, 140, 140, 0)]
+
+
+def test_stock_as_of_replays_from_nearest_snapshot(app, make_product):
+    pid = make_product(total=100)
+    _run_history(pid)
+
+    # 还没有快照时从当前库存倒推
+    assert _as_of(pid, T0) == ((100, 100, 0), None, 5)
+    assert _as_of(pid, T0 + timedelta(minutes=90)) == ((100, 90, 10), None, 4)
+
+    stats = stock_ledger.take_snapshots(now=T0 + timedelta(hours=4), lag_seconds=0)
+    assert (stats.as_of, stats.products) == (T0 + timedelta(hours=4), 1)
+    snapshot = StockSnapshot.query.filter_by(product_id=pid).one()
+    assert (snapshot.total_stock, snapshot.available_stock, snapshot.prelock_stock) == (140, 140, 0)
+
+    # 之后的时刻从快照向后回放，之前的时刻从快照倒推，都只回放快照与目标时刻之间的日志
+    assert _as_of(pid, T0 + timedelta(hours=5, minutes=30)) == ((140, 135, 5), T0 + timedelta(hours=4), 1)
+    assert _as_of(pid, T0 + timedelta(hours=4)) == ((140, 140, 0), T0 + timedelta(hours=4), 0)
+    assert _as_of(pid, T0 + timedelta(hours=2, minutes=30)) == ((90, 90, 0), T0 + timedelta(hours=4), 1)
+    assert stock_ledger.stock_as_of(9999, T0) is None
+
+
+def test_take_snapshots_only_for_changed_products(app, make_product):
+    pid = make_product(total=100)
+    idle = make_product(total=7, name="无变动产品")
+    _run_history(pid)
+
+    assert stock_ledger.take_snapshots(now=T0 + timedelta(hours=4), lag_seconds=0).products == 2
+    # 时间点不晚于上次快照时不重复生成
+    assert stock_ledger.take_snapshots(now=T0 + timedelta(hours=4), lag_seconds=0).products == 0
+    assert stock_ledger.take_snapshots(now=T0 + timedelta(hours=7), lag_seconds=0).products == 1
+    assert StockSnapshot.query.filter_by(product_id=idle).count() == 1
+    assert _as_of(pid, T0 + timedelta(hours=8)) == ((140, 140, 0), T0 + timedelta(hours=7), 0)
+    assert _as_of(idle, T0 + timedelta(hours=8)) == ((7, 7, 0), T0 + timedelta(hours=4), 0)
+
+
+def test_legacy_logs_without_stock_values_are_inferred(app, make_product):
+    pid = make_product(total=20)
+    db.session.add_all([
+        StockLog(product_id=pid, change_type=1, change_amount=-3, created_time=T0 + timedelta(hours=1)),
+        StockLog(product_id=pid, change_type=2, change_amount=-3, created_time=T0 + timedelta(hours=2)),
+        StockLog(product_id=pid, change_type=4, change_amount=6, created_time=T0 + timedelta(hours=3)),
+    ])
+    stock = ProductStock.query.filter_by(product_id=pid).one()
+    stock.total_stock = stock.available_stock = 23
+    db.session.commit()
+
+    assert _as_of(pid, T0)[0] == (20, 20, 0)
+    assert _as_of(pid, T0 + timedelta(hours=1))[0] == (20, 17, 3)
+    assert _as_of(pid, T0 + timedelta(hours=2))[0] == (17, 17, 0)
+
+
+def test_stock_as_of_endpoint(client, make_user, make_product):
+    pid = make_product(total=100)
+    _run_history(pid)
+    stock_ledger.take_snapshots(now=T0 + timedelta(hours=4), lag_seconds=0)
+    _, user_headers = make_user()
+    _, admin_headers = make_user(is_admin=True)
+    url = f'/api/products/{pid}/stock-as-of'
+
+    assert client.get(url, query_string={'at': '2026-01-01'}, headers=user_headers).status_code == 403
+    resp = client.get(url, query_string={'at': '2026-01-01T05:30:00'}, headers=admin_headers)
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['stock'] == {'total': 140, 'available': 135, 'prelock': 5}
+    assert (data['snapshot_as_of'], data['replayed_logs']) == ('2026-01-01T04:00:00', 1)
+
+    # 只给日期时按当天结束计算
+    data = client.get(url, query_string={'at': '2026-01-01'}, headers=admin_headers).get_json()
+    assert data['stock'] == {'total': 140, 'available': 140, 'prelock': 0}
+
+    assert client.get(url, headers=admin_headers).status_code == 400
+    assert client.get(url, query_string={'at': 'yesterday'}, headers=admin_headers).status_code == 400
+    assert client.get('/api/products/9999/stock-as-of', query_string={'at': '2026-01-01'},
+                      headers=admin_headers).status_code == 404
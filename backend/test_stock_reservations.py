@@ -0,0 +1,128 @@
+"""预扣记录与超时清扫测试"""
+import threading
+from datetime import datetime, timedelta
+
+import stock_reservations
+from models import db, StockReservation
+from product_routes import _prelock_stock, _confirm_stock_deduction, _release_stock
+
+
+def _later(seconds=601):
+    return datetime.utcnow() + timedelta(seconds=seconds)
+
+
+def test_prelock_records_reservation_with_expiry(app, make_product, read_stock):
+    pid = make_product()
+    assert _prelock_stock(pid, 3, order_id='R1') == (True, "预扣成功")
+    db.session.commit()
+
+    reservation = StockReservation.query.filter_by(order_id='R1').one()
+    assert (reservation.product_id, reservation.quantity, reservation.status) == (pid, 3, 'held')
+    ttl = (reservation.expires_at - reservation.created_at).total_seconds()
+    assert ttl == stock_reservations.RESERVATION_TTL_SECONDS
+
+    # 未过期的预扣不会被清扫
+    assert stock_reservations.sweep_expired().swept == 0
+    assert _confirm_stock_deduction(pid, 3, order_id='R1') == (True, "确认扣减成功")
+    db.session.commit()
+    assert read_stock(pid) == (7, 7, 0)
+    assert StockReservation.query.filter_by(order_id='R1').one().status == 'confirmed'
+
+
+def test_sweep_releases_expired_holds_in_batches(app, make_product, read_stock):
+    pid = make_product(total=20)
+    for n in range(7):
+        assert _prelock_stock(pid, 2, order_id=f'E{n}')[0]
+    assert _prelock_stock(pid, 1, order_id='KEEP')[0]
+    db.session.commit()
+    StockReservation.query.filter(StockReservation.order_id != 'KEEP').update(
+        {StockReservation.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    stock_reservations.sweep_metrics.clear()
+
+    stats = stock_reservations.sweep_expired(batch_size=3)
+    assert (stats.swept, stats.released_units, stats.batches) == (7, 14, 3)
+    assert stats.duration_ms >= 0
+    assert read_stock(pid) == (20, 19, 1)
+    assert StockReservation.query.filter_by(status='expired').count() == 7
+    assert StockReservation.query.filter_by(order_id='KEEP').one().status == 'held'
+
+    metrics = stock_reservations.sweep_stats()
+    assert (metrics['runs'], metrics['swept_total'], metrics['last_swept']) == (1, 7, 7)
+
+    # 已超时释放的预扣不能再确认，重复取消不会再次释放
+    assert _confirm_stock_deduction(pid, 2, order_id='E0') == (False, "预扣已超时释放")
+    assert _release_stock(pid, 2, order_id='E1') == (True, "预扣已超时释放")
+    db.session.commit()
+    assert read_stock(pid) == (20, 19, 1)
+
+
+def test_cancelled_reservation_is_not_swept_again(app, make_product, read_stock):
+    pid = make_product()
+    assert _prelock_stock(pid, 4, order_id='C1')[0]
+    assert _release_stock(pid, 4, order_id='C1') == (True, "释放成功")
+    db.session.commit()
+
+    assert stock_reservations.sweep_expired(now=_later()).swept == 0
+    assert read_stock(pid) == (10, 10, 0)
+    assert _release_stock(pid, 4, order_id='C1') == (True, "预扣已释放")
+
+
+def test_sweep_cli_command(app, client, make_user, make_product, read_stock):
+    pid = make_product()
+    assert _prelock_stock(pid, 5, order_id='CLI')[0]
+    StockReservation.query.update({StockReservation.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    stock_reservations.sweep_metrics.clear()
+
+    for _ in range(2):
+        result = app.test_cli_runner().invoke(stock_reservations.sweep_reservations_command, ['--batch-size', '10'])
+        assert result.exit_code == 0, result.output
+    assert 'swept=0 released_units=0 batches=0' in result.output
+    assert read_stock(pid) == (10, 10, 0)
+
+    # 指标存库：独立进程清扫后，任一 worker 的接口都能读到累计值
+    _, headers = make_user(is_admin=True)
+    metrics = client.get('/api/reservations/sweep-stats', headers=headers).get_json()
+    assert (metrics['runs'], metrics['swept_total'], metrics['last_swept']) == (2, 1, 0)
+    assert metrics['last_run_at'] is not None
+
+
+def test_concurrent_confirm_and_sweep_settle_each_hold_once(threaded_app, make_product, read_stock):
+    pid = make_product(total=40)
+    for n in range(20):
+        assert _prelock_stock(pid, 2, order_id=f'P{n}')[0]
+    db.session.commit()
+    StockReservation.query.update({StockReservation.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+    barrier = threading.Barrier(2)
+    confirmed = []
+
+    def pay():
+        with threaded_app.app_context():
+            barrier.wait()
+            for n in range(20):
+                ok, _ = _confirm_stock_deduction(pid, 2, order_id=f'P{n}')
+                db.session.commit()
+                if ok:
+                    confirmed.append(n)
+            db.session.remove()
+
+    def sweep():
+        with threaded_app.app_context():
+            barrier.wait()
+            stock_reservations.sweep_expired(batch_size=4)
+            db.session.remove()
+
+    threads = [threading.Thread(target=pay), threading.Thread(target=sweep)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    db.session.expire_all()
+    expired = StockReservation.query.filter_by(status='expired').count()
+    assert len(confirmed) + expired == 20
+    # 确认的扣减总库存，过期的退回可用库存，预扣全部清零
+    assert read_stock(pid) == (40 - 2 * len(confirmed), 40 - 2 * len(confirmed), 0)
@@ -0,0 +1,164 @@
+"""批量库存接口测试：逐条结果、集合化的语句数与库存日志"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from models import db, Product, ProductStock, StockLog
+
+
+def test_initialize_stock_returns_per_item_results(client, make_user, make_product):
+    _, headers = make_user(is_admin=True)
+    stocked = make_product(available=8, prelock=2, name="批量产品")
+    bare_product = Product(name="新品", price=10)
+    db.session.add(bare_product)
+    db.session.commit()
+    bare = bare_product.id
+
+    payload = [
+        {'product_id': stocked, 'total_stock': 20},
+        {'product_id': bare, 'total_stock': 5},
+        {'product_id': 9999, 'total_stock': 1},
+        {'total_stock': 1},
+        {'product_id': stocked, 'total_stock': 1},
+    ]
+    resp = client.post('/api/products/initialize-stock', json=payload, headers=headers)
+    assert resp.status_code == 200
+    results = resp.get_json()['results']
+    assert results[0] == {'success': True, 'product_id': stocked,
+                          'current_stock': {'total': 20, 'available': 18, 'prelock': 2}}
+    assert results[1]['current_stock'] == {'total': 5, 'available': 5, 'prelock': 0}
+    assert results[2] == {'success': False, 'product_id': 9999, 'message': 'ID为9999的产品不存在'}
+    assert results[3]['message'] == '缺少产品ID'
+    assert results[4]['message'] == '总库存 (1) 不能小于当前的预扣库存 (2)'
+
+    stock = ProductStock.query.filter_by(product_id=bare).one()
+    assert (stock.total_stock, stock.available_stock) == (5, 5)
+    logs = StockLog.query.order_by(StockLog.log_id).all()
+    assert [(l.product_id, l.change_type, l.change_amount, l.before_total) for l in logs] == [
+        (stocked, 5, 10, 10), (bare, 5, 5, 0)]
+
+
+def test_batch_adjust_uses_set_based_statements(client, make_user, make_product, count_statements):
+    user, headers = make_user(is_admin=True)
+    ids = [make_product(available=8, prelock=2, name=f"批量产品{n}") for n in range(50)]
+    payload = [{'product_id': pid, 'adjust_total': 3} for pid in ids]
+    payload.append({'product_id': ids[0], 'adjust_total': -1})
+    payload.append({'product_id': ids[1], 'adjust_total': -100})
+
+    # 只统计库存相关语句（首个请求校验令牌时会查询 user 表）
+    with count_statements(skip_user=True) as statements:
+        resp = client.post('/api/products/batch-adjust-stock', json=payload, headers=headers)
+    statements = [s.split()[0] for s in statements]
+    assert resp.status_code == 200
+    # 一条 IN 查询 + 一次 UPDATE executemany + 一次日志 INSERT executemany（不随条目数增长）
+    assert statements.count('SELECT') == 1
+    assert statements.count('UPDATE') == 1
+    assert statements.count('INSERT') == 1
+
+    results = resp.get_json()['results']
+    assert results[0]['current_stock'] == {'total': 13, 'available': 11, 'prelock': 2}
+    assert results[50]['current_stock'] == {'total': 12, 'available': 10, 'prelock': 2}
+    assert results[51] == {'success': False, 'product_id': ids[1], 'message': '调整后的库存不能小于0'}
+
+    db.session.expire_all()
+    assert ProductStock.query.filter_by(product_id=ids[0]).one().total_stock == 12
+    assert StockLog.query.count() == 51
+    assert {l.admin_id for l in StockLog.query} == {user.id}
+
+
+def test_bulk_stock_endpoints_require_admin(client, make_user):
+    _, headers = make_user()
+    resp = client.post('/api/products/batch-adjust-stock', json=[{'product_id': 1, 'adjust_total': 1}],
+                       headers=headers)
+    assert resp.status_code == 403
+    _, admin_headers = make_user(is_admin=True)
+    assert client.post('/api/products/batch-adjust-stock', json={}, headers=admin_headers).status_code == 400
+
+
+def _seed_stocked_products(count, prefix):
+    db.session.execute(insert(Product.__table__), [
+        dict(name=f"{prefix}{n}", slug=f"{prefix}-{n}", price=10, created_at=datetime.utcnow()) for n in range(count)])
+    ids = db.session.execute(db.select(Product.id).where(Product.slug.startswith(f"{prefix}-"))).scalars().all()
+    db.session.execute(insert(ProductStock.__table__), [
+        dict(product_id=pid, total_stock=10, available_stock=10, prelock_stock=0) for pid in ids])
+    db.session.commit()
+    return ids
+
+
+def test_batch_adjust_statement_count_is_independent_of_item_count(client, make_user, count_statements):
+    # 耗时基准见 benchmarks/bench_bulk_stock.py；这里只检查语句数，结果不受机器快慢影响
+    _, headers = make_user(is_admin=True)
+    counts = []
+    for prefix, size in (('small', 10), ('large', 10000)):
+        payload = [{'product_id': pid, 'adjust_total': 1} for pid in _seed_stocked_products(size, prefix)]
+        with count_statements(skip_user=True) as statements:
+            resp = client.post('/api/products/batch-adjust-stock', json=payload, headers=headers)
+        assert resp.status_code == 200
+        assert all(r['success'] for r in resp.get_json()['results'])
+        counts.append([s.split()[0] for s in statements])
+    assert counts[0] == counts[1] == ['SELECT', 'UPDATE', 'INSERT']
+    assert StockLog.query.count() == 10010
+
+
+def _seed_logs(pid, count):
+    base = datetime(2026, 5, 1, 8, 0, 0)
+    db.session.execute(insert(StockLog.__table__), [
+        dict(product_id=pid, change_type=4 if n % 2 else 1, change_amount=n, remark=f"日志{n}",
+             created_time=base + timedelta(hours=n))
+        for n in range(count)])
+    db.session.commit()
+
+
+def test_stock_logs_are_paginated_and_filterable(client, make_user, make_product):
+    _, headers = make_user(is_admin=True)
+    pid = make_product()
+    _seed_logs(pid, 30)
+
+    seen = []
+    cursor = None
+    while True:
+        query = {'limit': 8}
+        if cursor:
+            query['cursor'] = cursor
+        body = client.get(f'/api/products/{pid}/stock-logs', query_string=query, headers=headers).get_json()
+        seen.extend(log['change_amount'] for log in body['logs'])
+        cursor = body['next_cursor']
+        if not body['has_more']:
+            break
+    assert seen == list(range(29, -1, -1))
+
+    # 2026-05-01 08:00 起每小时一条：5 月 1 日共 16 条，其中 change_type=4 的 8 条
+    body = client.get(f'/api/products/{pid}/stock-logs', headers=headers,
+                      query_string={'start': '2026-05-01', 'end': '2026-05-01', 'change_type': 4}).get_json()
+    assert len(body['logs']) == 8 and not body['has_more']
+    body = client.get(f'/api/products/{pid}/stock-logs', headers=headers,
+                      query_string={'start': '2026-05-02T00:00:00', 'end': '2026-05-02T01:00:00'}).get_json()
+    assert [log['change_amount'] for log in body['logs']] == [17, 16]
+
+    assert client.get(f'/api/products/{pid}/stock-logs', query_string={'start': 'yesterday'},
+                      headers=headers).status_code == 400
+    assert client.get(f'/api/products/{pid}/stock-logs', query_string={'cursor': '!!'},
+                      headers=headers).status_code == 400
+
+
+def test_stock_logs_stream_ndjson_and_csv(client, make_user, make_product):
+    _, headers = make_user(is_admin=True)
+    pid = make_product()
+    _seed_logs(pid, 2500)
+
+    resp = client.get(f'/api/products/{pid}/stock-logs', query_string={'format': 'ndjson'}, headers=headers)
+    assert resp.status_code == 200 and resp.is_streamed
+    assert resp.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert len(rows) == 2500
+    assert rows[0]['change_amount'] == 0 and rows[-1]['change_amount'] == 2499
+
+    resp = client.get(f'/api/products/{pid}/stock-logs', headers=headers,
+                      query_string={'format': 'csv', 'end': '2026-05-01'})
+    assert resp.headers['Content-Disposition'] == f'attachment; filename=stock_logs_{pid}.csv'
+    lines = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+    assert lines[0][:4] == ['id', 'product_id', 'change_type', 'change_amount']
+    assert len(lines) == 1 + 16
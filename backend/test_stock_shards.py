@@ -0,0 +1,134 @@
+"""分片库存测试：分片上的预扣/确认/释放、再平衡、合并以及并发不超卖"""
+import threading
+
+import stock_engine
+import stock_shards
+from models import db, Product, ProductStock, ProductStockShard, StockLog
+
+
+def _shard_availables(pid):
+    return db.session.execute(
+        db.select(ProductStockShard.available_stock)
+        .where(ProductStockShard.product_id == pid).order_by(ProductStockShard.shard_no)
+    ).scalars().all()
+
+
+def test_enable_sharding_spreads_available_stock(app, make_product, read_stock):
+    pid = make_product(total=10, shards=0)
+    assert stock_engine.prelock(pid, 3, order_id='OLD').ok
+    db.session.commit()
+
+    assert stock_shards.set_shard_count(pid, 3) == (True, "已开启 3 个库存分片")
+    db.session.commit()
+    base = ProductStock.query.filter_by(product_id=pid).one()
+    # 已有的预扣留在本行，可用库存均分到各分片
+    assert (base.total_stock, base.available_stock, base.prelock_stock) == (3, 0, 3)
+    assert _shard_availables(pid) == [3, 2, 2]
+    assert read_stock(pid) == (10, 7, 3)
+
+    product = db.session.get(Product, pid)
+    data = product.to_dict()
+    assert (data['total_stock'], data['available_stock'], data['prelock_stock']) == (10, 7, 3)
+    assert product.effective_stock == 4
+
+    assert stock_shards.set_shard_count(pid, 65)[0] is False
+    assert stock_shards.set_shard_count(9999, 2) == (False, "库存记录不存在")
+
+
+def test_sharded_flow_uses_shard_rows(app, make_product, read_stock):
+    pid = make_product(total=100, shards=4)
+
+    result = stock_engine.prelock(pid, 5, order_id='S1')
+    assert (result.ok, result.total, result.available, result.prelock) == (True, 100, 95, 5)
+    # 单个分片不够时拆分到多个分片
+    assert stock_engine.reserve([(pid, 40)], order_id='S2').ok
+    assert stock_engine.confirm(pid, 5, order_id='S1').ok
+    assert stock_engine.release_batch([(pid, 40)], order_id='S2').ok
+    db.session.commit()
+    assert read_stock(pid) == (95, 95, 0)
+    assert ProductStock.query.filter_by(product_id=pid).one().available_stock == 0
+
+    assert stock_engine.prelock(pid, 96).message == "可用库存不足"
+    assert stock_engine.adjust(pid, 10, remark="补货").ok
+    assert stock_engine.adjust(pid, -30, remark="盘亏").ok
+    assert stock_engine.adjust(pid, -100).message == "库存不足，无法调整至负数"
+    db.session.commit()
+    assert read_stock(pid) == (75, 75, 0)
+
+    logs = StockLog.query.filter_by(product_id=pid).order_by(StockLog.log_id).all()
+    assert [(l.change_type, l.before_total, l.before_available, l.before_prelock) for l in logs] == [
+        (1, 100, 100, 0), (1, 100, 95, 5), (2, 100, 55, 45), (3, 95, 55, 40), (4, 95, 95, 0), (4, 105, 105, 0)]
+
+
+def test_failed_batch_undoes_shard_changes(app, make_product, read_stock):
+    pid = make_product(total=20, shards=2)
+    other = make_product(total=1, shards=0, name="小样")
+    assert not stock_engine.reserve([(pid, 15), (other, 2)], order_id='X').ok
+    db.session.commit()
+    assert read_stock(pid) == (20, 20, 0)
+    assert _shard_availables(pid) == [10, 10]
+
+
+def test_rebalance_and_disable(app, make_product, read_stock):
+    pid = make_product(total=40, shards=4)
+    db.session.execute(db.update(ProductStockShard).where(ProductStockShard.product_id == pid,
+                                                          ProductStockShard.shard_no == 0)
+                       .values(available_stock=0, prelock_stock=10))
+    db.session.commit()
+    assert _shard_availables(pid) == [0, 10, 10, 10]
+
+    assert stock_shards.rebalance_all() == 1
+    assert _shard_availables(pid) == [8, 8, 7, 7]
+    assert read_stock(pid) == (40, 30, 10)
+    assert stock_shards.rebalance_all() == 0
+
+    assert stock_shards.set_shard_count(pid, 0) == (True, "已关闭分片库存")
+    db.session.commit()
+    base = ProductStock.query.filter_by(product_id=pid).one()
+    assert (base.shard_count, base.total_stock, base.available_stock, base.prelock_stock) == (0, 40, 30, 10)
+    assert ProductStockShard.query.filter_by(product_id=pid).count() == 0
+
+
+def test_stock_shards_endpoint_requires_admin(client, make_user, make_product):
+    pid = make_product(total=10, shards=0)
+    _, user_headers = make_user()
+    _, admin_headers = make_user(is_admin=True)
+
+    assert client.put(f'/api/products/{pid}/stock-shards', json={'shards': 2}, headers=user_headers).status_code == 403
+    resp = client.put(f'/api/products/{pid}/stock-shards', json={'shards': 2}, headers=admin_headers)
+    assert resp.status_code == 200
+    data = resp.get_json()['data']
+    assert (data['shard_count'], data['current_stock']) == (2, {'total': 10, 'available': 10, 'prelock': 0})
+
+    resp = client.put(f'/api/products/{pid}', data={'name': '礼盒', 'price': '10', 'description': '', 'total_stock': '5'},
+                      headers=admin_headers)
+    assert resp.status_code == 409
+
+
+def test_concurrent_sharded_prelock_does_not_oversell(threaded_app, make_product, read_stock):
+    pid = make_product(total=30, shards=4)
+    barrier = threading.Barrier(16)
+    results = []
+    lock = threading.Lock()
+
+    def worker(idx):
+        with threaded_app.app_context():
+            barrier.wait()
+            for n in range(3):
+                ok = stock_engine.prelock(pid, 1, order_id=f'F{idx}-{n}').ok
+                if ok:
+                    db.session.commit()
+                else:
+                    db.session.rollback()
+                with lock:
+                    results.append(ok)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(True) == 30
+    assert read_stock(pid) == (30, 0, 30)
@@ -0,0 +1,129 @@
+"""库存状态维护列测试：随库存变动同步更新、低库存索引查询与状态变化增量拉取"""
+import stock_engine
+import stock_routes
+import stock_shards
+from models import db, Product, ProductStock
+
+
+def _maintained(pid):
+    db.session.expire_all()
+    stock = ProductStock.query.filter_by(product_id=pid).one()
+    return stock.warning_stock, stock.effective_stock, stock.stock_status
+
+
+def _assert_matches_properties(pid):
+    product = db.session.get(Product, pid)
+    assert _maintained(pid) == (product.warning_stock, product.effective_stock, product.stock_status)
+
+
+def test_engine_and_orm_writes_maintain_status_columns(app, make_product):
+    pid = make_product(total=20, warning=5)
+    assert _maintained(pid) == (5, 20, 2)
+
+    assert stock_engine.prelock(pid, 8, order_id='W1').ok
+    db.session.commit()
+    assert _maintained(pid) == (5, 4, 1)
+    _assert_matches_properties(pid)
+
+    # 整单失败时撤销的变更同样回退维护列
+    other = make_product(total=1, warning=5, name="小样")
+    assert not stock_engine.reserve([(pid, 10), (other, 2)], order_id='W2').ok
+    db.session.commit()
+    assert _maintained(pid) == (5, 4, 1)
+
+    assert stock_engine.release(pid, 8, order_id='W1').ok
+    assert stock_engine.adjust(pid, -20).ok
+    db.session.commit()
+    assert _maintained(pid) == (5, 0, 0)
+    _assert_matches_properties(pid)
+
+    product = db.session.get(Product, pid)
+    product.warning_stock = 30
+    product.stock.available_stock = product.stock.total_stock = 25
+    db.session.commit()
+    assert _maintained(pid) == (30, 25, 1)
+    _assert_matches_properties(pid)
+
+
+def test_sharded_products_refresh_on_rebalance(app, make_product):
+    pid = make_product(total=40, warning=10)
+    assert stock_shards.set_shard_count(pid, 4)[0]
+    db.session.commit()
+    assert _maintained(pid) == (10, 40, 2)
+
+    # 分片上的预扣不回写本行，再平衡任务刷新
+    assert stock_engine.prelock(pid, 10, order_id='S1').ok
+    db.session.commit()
+    assert _maintained(pid) == (10, 40, 2)
+    stock_shards.rebalance_all()
+    assert _maintained(pid) == (10, 20, 2)
+    _assert_matches_properties(pid)
+
+
+def test_bulk_endpoints_maintain_status_columns(client, make_user, make_product):
+    _, headers = make_user(is_admin=True)
+    stocked = make_product(total=20, warning=5)
+    bare = Product(name="新品", price=10, warning_stock=8)
+    db.session.add(bare)
+    db.session.commit()
+
+    resp = client.post('/api/products/initialize-stock', headers=headers,
+                       json=[{'product_id': bare.id, 'total_stock': 6}])
+    assert resp.status_code == 200
+    assert _maintained(bare.id) == (8, 6, 1)
+
+    resp = client.post('/api/products/batch-adjust-stock', headers=headers,
+                       json=[{'product_id': stocked, 'adjust_total': -16}])
+    assert resp.status_code == 200
+    assert _maintained(stocked) == (5, 4, 1)
+
+
+def test_low_stock_endpoint(client, make_user, make_product):
+    _, user_headers = make_user()
+    _, headers = make_user(is_admin=True)
+    healthy = make_product(total=50, warning=5, name="充足")
+    warning = make_product(total=4, warning=5, name="预警")
+    empty = make_product(total=0, warning=5, name="售罄")
+    edge = make_product(total=5, warning=5, name="临界")
+
+    assert client.get('/api/products/low-stock', headers=user_headers).status_code == 403
+    data = client.get('/api/products/low-stock', headers=headers).get_json()
+    assert [p['product_id'] for p in data['products']] == [empty, warning, edge]
+    assert [p['stock_status'] for p in data['products']] == [0, 1, 1]
+    assert healthy not in [p['product_id'] for p in data['products']]
+
+    page = client.get('/api/products/low-stock', query_string={'limit': 2}, headers=headers).get_json()
+    assert [p['product_id'] for p in page['products']] == [empty, warning]
+    assert page['has_more']
+    page = client.get('/api/products/low-stock', query_string={'limit': 2, 'cursor': page['next_cursor']},
+                      headers=headers).get_json()
+    assert [p['product_id'] for p in page['products']] == [edge]
+    assert not page['has_more']
+
+    assert client.get('/api/products/low-stock', query_string={'cursor': 'bad'}, headers=headers).status_code == 400
+    assert client.get('/api/products/low-stock', query_string={'limit': 0}, headers=headers).status_code == 400
+
+
+def test_stock_status_change_feed(client, make_user, monkeypatch, make_product):
+    monkeypatch.setattr(stock_routes, 'STOCK_STATUS_FEED_LAG_SECONDS', 0)
+    _, headers = make_user(is_admin=True)
+    first = make_product(total=20, warning=5, name="甲")
+    second = make_product(total=20, warning=5, name="乙")
+
+    data = client.get('/api/products/stock-status-changes', headers=headers).get_json()
+    assert [(c['product_id'], c['stock_status']) for c in data['changes']] == [(first, 2), (second, 2)]
+    cursor = data['next_cursor']
+
+    # 没有变化时游标不变
+    data = client.get('/api/products/stock-status-changes', query_string={'cursor': cursor}, headers=headers).get_json()
+    assert data['changes'] == [] and data['next_cursor'] == cursor
+
+    # 库存变动但状态不变的产品不会出现
+    assert stock_engine.prelock(first, 2, order_id='F1').ok
+    assert stock_engine.prelock(second, 8, order_id='F2').ok
+    db.session.commit()
+    data = client.get('/api/products/stock-status-changes', query_string={'cursor': cursor}, headers=headers).get_json()
+    assert [(c['product_id'], c['stock_status'], c['effective_stock']) for c in data['changes']] == [(second, 1, 4)]
+
+    assert client.get('/api/products/stock-status-changes', query_string={'cursor': '!!'},
+                      headers=headers).status_code == 400
@@ -0,0 +1,64 @@
+"""生产部署测试：gunicorn 配置的 worker 推算与 fork 后的资源重建"""
+import os
+import runpy
+
+import app_logging
+from app import reinit_after_fork
+from models import db, Product
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _gunicorn_conf():
+    return runpy.run_path(os.path.join(BACKEND_DIR, 'gunicorn.conf.py'))
+
+
+def test_worker_settings_follow_cpu_count():
+    worker_settings = _gunicorn_conf()['worker_settings']
+    assert worker_settings(1) == ('gthread', 2, 4)
+    assert worker_settings(2) == ('gthread', 3, 4)
+    assert worker_settings(4) == ('sync', 9, 1)
+    assert worker_settings(None) == ('gthread', 2, 4)
+    # 显式指定的值优先
+    assert worker_settings(8, worker_class='gthread', threads=8) == ('gthread', 9, 8)
+    assert worker_settings(1, worker_class='sync', workers=3) == ('sync', 3, 1)
+
+
+def test_gunicorn_conf_env_overrides(monkeypatch):
+    # 配置文件会 setdefault 环境变量，用副本隔离
+    monkeypatch.setattr(os, 'environ', dict(os.environ))
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'sync')
+    monkeypatch.setenv('WEB_CONCURRENCY', '5')
+    monkeypatch.setenv('GUNICORN_MAX_REQUESTS', '2000')
+    monkeypatch.delenv('PASSWORD_HASH_WORKERS', raising=False)
+    monkeypatch.setenv('RESERVATION_SWEEP_INTERVAL', '30')
+    conf = _gunicorn_conf()
+    assert (conf['worker_class'], conf['workers']) == ('sync', 5)
+    assert (conf['max_requests'], conf['max_requests_jitter']) == (2000, 200)
+    assert conf['preload_app'] is True
+    assert os.environ['PASSWORD_HASH_WORKERS'] == '0'
+    # 预扣清扫由独立进程执行，gunicorn 进程内不启动清扫线程
+    assert os.environ['RESERVATION_SWEEP_INTERVAL'] == '0'
+
+
+def test_reinit_after_fork_uses_fresh_connections(threaded_app):
+    db.session.add(Product(name='fork', price=1))
+    db.session.commit()
+    db.session.remove()
+
+    pid = os.fork()
+    if pid == 0:
+        # 子进程：重建后仍能读写数据库，并且日志线程在运行
+        code = 1
+        try:
+            reinit_after_fork(threaded_app)
+            with threaded_app.app_context():
+                ok = db.session.query(Product).filter_by(name='fork').count() == 1
+            if ok and app_logging._listener._thread.is_alive():
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    # 父进程的连接不受子进程影响
+    assert db.session.query(Product).count() == 1
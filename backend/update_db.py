@@ -1,10 +1,12 @@
 """
 数据库更新脚本：增强用户模型和添加新的相关表
 """
+import os
+# 维护脚本不需要签发令牌：未指定 APP_CONFIG 时用开发配置，不要求设置 JWT_SECRET_KEY（见 config.py）
+os.environ.setdefault('APP_CONFIG', 'development')
 from app import app
 from models import db, User, Address, UserCustomField, UserFieldDefinition, MemberLevel, PointsRecord, UserCoupon, Coupon
 import sqlite3
-import os
 
 def check_column_exists(table, column):
     """检查表中是否存在特定列"""
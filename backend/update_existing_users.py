@@ -1,6 +1,9 @@
 """
 为现有用户更新手机号（临时值）
 """
+import os
+# 维护脚本不需要签发令牌：未指定 APP_CONFIG 时用开发配置，不要求设置 JWT_SECRET_KEY（见 config.py）
+os.environ.setdefault('APP_CONFIG', 'development')
 from app import app
 from models import db, User
 import random
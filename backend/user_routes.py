@@ -3,42 +3,17 @@ from flask import Blueprint, jsonify, request, abort
 from models import db, User, Address, UserCustomField, UserFieldDefinition, MemberLevel, PointsRecord, UserCoupon, Coupon
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash # 用于更新密码
-from functools import wraps
 from sqlalchemy import or_
 from datetime import datetime
+from response_cache import cached_response, invalidate
+from app_logging import get_logger
+from utils.auth import admin_required, invalidate_principal
 
 user_bp = Blueprint('user', __name__, url_prefix='/api')
+log = get_logger('user')
 
-# --- 权限检查装饰器 (示例) ---
-def admin_required(fn):
-    """装饰器：检查 JWT 身份是否为管理员"""
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        # 手动验证JWT
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "未提供有效的认证令牌"}), 401
-            
-        try:
-            # 手动获取用户身份
-            from flask_jwt_extended import decode_token
-            token = auth_header.split(' ')[1]
-            decoded_token = decode_token(token)
-            current_user_id = decoded_token['sub']
-            
-            # 检查管理员权限
-            user = User.query.get(current_user_id)
-            if not user or not user.is_admin:
-                return jsonify({"error": "管理员权限不足"}), 403
-                
-            # 验证通过，执行原函数
-            return fn(*args, **kwargs)
-        except Exception as e:
-            # 处理验证失败的情况
-            import sys
-            print(f"[DEBUG] Admin验证失败: {str(e)}", file=sys.stderr)
-            return jsonify({"error": "认证验证失败"}), 401
-    return wrapper
+# 调试接口不记录、不回显的请求头（令牌与会话）
+_SENSITIVE_HEADERS = frozenset(('authorization', 'cookie', 'proxy-authorization', 'x-csrf-token'))
 
 # --- 序列化函数 (简化示例) ---
 def serialize_user(user: User, include_email=False, include_details=False, include_custom_fields=False):
@@ -399,6 +374,7 @@ def get_my_coupons():
 
 # 新增：获取会员等级
 @user_bp.route('/member-levels', methods=['GET'])
+@cached_response('member_levels', ttl=600)
 def get_member_levels():
     """获取所有会员等级"""
     levels = MemberLevel.query.order_by(MemberLevel.min_points).all()
@@ -421,6 +397,7 @@ def get_member_levels():
 
 # 新增：获取用户字段定义
 @user_bp.route('/user-fields', methods=['GET'])
+@cached_response('user_fields', ttl=600)
 def get_user_field_definitions():
     """获取所有用户字段定义"""
     fields = UserFieldDefinition.query.filter_by(is_visible=True).order_by(UserFieldDefinition.display_order).all()
@@ -466,6 +443,7 @@ def add_user_field_definition():
     try:
         db.session.add(field_def)
         db.session.commit()
+        invalidate('user_fields')
         return jsonify({
             "message": "字段定义添加成功",
             "field": serialize_user_field_definition(field_def)
@@ -508,6 +486,7 @@ def update_user_field_definition(field_id):
     
     try:
         db.session.commit()
+        invalidate('user_fields')
         return jsonify({
             "message": "字段定义更新成功",
             "field": serialize_user_field_definition(field_def)
@@ -531,6 +510,7 @@ def delete_user_field_definition(field_id):
         # 删除字段定义
         db.session.delete(field_def)
         db.session.commit()
+        invalidate('user_fields')
         
         return jsonify({"message": "字段定义删除成功"})
     except Exception as e:
@@ -647,8 +627,13 @@ def update_user_admin_status(user_id):
         return jsonify({"error": "请求体应包含is_admin字段"}), 400
     
     try:
-        user.is_admin = bool(data['is_admin'])
+        new_status = bool(data['is_admin'])
+        if user.is_admin != new_status:
+            user.is_admin = new_status
+            # 递增令牌版本，携带旧 is_admin 声明的令牌随之失效
+            user.token_version = (user.token_version or 0) + 1
         db.session.commit()
+        invalidate_principal(user.id)
         return jsonify({"message": f"用户{user.username}的管理员状态已更新", "is_admin": user.is_admin})
     except Exception as e:
         db.session.rollback()
@@ -682,14 +667,18 @@ def batch_update_users():
     try:
         if action == 'make_admin':
             # 批量设为管理员
-            affected_rows = User.query.filter(User.id.in_(user_ids)).update({User.is_admin: True}, synchronize_session=False)
+            affected_rows = User.query.filter(User.id.in_(user_ids), User.is_admin != True).update(
+                {User.is_admin: True, User.token_version: User.token_version + 1}, synchronize_session=False)
             db.session.commit()
+            invalidate_principal(*user_ids)
             return jsonify({"message": f"已将{affected_rows}个用户设为管理员", "affected_count": affected_rows})
             
         elif action == 'remove_admin':
             # 批量取消管理员
-            affected_rows = User.query.filter(User.id.in_(user_ids)).update({User.is_admin: False}, synchronize_session=False)
+            affected_rows = User.query.filter(User.id.in_(user_ids), User.is_admin != False).update(
+                {User.is_admin: False, User.token_version: User.token_version + 1}, synchronize_session=False)
             db.session.commit()
+            invalidate_principal(*user_ids)
             return jsonify({"message": f"已取消{affected_rows}个用户的管理员权限", "affected_count": affected_rows})
         else:
             return jsonify({"error": f"不支持的操作: {action}"}), 400
@@ -833,15 +822,12 @@ def delete_my_address(address_id):
 @user_bp.route('/debug', methods=['GET'])
 def debug_info():
     """调试路由，返回请求信息和服务器状态"""
-    import sys
-    
-    # 打印请求头到控制台
-    print(f"[DEBUG] Request Headers:\n{request.headers}", file=sys.stderr)
-    
     # 安全获取请求头
     safe_headers = {}
     for key in request.headers.keys():
-        safe_headers[key] = request.headers.get(key)
+        if key.lower() not in _SENSITIVE_HEADERS:
+            safe_headers[key] = request.headers.get(key)
+    log.debug("debug endpoint", extra={'headers': safe_headers})
     
     # 安全获取请求参数
     safe_args = {}
@@ -890,16 +876,17 @@ def debug_info():
 @user_bp.route('/debug/make-admin/<int:user_id>', methods=['GET'])
 def debug_make_admin(user_id):
     """调试路由：将指定用户设为管理员（仅用于开发测试）"""
-    import sys
-    
     try:
         user = User.query.get(user_id)
         if not user:
             return jsonify({"error": f"用户ID {user_id} 不存在"}), 404
             
         # 设置为管理员
-        user.is_admin = True
+        if not user.is_admin:
+            user.is_admin = True
+            user.token_version = (user.token_version or 0) + 1
         db.session.commit()
+        invalidate_principal(user.id)
         
         return jsonify({
             "success": True,
@@ -908,5 +895,5 @@ def debug_make_admin(user_id):
         })
     except Exception as e:
         db.session.rollback()
-        print(f"[DEBUG] 设置管理员失败: {str(e)}", file=sys.stderr)
+        log.exception("debug make-admin failed", extra={'user_id': user_id})
         return jsonify({"error": f"操作失败: {str(e)}"}), 500 
\ No newline at end of file
@@ -1,35 +1,134 @@
-from flask import jsonify
-from flask_jwt_extended import get_jwt_identity
+from collections import namedtuple
+from flask import jsonify, g
+from flask_jwt_extended import create_access_token, verify_jwt_in_request, get_jwt, get_jwt_identity
 from functools import wraps
-from ..models import User
+import threading
+import time
+
+from models import db, User
+
+# 用户权限缓存有效期（秒）。修改管理员状态的接口会主动失效，
+# 多进程部署时其他 worker 最多在该时间后看到变更（旧令牌最多在该时间后被拒绝）
+PRINCIPAL_CACHE_TTL = 30
+
+# 用户权限信息：是否管理员、当前令牌版本
+Principal = namedtuple('Principal', ['is_admin', 'token_version'])
+
+
+class PrincipalCache:
+    """进程内的用户权限缓存: user_id -> Principal（用户不存在时缓存 None）"""
+
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._data.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def set(self, user_id, principal):
+        with self._lock:
+            self._data[user_id] = (time.monotonic() + self.ttl, principal)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._data.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_principal(*user_ids):
+    """用户管理员状态或令牌版本变更后调用，使缓存的权限立即失效"""
+    principal_cache.invalidate(*user_ids)
+
+
+def get_principal(user_id):
+    """返回用户的 Principal；用户不存在时返回 None。优先读缓存，未命中时只查询两列"""
+    user_id = int(user_id)
+    found, principal = principal_cache.get(user_id)
+    if not found:
+        row = db.session.query(User.is_admin, User.token_version).filter(User.id == user_id).first()
+        principal = Principal(bool(row.is_admin), row.token_version) if row is not None else None
+        principal_cache.set(user_id, principal)
+    return principal
+
+
+def create_user_token(user):
+    """为用户签发访问令牌，附带 is_admin / member_level_id / tv (令牌版本) 声明"""
+    return create_access_token(
+        identity=str(user.id),
+        additional_claims={
+            'is_admin': bool(user.is_admin),
+            'member_level_id': user.member_level_id,
+            'tv': user.token_version or 0,
+        },
+    )
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    """JWTManager.token_in_blocklist_loader 回调：令牌版本与用户当前版本不一致时视为已撤销。
+
+    不带 tv 声明的旧令牌不做版本校验，由 admin_required 回退到数据库判断权限。
+    """
+    token_version = jwt_payload.get('tv')
+    if token_version is None:
+        return False
+    principal = get_principal(jwt_payload['sub'])
+    return principal is None or principal.token_version != token_version
+
+
+def load_current_user_id():
+    """校验并解码当前请求的 JWT，身份保存在 flask.g.current_user_id。
+
+    解码结果由 flask_jwt_extended 保存在 g 中，视图里再调用 get_jwt() / get_jwt_identity() 不会重复解码。
+    """
+    verify_jwt_in_request()
+    g.current_user_id = int(get_jwt_identity())
+    return g.current_user_id
+
 
 def admin_required(fn):
     """
     装饰器函数，用于检查当前请求的用户是否具有管理员权限。
-    
-    对需要管理员权限的路由函数进行装饰，确保只有管理员用户可以访问特定的API端点。
-    
+
+    自行完成 JWT 校验，无需再叠加 @jwt_required()；令牌缺失、过期、无效或已撤销时
+    由 JWTManager 注册的错误回调返回 401/422。令牌带 is_admin 声明时直接信任声明：
+    管理员状态变更会递增 token_version 使旧令牌失效，声明不会与数据库长期不一致。
+
     使用示例:
-    
+
     @app.route('/admin-only', methods=['GET'])
-    @jwt_required()
     @admin_required
     def admin_only_route():
         return jsonify(message="你拥有管理员权限")
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        # 获取当前用户的身份信息（JWT）
-        current_user_id = get_jwt_identity()
-        
-        # 查询用户对象
-        user = User.query.get(current_user_id)
-        
-        # 检查用户是否存在且是管理员
-        if not user or not user.is_admin:
+        user_id = load_current_user_id()
+        claims = get_jwt()
+
+        if 'is_admin' in claims:
+            is_admin = claims['is_admin']
+        else:
+            # 升级前签发的令牌没有声明，回退到查询用户
+            principal = get_principal(user_id)
+            if principal is None:
+                return jsonify({"error": "用户不存在或令牌无效"}), 401
+            is_admin = principal.is_admin
+
+        if not is_admin:
             return jsonify({"error": "此操作需要管理员权限"}), 403
-            
-        # 如果是管理员，继续执行原函数
+
         return fn(*args, **kwargs)
-    
-    return wrapper 
\ No newline at end of file
+
+    return wrapper
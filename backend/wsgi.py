@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产 WSGI 入口
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+按 APP_CONFIG（默认 production）创建应用；生产配置要求设置 JWT_SECRET_KEY。
+gunicorn.conf.py 开启 preload 时本模块只在 master 中导入一次，worker 通过 fork 共享已导入的代码与路由。
+"""
+
+from app import create_app
+
+app = create_app()